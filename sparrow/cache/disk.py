@@ -0,0 +1,113 @@
+from typing import Optional
+import threading
+import tempfile
+import hashlib
+import os
+
+from sparrow.cache.interface import ICache
+from sparrow.cache.models import CacheStats
+from sparrow.machine import system
+from sparrow.logger import logger
+
+
+class DiskCache(ICache):
+    '''
+        A cache of files under cache_dir that is shared by every process using the directory.
+        Entries are written atomically and their mtime is bumped on every read, so once the directory grows past
+        max_bytes the least recently used entries are removed first
+    '''
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # Measured on the first write
+        self._hits = self._misses = self._writes = self._evictions = 0
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return system.join_paths(self.cache_dir, digest[:2], digest)
+
+    def _entries(self):
+        '''Yield (path, stat) for every entry in the cache directory'''
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    ## Removed by another process
+                    continue
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return value
+
+    def set(self, key: str, value: bytes):
+        path = self._path(key)
+        system.create_dir(system.get_parent_dir(path))
+        ## Write next to the entry and rename it into place so readers never see a partial entry
+        fd, staging = tempfile.mkstemp(dir=system.get_parent_dir(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(value)
+
+        with self._lock:
+            ## An overwritten entry no longer takes up its old size
+            previous = self._fileSize(path)
+            os.replace(staging, path)
+            self._writes += 1
+            if self._size is None:
+                self._size = sum(stat.st_size for _, stat in self._entries())
+            else:
+                self._size += len(value) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _fileSize(self, path: str) -> int:
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def delete(self, key: str):
+        path = self._path(key)
+        with self._lock:
+            size = self._fileSize(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _evict(self):
+        '''Remove the least recently used entries until the cache is back under max_bytes. Called with the lock held'''
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        size = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._evictions += 1
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+        logger.debug(f"Evicted cache entries in {self.cache_dir} down to {size} bytes")
+        self._size = size
+
+    def stats(self) -> CacheStats:
+        entries = list(self._entries())
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._writes, self._evictions, len(entries), sum(stat.st_size for _, stat in entries))
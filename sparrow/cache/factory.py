@@ -0,0 +1,13 @@
+from sparrow.cache.interface import ICache
+from sparrow.cache.memory import MemoryCache
+from sparrow.cache.disk import DiskCache
+
+
+def CacheFactory(backend: str, directory: str, max_bytes: int) -> ICache:
+    match backend.lower():
+        case "disk":
+            return DiskCache(cache_dir=directory, max_bytes=max_bytes)
+        case "memory":
+            return MemoryCache(max_bytes=max_bytes)
+        case _:
+            raise ValueError(f"Invalid cache backend: {backend}")
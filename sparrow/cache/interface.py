@@ -0,0 +1,24 @@
+from abc import abstractmethod
+from typing import Optional
+
+from sparrow.cache.models import CacheStats
+
+
+class ICache:
+    '''A bounded key/value store of byte strings'''
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def stats(self) -> CacheStats:
+        ...
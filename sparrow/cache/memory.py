@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from typing import Optional
+import threading
+
+from sparrow.cache.interface import ICache
+from sparrow.cache.models import CacheStats
+
+
+class MemoryCache(ICache):
+    '''An in-process cache that evicts the least recently used entries once it holds more than max_bytes'''
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._size = 0
+        self._hits = self._misses = self._writes = self._evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._size += len(value)
+            self._writes += 1
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._writes, self._evictions, len(self._entries), self._size)
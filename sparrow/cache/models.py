@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    writes: int
+    evictions: int
+    entries: int
+    size_bytes: int
@@ -0,0 +1,49 @@
+from sparrow.cache.disk import DiskCache
+import os
+import time
+
+class TestDiskCache():
+
+    def test_get_counts_hits_and_misses(self, tmp_path):
+        cache = DiskCache(cache_dir=str(tmp_path), max_bytes=1024)
+        cache.set('a', b'value')
+
+        assert cache.get('a') == b'value'
+        assert cache.get('b') is None
+        stats = cache.stats()
+        assert (stats.hits, stats.misses, stats.writes, stats.entries) == (1, 1, 1, 1)
+
+    def test_set_evicts_least_recently_used(self, tmp_path):
+        """
+        Test that once the cache is over budget the entries that were read least recently are removed first.
+        """
+        cache = DiskCache(cache_dir=str(tmp_path), max_bytes=25)
+        cache.set('a', b'a' * 10)
+        cache.set('b', b'b' * 10)
+
+        ## Make 'a' the most recently used entry
+        old = time.time() - 60
+        os.utime(cache._path('b'), (old, old))
+        cache.get('a')
+
+        cache.set('c', b'c' * 10)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == b'a' * 10
+        assert cache.get('c') == b'c' * 10
+        assert cache.stats().evictions == 1
+
+    def test_overwrite_does_not_count_the_old_value(self, tmp_path):
+        """
+        Test that overwriting or deleting an entry gives its old size back so the cache does not evict too early.
+        """
+        cache = DiskCache(cache_dir=str(tmp_path), max_bytes=25)
+        cache.set('a', b'a' * 10)
+        for _ in range(5):
+            cache.set('b', b'b' * 10)
+        cache.delete('a')
+        cache.set('c', b'c' * 10)
+
+        assert cache._size == 20
+        assert cache.stats().evictions == 0
+        assert cache.get('b') == b'b' * 10 and cache.get('c') == b'c' * 10
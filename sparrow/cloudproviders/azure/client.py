@@ -3,8 +3,10 @@ from azure.identity import DefaultAzureCredential, ClientSecretCredential
 from azure.mgmt.containerservice import ContainerServiceClient
 from sparrow.cloudproviders.decorators import handle_auth_exceptions
 
-from sparrow.settings import AZURE_SUBSCRIPTION_ID
+from sparrow.cloudproviders.cache import KubeConfigCache
+from sparrow.settings import AZURE_SUBSCRIPTION_ID, KUBECONFIG_CACHE_TTL, KUBECONFIG_REFRESH_MARGIN
 from sparrow.logger import logger
+import threading
 import logging
 
 # Turn off noisy azure info logs
@@ -12,9 +14,20 @@ logging.getLogger('azure').setLevel(logging.WARNING)
 
 
 class AzureClient(ICloudProvider):
+    _shared = None
+    _shared_lock = threading.Lock()
+
     def __init__(self):
         self._client = self._authenticate()
 
+    @classmethod
+    def shared(cls) -> 'AzureClient':
+        '''Return a client that is shared by the whole process so the credential and its token cache are reused'''
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
     @handle_auth_exceptions
     def _authenticate(self):
         """Authenticate the client"""
@@ -33,3 +46,9 @@ class AzureClient(ICloudProvider):
 
         return kubeconfig.decode('utf-8')
 
+## Kubeconfigs for every AKS cluster are fetched through the shared client and cached per (resource group, cluster)
+kubeconfig_cache = KubeConfigCache(
+    fetch=lambda resource_group, cluster_name: AzureClient.shared().getKubeConfig(resource_group, cluster_name),
+    max_ttl=KUBECONFIG_CACHE_TTL,
+    refresh_margin=KUBECONFIG_REFRESH_MARGIN
+)
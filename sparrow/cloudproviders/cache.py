@@ -0,0 +1,129 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+import threading
+import base64
+import json
+import time
+import yaml
+
+from sparrow.logger import logger
+
+try:
+    from cryptography import x509
+except ImportError:
+    x509 = None
+
+
+def _jwtExpiry(token: str) -> Optional[float]:
+    '''Return the exp claim of a JWT without verifying it. Returns None for opaque tokens'''
+    parts = token.split('.')
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + '=' * (-len(parts[1]) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload)).get('exp'))
+    except (ValueError, TypeError):
+        return None
+
+def _certificateExpiry(certificate_data: str) -> Optional[float]:
+    '''Return the notAfter time of a base64 encoded PEM client certificate'''
+    if x509 is None:
+        return None
+    try:
+        certificate = x509.load_pem_x509_certificate(base64.b64decode(certificate_data))
+        return certificate.not_valid_after_utc.timestamp()
+    except ValueError:
+        return None
+
+def kubeconfig_expiry(kubeconfig: str) -> Optional[float]:
+    '''Return the earliest expiry (epoch seconds) of the credentials embedded in a kubeconfig, if any can be found'''
+    try:
+        data = yaml.safe_load(kubeconfig) or {}
+    except yaml.YAMLError:
+        return None
+
+    expiries = []
+    for user in data.get('users') or []:
+        credentials = (user or {}).get('user') or {}
+        if token := credentials.get('token'):
+            expiries.append(_jwtExpiry(token))
+        if certificate_data := credentials.get('client-certificate-data'):
+            expiries.append(_certificateExpiry(certificate_data))
+
+    expiries = [expiry for expiry in expiries if expiry is not None]
+    return min(expiries) if expiries else None
+
+
+@dataclass
+class _CachedKubeConfig:
+    kubeconfig: str
+    expires_at: float
+    refreshing: bool = False
+
+
+class KubeConfigCache:
+    '''
+        An in-memory cache of kubeconfigs keyed by (resource group, cluster name).
+        Entries live until the embedded credentials expire (capped at max_ttl) and are refreshed in the
+        background once they come within refresh_margin seconds of expiring.
+    '''
+    def __init__(self, fetch: Callable[[str, str], str], max_ttl: int, refresh_margin: int):
+        self._fetch = fetch
+        self.max_ttl = max_ttl
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], _CachedKubeConfig] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def _getKeyLock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _load(self, key: Tuple[str, str]) -> _CachedKubeConfig:
+        '''Fetch a kubeconfig and store it with an expiry derived from its credentials'''
+        kubeconfig = self._fetch(*key)
+        now = time.time()
+        expires_at = now + self.max_ttl
+        if credential_expiry := kubeconfig_expiry(kubeconfig):
+            expires_at = min(expires_at, credential_expiry)
+
+        entry = _CachedKubeConfig(kubeconfig=kubeconfig, expires_at=expires_at)
+        with self._lock:
+            self._entries[key] = entry
+        logger.debug(f"Cached kubeconfig for {key} for {int(expires_at - now)}s")
+        return entry
+
+    def _refresh(self, key: Tuple[str, str], entry: _CachedKubeConfig):
+        try:
+            with self._getKeyLock(key):
+                self._load(key)
+        except Exception as e:
+            ## Keep serving the current entry until it expires. The next get after that fetches synchronously
+            logger.warning(f"Background refresh of kubeconfig for {key} failed: {e}")
+        finally:
+            entry.refreshing = False
+
+    def get(self, resource_group: str, cluster_name: str) -> str:
+        key = (resource_group, cluster_name)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry.expires_at:
+                ## Refresh ahead of expiry without making the caller wait
+                if now >= entry.expires_at - self.refresh_margin and not entry.refreshing:
+                    entry.refreshing = True
+                    threading.Thread(target=self._refresh, args=(key, entry), name="sparrow-kubeconfig-refresh", daemon=True).start()
+                return entry.kubeconfig
+
+        ## Only one caller per cluster goes to the provider on a miss. The rest wait and reuse its result
+        with self._getKeyLock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry and time.time() < entry.expires_at:
+                return entry.kubeconfig
+            return self._load(key).kubeconfig
+
+    def invalidate(self, resource_group: str, cluster_name: str):
+        with self._lock:
+            self._entries.pop((resource_group, cluster_name), None)
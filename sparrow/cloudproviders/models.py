@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+from typing import Optional
+import os
+
+
+@dataclass(frozen=True)
+class KubeContext:
+    '''
+        The credentials for talking to a single cluster.
+        A context is handed explicitly to every helm invocation instead of being set on the process environment.
+    '''
+    cluster: str
+    kubeconfig: str
+    context: Optional[str] = None
+
+    def env(self) -> dict:
+        '''Return an environment for a subprocess that points helm (and its plugins) at this cluster only'''
+        env = os.environ | {'KUBECONFIG': self.kubeconfig}
+        if self.context:
+            env['HELM_KUBECONTEXT'] = self.context
+        return env
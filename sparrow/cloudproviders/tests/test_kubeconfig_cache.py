@@ -0,0 +1,143 @@
+from sparrow.cloudproviders.cache import KubeConfigCache, kubeconfig_expiry
+import datetime
+import base64
+import json
+import time
+import pytest
+
+
+def make_jwt(claims: dict) -> str:
+    encode = lambda data: base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    return f"{encode({'alg': 'RS256'})}.{encode(claims)}.signature"
+
+def make_kubeconfig(**credentials) -> str:
+    return json.dumps({'apiVersion': 'v1', 'kind': 'Config', 'users': [{'name': 'user', 'user': credentials}]})
+
+def make_certificate(not_after: datetime.datetime) -> str:
+    x509 = pytest.importorskip('cryptography.x509')
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(x509.oid.NameOID.COMMON_NAME, 'sparrow')])
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+        .serial_number(1).not_valid_before(not_after - datetime.timedelta(days=1)).not_valid_after(not_after) \
+        .sign(key, hashes.SHA256())
+    return base64.b64encode(certificate.public_bytes(serialization.Encoding.PEM)).decode()
+
+
+class Clock():
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestKubeConfigExpiry():
+
+    def test_jwt_expiry(self):
+        """The exp claim of a token is its expiry"""
+        assert kubeconfig_expiry(make_kubeconfig(token=make_jwt({'exp': 1700000000}))) == 1700000000
+
+    def test_certificate_expiry(self):
+        """The notAfter time of a client certificate is its expiry"""
+        not_after = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+        kubeconfig = make_kubeconfig(**{'client-certificate-data': make_certificate(not_after)})
+
+        assert kubeconfig_expiry(kubeconfig) == not_after.timestamp()
+
+    def test_earliest_expiry_wins(self):
+        """With several credentials the first one to expire bounds the kubeconfig"""
+        not_after = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+        kubeconfig = make_kubeconfig(token=make_jwt({'exp': 1700000000}), **{'client-certificate-data': make_certificate(not_after)})
+
+        assert kubeconfig_expiry(kubeconfig) == 1700000000
+
+    def test_non_expiring_credentials(self):
+        """Opaque tokens and JWTs without an exp claim have no known expiry"""
+        assert kubeconfig_expiry(make_kubeconfig(token='opaque-token')) is None
+        assert kubeconfig_expiry(make_kubeconfig(token=make_jwt({'sub': 'sparrow'}))) is None
+        assert kubeconfig_expiry(make_kubeconfig(username='admin', password='secret')) is None
+
+    def test_unparsable_kubeconfig(self):
+        """Broken kubeconfigs and credentials have no known expiry instead of raising"""
+        assert kubeconfig_expiry('users: [') is None
+        assert kubeconfig_expiry('') is None
+        assert kubeconfig_expiry(make_kubeconfig(token='a.!!!.c')) is None
+        assert kubeconfig_expiry(make_kubeconfig(**{'client-certificate-data': 'not a certificate'})) is None
+
+
+class TestKubeConfigCache():
+
+    @pytest.fixture
+    def clock(self, monkeypatch) -> Clock:
+        clock = Clock(1000.0)
+        monkeypatch.setattr('sparrow.cloudproviders.cache.time.time', clock)
+        return clock
+
+    def test_entries_expire_with_their_credentials(self, clock):
+        """A kubeconfig is reused until its token expires and fetched again afterwards"""
+        fetches = []
+        kubeconfig = make_kubeconfig(token=make_jwt({'exp': 1100}))
+        cache = KubeConfigCache(lambda group, name: fetches.append((group, name)) or kubeconfig, max_ttl=3600, refresh_margin=0)
+
+        assert cache.get('rg', 'aks') == kubeconfig
+        clock.now = 1099
+        cache.get('rg', 'aks')
+        assert fetches == [('rg', 'aks')]
+
+        clock.now = 1100
+        cache.get('rg', 'aks')
+        assert fetches == [('rg', 'aks')] * 2
+
+    def test_non_expiring_entries_live_for_max_ttl(self, clock):
+        """Without a known expiry an entry is kept for max_ttl"""
+        fetches = []
+        cache = KubeConfigCache(lambda group, name: fetches.append(name) or make_kubeconfig(token='opaque'), max_ttl=60, refresh_margin=0)
+
+        cache.get('rg', 'aks')
+        clock.now = 1059
+        cache.get('rg', 'aks')
+        assert len(fetches) == 1
+
+        clock.now = 1060
+        cache.get('rg', 'aks')
+        assert len(fetches) == 2
+
+    def test_unparsable_entries_live_for_max_ttl(self, clock):
+        """A kubeconfig that cannot be parsed is still cached, for max_ttl"""
+        fetches = []
+        cache = KubeConfigCache(lambda group, name: fetches.append(name) or 'users: [', max_ttl=60, refresh_margin=0)
+
+        assert cache.get('rg', 'aks') == 'users: ['
+        clock.now = 1059
+        cache.get('rg', 'aks')
+        assert len(fetches) == 1
+
+    def test_invalidate(self, clock):
+        """An invalidated entry is fetched again on the next get"""
+        fetches = []
+        cache = KubeConfigCache(lambda group, name: fetches.append(name) or make_kubeconfig(token='opaque'), max_ttl=60, refresh_margin=0)
+
+        cache.get('rg', 'aks')
+        cache.invalidate('rg', 'aks')
+        cache.get('rg', 'aks')
+
+        assert fetches == ['aks', 'aks']
+
+    def test_refreshes_ahead_of_expiry(self, clock):
+        """An entry close to expiring is served while a fresh one is fetched in the background"""
+        first, second = make_kubeconfig(token=make_jwt({'exp': 1100})), make_kubeconfig(token=make_jwt({'exp': 2000}))
+        pending = [first, second]
+        cache = KubeConfigCache(lambda group, name: pending.pop(0), max_ttl=3600, refresh_margin=30)
+
+        cache.get('rg', 'aks')
+        clock.now = 1080
+        assert cache.get('rg', 'aks') == first
+
+        deadline = time.monotonic() + 5
+        while cache._entries[('rg', 'aks')].expires_at != 2000 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert cache.get('rg', 'aks') == second
+        assert pending == []
@@ -0,0 +1,37 @@
+from typing import Optional
+import hashlib
+import re
+
+from sparrow.cache.interface import ICache
+
+
+class ArtifactStore:
+    '''
+        Full outputs that were too large to post in a comment, served by the server's artifacts endpoint.
+        Artifacts are addressed by the digest of their content, so storing the same output again rewrites the same entry
+        and makes it the most recently used
+    '''
+    _ID = re.compile(r'^[0-9a-f]{64}$')
+
+    def __init__(self, backend: ICache, base_url: str):
+        ## Links in comments are resolved by the VCS against its own host, so they must be absolute
+        if not re.match(r'^https?://', base_url):
+            raise ValueError(f"Artifacts need the absolute URL Sparrow is reachable at, got: '{base_url}'")
+        self.backend = backend
+        self.base_url = base_url.rstrip('/')
+
+    def _key(self, artifact_id: str) -> str:
+        return f"artifact/{artifact_id}"
+
+    def store(self, content: str) -> str:
+        '''Store the content and return the URL it can be downloaded from'''
+        data = content.encode()
+        artifact_id = hashlib.sha256(data).hexdigest()
+        ## Always write through: the backend may have evicted an artifact stored earlier
+        self.backend.set(self._key(artifact_id), data)
+        return f"{self.base_url}/artifacts/{artifact_id}"
+
+    def load(self, artifact_id: str) -> Optional[bytes]:
+        if not ArtifactStore._ID.match(artifact_id):
+            return None
+        return self.backend.get(self._key(artifact_id))
@@ -0,0 +1,101 @@
+from typing import Callable, List, Optional
+import threading
+import time
+
+from sparrow.receivers.events import PullRequestEvent
+from sparrow.vcs.interface import IVersionControlSystem
+from sparrow.telemetry import metrics
+from sparrow.logger import logger
+
+
+class ProgressiveComment:
+    '''
+        A summary on a merge request that is edited in place as results come in.
+        render turns the results into one or more comments. The notes are created on the first publish (and when the summary
+        grows into more comments). Later changes are sent from a background timer at most once every min_interval seconds,
+        always with the latest results, so bursts of results cost a single round of API calls
+    '''
+    UNUSED = "_This part of the summary is no longer needed._"
+
+    def __init__(self, vcs: IVersionControlSystem, event: PullRequestEvent, render: Callable[[List[dict]], List[str]], min_interval: float):
+        self.vcs = vcs
+        self.event = event
+        self.render = render
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._results: List[dict] = []
+        self._timer: Optional[threading.Timer] = None
+        self._note_ids: List[Optional[int]] = []
+        self._last_sent = 0.0
+        self._finished = False
+        self._started = time.monotonic()
+        self._first_result = True
+
+    def publish(self, results: List[dict]):
+        '''Replace every result (e.g. with the list of pending targets) and schedule an update'''
+        with self._lock:
+            self._results = list(results)
+            self._schedule()
+
+    def update(self, index: int, result: dict):
+        '''Record a finished result and schedule an update'''
+        with self._lock:
+            if self._first_result:
+                self._first_result = False
+                metrics.observe('time_to_first_result_seconds', time.monotonic() - self._started)
+            self._results[index] = result
+            self._schedule()
+
+    def _schedule(self):
+        '''Start the timer that sends the next update unless one is already waiting. Called with the lock held'''
+        if self._timer or self._finished:
+            return
+        delay = max(0.0, self._last_sent + self.min_interval - time.monotonic())
+        self._timer = threading.Timer(delay, self._flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            self._timer = None
+            pages = self.render(self._results)
+        self._send(pages, final=False)
+
+    def _sendPage(self, index: int, page: str, final: bool):
+        if index >= len(self._note_ids):
+            self._note_ids.append(None)
+        note_id = self._note_ids[index]
+        if note_id is None:
+            self._note_ids[index] = self.vcs.postComment(self.event, page)
+        elif not self.vcs.updateComment(self.event, note_id, page) and final:
+            ## The note may have been deleted. Make sure the final results are seen
+            self._note_ids[index] = self.vcs.postComment(self.event, page)
+
+    def _send(self, pages: List[str], final: bool):
+        with self._send_lock:
+            ## An update that lost the race with finish must not overwrite the final body
+            if self._finished and not final:
+                return
+            try:
+                for index, page in enumerate(pages):
+                    self._sendPage(index, page, final)
+                ## Blank the notes of parts the summary shrank out of
+                for note_id in self._note_ids[len(pages):]:
+                    if note_id is not None:
+                        self.vcs.updateComment(self.event, note_id, ProgressiveComment.UNUSED)
+            except Exception as e:
+                if final:
+                    raise
+                logger.warning(f"Could not update the summary comment: {e}")
+            self._last_sent = time.monotonic()
+
+    def finish(self, body: Optional[str] = None):
+        '''Cancel pending updates and send the final comments (the rendered results unless body is given) right away'''
+        with self._lock:
+            self._finished = True
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            pages = [body] if body is not None else self.render(self._results)
+        self._send(pages, final=True)
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+import hashlib
+import io
+
+from sparrow.comments.artifacts import ArtifactStore
+from sparrow.release_managers.helm.diffparse import DiffSummary
+
+DIFF_EPILOGUE = (
+    "* ⏩ To **apply all diffs** from this pull request, comment:\n  * `sparrow apply`\n"
+    "* ⏩ To **apply specific diffs** from this pull request, comment:\n  * `sparrow apply -f <chart>@<environment>`\n\n"
+)
+
+## Room kept on every page for the part header
+_PAGE_HEADER_BYTES = 64
+## Resources listed above the output of a section. The rest are only counted
+_MAX_RESOURCES = 20
+## Results named in the title of a section shared by results with the same output
+_MAX_TITLES = 10
+
+
+def _size(text: str) -> int:
+    return len(text.encode())
+
+
+def _truncate(text: str, max_bytes: int) -> str:
+    '''Cut text to at most max_bytes of utf-8, at the last full line that fits'''
+    cut = text.encode()[:max(0, max_bytes)].decode(errors='ignore')
+    return cut[:cut.rfind('\n')] if '\n' in cut else cut
+
+
+class CommentRenderer:
+    '''
+        Render a summary of chart/environment results into one or more comments of at most max_bytes (utf-8) each.
+        Results without output_key are still running and are only listed. Finished results get a collapsible section
+        with their output, and results with byte-identical output share one section. Comments are split between sections,
+        and the output of a section that cannot fit in a comment on its own is truncated and stored in full in the artifact store.
+        With summarize, the comment starts with a table of the changes in every result and each section lists its resources
+    '''
+    def __init__(self, verb: str, output_key: str, summary: str, max_bytes: int, epilogue: Optional[str] = None, artifacts: Optional[ArtifactStore] = None,
+                 summarize: Optional[Callable[[str], DiffSummary]] = None):
+        self.verb = verb
+        self.output_key = output_key
+        self.summary = summary
+        self.max_bytes = max_bytes
+        self.epilogue = f"\n\n---\n{epilogue}" if epilogue else ""
+        self.artifacts = artifacts
+        self.summarize = summarize
+
+    def _summaryOf(self, result: dict) -> Optional[DiffSummary]:
+        output = result.get(self.output_key)
+        return self.summarize(output) if self.summarize and isinstance(output, str) else None
+
+    def _groups(self, results: List[dict]) -> List[List[int]]:
+        '''The indexes of the finished results grouped by identical output, in the order each output first appears'''
+        groups: OrderedDict = OrderedDict()
+        for index, result in enumerate(results):
+            if self.output_key in result:
+                digest = hashlib.sha256(f"{result.get(self.output_key)}".encode()).digest()
+                groups.setdefault(digest, []).append(index)
+        return list(groups.values())
+
+    def _prologue(self, results: List[dict]) -> Tuple[str, str, List[str]]:
+        '''Return the title, the header of the table (if any) and one line per result'''
+        done = sum(1 for result in results if self.output_key in result)
+        if done < len(results):
+            title = f"Running {self.verb} for {len(results)} charts ({done}/{len(results)} done):\n"
+        else:
+            title = f"Ran {self.verb} for {len(results)} charts:\n"
+        table = "\n| # | Chart | Environment | Resources | Added | Removed | Changed |\n|---|---|---|---|---|---|---|\n" if self.summarize else ""
+
+        lines = []
+        for index, result in enumerate(results):
+            if not self.summarize:
+                status = "" if self.output_key in result else " ⏳"
+                lines.append(f"{index+1}. `{result.get('chart')}` environment: `{result.get('env')}`{status}\n")
+            elif self.output_key not in result:
+                lines.append(f"| {index+1} | `{result.get('chart')}` | `{result.get('env')}` | ⏳ | | | |\n")
+            elif summary := self._summaryOf(result):
+                lines.append(f"| {index+1} | `{result.get('chart')}` | `{result.get('env')}` | {len(summary.resources)} | +{summary.added} | -{summary.removed} | ~{summary.changed} |\n")
+            else:
+                lines.append(f"| {index+1} | `{result.get('chart')}` | `{result.get('env')}` | - | | | |\n")
+        return title, table, lines
+
+    def _resources(self, summary: DiffSummary) -> str:
+        buffer = io.StringIO()
+        for resource in summary.resources[:_MAX_RESOURCES]:
+            location = f"{resource.namespace}/{resource.name}" if resource.namespace else resource.name
+            buffer.write(f"- `{resource.kind}` `{location}` {resource.action} (+{resource.added} -{resource.removed} ~{resource.changed})\n")
+        if len(summary.resources) > _MAX_RESOURCES:
+            buffer.write(f"- and {len(summary.resources) - _MAX_RESOURCES} more resources\n")
+        buffer.write("\n")
+        return buffer.getvalue()
+
+    def _section(self, results: List[dict], group: List[int], budget: int) -> str:
+        '''Render the section shared by a group of finished results with the same output in at most budget bytes'''
+        result = results[group[0]]
+        output = f"{result.get(self.output_key)}"
+        title = ", ".join(f"{index+1}. `{results[index].get('chart')}` environment: `{results[index].get('env')}`" for index in group[:_MAX_TITLES])
+        if len(group) > _MAX_TITLES:
+            title += f" and {len(group) - _MAX_TITLES} more with the same output"
+        summary = self._summaryOf(result)
+        resources = self._resources(summary) if summary and summary.resources else ""
+        header = f"## {title}\n{resources}<details><summary>{self.summary}</summary>\n\n```\n"
+        footer = "\n```\n\n</details>\n\n"
+
+        section = f"{header}{output}{footer}"
+        if _size(section) <= budget:
+            return section
+
+        link = f"[Download the full output]({self.artifacts.store(output)})" if self.artifacts else "The full output is not available."
+        note = f"⚠️ The output ({_size(output)} bytes) was too large for a comment and was truncated. {link}\n\n"
+        shown = _truncate(output, budget - _size(header) - _size(footer) - _size(note))
+        return f"{header}{shown}\n```\n\n{note}</details>\n\n"
+
+    def render(self, results: List[dict]) -> List[str]:
+        '''Return the comments to post, in order'''
+        ## Everything on a page must fit next to the part header and the epilogue
+        budget = self.max_bytes - _PAGE_HEADER_BYTES - _size(self.epilogue)
+        pages: List[io.StringIO] = [io.StringIO()]
+        used = 0
+
+        def add(text: str, continuation: str = ""):
+            '''Write text to the current page, or to a new one (starting with continuation) if it does not fit'''
+            nonlocal used
+            if used + _size(text) > budget and used > 0:
+                pages.append(io.StringIO())
+                pages[-1].write(continuation)
+                used = _size(continuation)
+            pages[-1].write(text)
+            used += _size(text)
+
+        ## The list of results is split over pages too, repeating the table header on every page it continues on
+        title, table, lines = self._prologue(results)
+        add(title + table)
+        for line in lines:
+            if _size(line) > budget - _size(table):
+                line = _truncate(line[:-1], budget - _size(table) - 1) + "\n"
+            add(line, continuation=table)
+        add("\n\n")
+
+        for group in self._groups(results):
+            add(self._section(results, group, budget))
+        pages[-1].write(self.epilogue)
+
+        if len(pages) == 1:
+            return [pages[0].getvalue()]
+        return [f"**Part {number} of {len(pages)}**\n\n{page.getvalue()}" for number, page in enumerate(pages, start=1)]
@@ -0,0 +1,165 @@
+import pytest
+from sparrow.comments.publisher import ProgressiveComment
+from sparrow.comments.render import CommentRenderer, DIFF_EPILOGUE
+from sparrow.comments.artifacts import ArtifactStore
+from sparrow.cache.memory import MemoryCache
+from sparrow.release_managers.helm.diffparse import summarize_diff
+from sparrow.telemetry import metrics
+import threading
+import time
+
+class FakeVCS():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.posted = []
+        self.updated = []
+
+    def postComment(self, event, comment):
+        with self.lock:
+            self.posted.append(comment)
+            return 41 + len(self.posted)
+
+    def updateComment(self, event, note_id, comment):
+        with self.lock:
+            self.updated.append((note_id, comment))
+            return True
+
+class TestProgressiveComment():
+
+    def test_edits_one_note_and_coalesces_updates(self):
+        """
+        Test that one note is created and that results arriving within the update interval cost a single edit.
+        """
+        vcs = FakeVCS()
+        summary = ProgressiveComment(vcs, event=None, render=lambda results: ['|'.join(results)], min_interval=0.2)
+
+        summary.publish(['pending', 'pending', 'pending'])
+        time.sleep(0.05)
+        with metrics.job_metrics() as job_metrics:
+            for index in range(3):
+                summary.update(index, 'done')
+        time.sleep(0.35)
+        summary.finish()
+
+        assert vcs.posted == ['pending|pending|pending']
+        assert vcs.updated == [(42, 'done|done|done'), (42, 'done|done|done')]
+        assert 'time_to_first_result_seconds' in job_metrics.snapshot()
+
+    def test_finish_before_first_update_posts_final_body(self):
+        vcs = FakeVCS()
+        summary = ProgressiveComment(vcs, event=None, render=lambda results: ['|'.join(results)], min_interval=10)
+
+        summary.publish(['pending'])
+        summary.finish('final')
+        time.sleep(0.05)
+
+        ## Whether or not the first update got out, exactly one note ends up with the final body
+        assert len(vcs.posted) == 1
+        assert (vcs.updated[-1][1] if vcs.updated else vcs.posted[0]) == 'final'
+
+    def test_grows_and_shrinks_over_several_notes(self):
+        vcs = FakeVCS()
+        summary = ProgressiveComment(vcs, event=None, render=lambda results: list(results), min_interval=10)
+
+        summary.publish(['a', 'b'])
+        summary.finish()
+        summary.finish('only')
+
+        assert vcs.posted == ['a', 'b']
+        assert vcs.updated == [(42, 'only'), (43, ProgressiveComment.UNUSED)]
+
+class TestRender():
+
+    def renderer(self, max_bytes=1000000, artifacts=None):
+        return CommentRenderer("diff", "diff", "Show Diffs", max_bytes=max_bytes, epilogue=DIFF_EPILOGUE, artifacts=artifacts, summarize=summarize_diff)
+
+    def test_render_diff_comment_marks_pending_targets(self):
+        pages = self.renderer().render([
+            {"chart": "charts/app", "env": "dev", "diff": "+ replicas: 2"},
+            {"chart": "charts/app", "env": "prod"}
+        ])
+
+        assert len(pages) == 1
+        assert pages[0].startswith("Running diff for 2 charts (1/2 done):\n")
+        assert "| 2 | `charts/app` | `prod` | ⏳ | | | |" in pages[0]
+        assert "+ replicas: 2" in pages[0]
+        assert "## 2." not in pages[0]
+
+    def test_render_diff_comment_when_done(self):
+        pages = self.renderer().render([{"chart": "charts/app", "env": "dev", "diff": "+ replicas: 2"}])
+
+        assert pages[0].startswith("Ran diff for 1 charts:\n")
+        assert "| 1 | `charts/app` | `dev` | 0 | +0 | -0 | ~0 |" in pages[0]
+        assert "`sparrow apply`" in pages[0]
+
+    def test_splits_between_charts(self):
+        diffs = ["\n".join([f"+ line {index}"] * 100) for index in range(4)]
+        pages = self.renderer(max_bytes=2000).render([{"chart": f"charts/app{index}", "env": "dev", "diff": diffs[index]} for index in range(4)])
+
+        assert len(pages) > 1
+        assert all(len(page.encode()) <= 2000 for page in pages)
+        assert pages[0].startswith(f"**Part 1 of {len(pages)}**")
+        ## Every chart is shown in full exactly once and only the last page has the epilogue
+        assert sum(page.count("## ") for page in pages) == 4
+        assert all(sum(page.count(diff) for page in pages) == 1 for diff in diffs)
+        assert "`sparrow apply`" in pages[-1] and "`sparrow apply`" not in pages[0]
+
+    def test_truncates_an_output_too_large_for_a_comment(self):
+        artifacts = ArtifactStore(MemoryCache(max_bytes=10 ** 6), base_url="https://sparrow.example.com/")
+        diff = "\n".join(f"+ line {index} é" for index in range(1000))
+        pages = self.renderer(max_bytes=3000, artifacts=artifacts).render([{"chart": "charts/app", "env": "dev", "diff": diff}])
+
+        assert all(len(page.encode()) <= 3000 for page in pages)
+        body = "".join(pages)
+        assert "+ line 0 é" in body and "+ line 999 é" not in body
+        url = next(word for word in body.split("(") if word.startswith("https://"))[:-1].split(")")[0]
+        assert url.startswith("https://sparrow.example.com/artifacts/")
+        assert artifacts.load(url.rsplit("/", 1)[1]) == diff.encode()
+        assert artifacts.load("../etc/passwd") is None
+
+    def test_stores_artifacts_again_after_eviction(self):
+        """
+        Test that an artifact the backend evicted is stored again instead of being linked as if it were still there.
+        """
+        backend = MemoryCache(max_bytes=10 ** 6)
+        artifacts = ArtifactStore(backend, base_url="https://sparrow.example.com")
+        url = artifacts.store("full output")
+        artifact_id = url.rsplit("/", 1)[1]
+
+        backend.delete(f"artifact/{artifact_id}")
+        assert artifacts.store("full output") == url
+
+        assert artifacts.load(artifact_id) == b"full output"
+
+    def test_summarizes_resources_and_collapses_identical_diffs(self):
+        diff = "default, web, Deployment (apps) has changed:\n  kind: Deployment\n-   replicas: 1\n+   replicas: 2\n"
+        pages = self.renderer().render([
+            {"chart": "charts/app", "env": "dev", "diff": diff},
+            {"chart": "charts/app", "env": "staging", "diff": "No changes"},
+            {"chart": "charts/app", "env": "prod", "diff": diff}
+        ])
+
+        assert len(pages) == 1
+        assert "| 3 | `charts/app` | `prod` | 1 | +0 | -0 | ~1 |" in pages[0]
+        assert "## 1. `charts/app` environment: `dev`, 3. `charts/app` environment: `prod`\n- `Deployment` `default/web` has changed (+0 -0 ~1)" in pages[0]
+        assert pages[0].count(diff) == 1
+
+    def test_long_list_of_results_is_split_over_pages(self):
+        """
+        Test that the summary table of many results never makes a page larger than the limit and keeps its header on every page.
+        """
+        results = [{"chart": f"charts/app{index}", "env": "dev"} for index in range(200)]
+        pages = self.renderer(max_bytes=2000).render(results)
+
+        assert len(pages) > 1
+        assert all(len(page.encode()) <= 2000 for page in pages)
+        assert all("| # | Chart |" in page for page in pages)
+        assert sum(page.count("⏳") for page in pages) == 200
+
+    def test_truncated_output_without_artifacts(self):
+        pages = self.renderer(max_bytes=1500).render([{"chart": "charts/app", "env": "dev", "diff": "+ line\n" * 1000}])
+
+        assert "The full output is not available." in pages[-1]
+        assert "](" not in "".join(pages)
+        with pytest.raises(ValueError):
+            ArtifactStore(MemoryCache(max_bytes=10 ** 6), base_url="/sparrow")
@@ -5,15 +5,22 @@ from .vcs.interface import IVersionControlSystem
 from .vcs.factory import VCSProviderFactory
 from .release_managers.interface import IReleaseManager
 from .settings import VCS_BASE_URL, VCS_TOKEN, SPARROW_ROOT_PATH, HELM_VERSION, SPARROW_CLONE_DIR, BINARY_PATH, BASIC_AUTH_ENABLED, BASIC_AUTH_USERNAME, BASIC_AUTH_PASSWORD
+from .settings import SPARROW_KUBECONFIG_DIR, WORKSPACE_MAX_BYTES, WORKSPACE_MAX_CHECKOUTS
+from .settings import LOCK_BACKEND, LOCK_DIR, LOCK_REDIS_URL, LOCK_LEASE
+from .workspace.manager import WorkspaceManager
+from .locking.interface import ILock
+from .locking.factory import LockFactory
 from .release_managers.factory import ReleaseManagerFactory
 from sparrow.machine import system
 
 ## Define the config object that will be used by the controller
 class SparrowConfig:
-    def __init__(self, receiver: IReceiver, vcs: IVersionControlSystem, release_manager: IReleaseManager, server_path_prefix: str):
+    def __init__(self, receiver: IReceiver, vcs: IVersionControlSystem, release_manager: IReleaseManager, workspace: WorkspaceManager, lock: ILock, server_path_prefix: str):
         self.receiver = receiver
         self.vcs = vcs
         self.release_manager = release_manager
+        self.workspace = workspace
+        self.lock = lock
         self.server_path_prefix = server_path_prefix
 
 ## Add the binary path to the global path
@@ -24,6 +31,8 @@ if not system.is_in_path(BINARY_PATH):
 vcs_provider: IVersionControlSystem = VCSProviderFactory(base_url=VCS_BASE_URL, token=VCS_TOKEN, working_dir=SPARROW_CLONE_DIR)
 receiver: IReceiver = ReceiverFactory(base_url=VCS_BASE_URL)
 release_manager = ReleaseManagerFactory(name="helm", version=HELM_VERSION, bin_path=BINARY_PATH)
+workspace = WorkspaceManager(root=SPARROW_CLONE_DIR, max_bytes=WORKSPACE_MAX_BYTES, max_checkouts=WORKSPACE_MAX_CHECKOUTS, sweep_dirs=[SPARROW_KUBECONFIG_DIR], on_evict=vcs_provider.forgetCheckout)
+lock = LockFactory(LOCK_BACKEND, lock_dir=LOCK_DIR, redis_url=LOCK_REDIS_URL, lease=LOCK_LEASE)
 
 ## Inject dependencies
-DefaultConfig = SparrowConfig(receiver, vcs_provider, release_manager, SPARROW_ROOT_PATH)
\ No newline at end of file
+DefaultConfig = SparrowConfig(receiver, vcs_provider, release_manager, workspace, lock, SPARROW_ROOT_PATH)
\ No newline at end of file
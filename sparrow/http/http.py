@@ -1,21 +1,121 @@
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from sparrow.http.interface import IHTTPClient
+from sparrow.logger import logger
+from sparrow.settings import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES, HTTP_BACKOFF, HTTP_MAX_BACKOFF, HTTP_MAX_RETRY_AFTER
+import threading
 import requests
+import random
+import time
 
-class AuthenticatedHTTPClient:
+class AuthenticatedHTTPClient(IHTTPClient):
     '''
-        A class that provides an interface for making authenticated requests and handling errors
+        A class that provides an interface for making authenticated requests and handling errors.
+        Requests share a keep-alive connection pool and are retried with jittered exponential backoff on 429/5xx,
+        honouring the Retry-After and RateLimit-* headers sent by the server. A request the server asks to wait for
+        longer than max_retry_after is not retried
     '''
-    def __init__(self, auth_header: str, auth_token: str, base_url: str):
+    ## Methods that may be sent again without changing the outcome
+    IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, auth_header: str, auth_token: str, base_url: str, pool_size: int = HTTP_POOL_SIZE, timeout: tuple = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                 max_retries: int = HTTP_MAX_RETRIES, backoff: float = HTTP_BACKOFF, max_backoff: float = HTTP_MAX_BACKOFF,
+                 max_retry_after: float = HTTP_MAX_RETRY_AFTER):
         self.auth_header = auth_header
         self.auth_token = auth_token
         self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
         self._headers = {
             auth_header: auth_token
         }
 
-    def post(self, path: str, headers: dict = {}, body: dict = {}):
+        ## Reuse TCP+TLS connections across requests and worker threads
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        ## Set when the server reports the rate limit is used up so later requests wait for the reset
+        self._lock = threading.Lock()
+        self._not_before = 0.0
+
+    def _retryAfter(self, resp: requests.Response) -> float | None:
+        '''Return how long the server asked us to wait (seconds) if it said so'''
+        if retry_after := resp.headers.get('Retry-After'):
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+
+        if resp.headers.get('RateLimit-Remaining') == '0' and (reset := resp.headers.get('RateLimit-Reset')):
+            try:
+                return max(0.0, float(reset) - time.time())
+            except ValueError:
+                pass
+        return None
+
+    def _backoffDelay(self, attempt: int) -> float:
+        '''Full jitter exponential backoff'''
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _waitForRateLimit(self):
+        with self._lock:
+            delay = self._not_before - time.time()
+        if delay > 0:
+            logger.info(f"Rate limit reached. Waiting {delay:.1f}s before the next request")
+            time.sleep(delay)
+
+    def _request(self, method: str, path: str, headers: dict, body: dict) -> requests.Response:
+        url = f"{self.base_url}{path}"
         merged_headers = self._headers | headers
-        return requests.post(url=f"{self.base_url}{path}", headers=merged_headers, data=body)
+        ## A 429 means the request was not processed so it is safe to send again whatever the method
+        retry_errors = method in AuthenticatedHTTPClient.IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            self._waitForRateLimit()
+            try:
+                resp = self._session.request(method, url, headers=merged_headers, data=body, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not retry_errors or attempt >= self.max_retries:
+                    raise
+                delay = self._backoffDelay(attempt)
+                logger.warning(f"{method} {path} failed: {e}. Retrying in {delay:.1f}s")
+            else:
+                retry_after = self._retryAfter(resp)
+                if resp.headers.get('RateLimit-Remaining') == '0' and retry_after:
+                    with self._lock:
+                        self._not_before = max(self._not_before, time.time() + min(retry_after, self.max_retry_after))
+
+                retryable = resp.status_code == 429 or (retry_errors and resp.status_code in AuthenticatedHTTPClient.RETRY_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    return resp
+                if retry_after is None:
+                    delay = self._backoffDelay(attempt)
+                elif retry_after > self.max_retry_after:
+                    ## Retrying any sooner than the server allows is bound to fail again
+                    logger.warning(f"{method} {path} returned {resp.status_code} and asked to wait {retry_after:.1f}s. Giving up")
+                    return resp
+                else:
+                    delay = retry_after
+                logger.warning(f"{method} {path} returned {resp.status_code}. Retrying in {delay:.1f}s")
+
+            attempt += 1
+            time.sleep(delay)
+
+    def post(self, path: str, headers: dict = {}, body: dict = {}):
+        return self._request('POST', path, headers, body)
 
     def get(self, path: str, headers: dict = {}, body: dict = {}):
-        merged_headers = self._headers | headers
-        return requests.get(url=f"{self.base_url}{path}", headers=merged_headers, data=body)
+        return self._request('GET', path, headers, body)
+
+    def put(self, path: str, headers: dict = {}, body: dict = {}):
+        return self._request('PUT', path, headers, body)
@@ -5,8 +5,11 @@ class IHTTPClient:
     def __init__(self, auth_header :str , auth_token: str, base_url: str):
         ...
 
-    def post(self, headers: str, body: str):
+    def post(self, path: str, headers: dict = {}, body: dict = {}):
         ...
 
-    def get(self, headers: str, body: str):
-        ...
\ No newline at end of file
+    def get(self, path: str, headers: dict = {}, body: dict = {}):
+        ...
+
+    def put(self, path: str, headers: dict = {}, body: dict = {}):
+        ...
@@ -0,0 +1,107 @@
+from requests.adapters import HTTPAdapter
+from sparrow.http.http import AuthenticatedHTTPClient
+import requests
+import pytest
+
+
+class FakeAdapter(HTTPAdapter):
+    '''Answers requests with the given responses (status code, headers) or exceptions, in order'''
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        status, headers = response
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers.update(headers)
+        resp.request = request
+        resp.url = request.url
+        resp._content = b''
+        return resp
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('sparrow.http.http.time.sleep', sleeps.append)
+    ## Always back off for the longest delay allowed
+    monkeypatch.setattr('sparrow.http.http.random.uniform', lambda low, high: high)
+    return sleeps
+
+
+def make_client(responses, **kwargs) -> tuple[AuthenticatedHTTPClient, FakeAdapter]:
+    client = AuthenticatedHTTPClient('PRIVATE-TOKEN', 'token', 'https://gitlab.example.com', backoff=1, max_backoff=4, **kwargs)
+    adapter = FakeAdapter(responses)
+    client._session.mount('https://', adapter)
+    return client, adapter
+
+
+class TestAuthenticatedHTTPClient():
+
+    def test_retries_server_errors_with_exponential_backoff(self, sleeps):
+        """Idempotent requests are retried on 5xx with a growing delay capped at max_backoff"""
+        client, adapter = make_client([(503, {}), (502, {}), (500, {}), (500, {}), (200, {})])
+
+        resp = client.get('/projects')
+
+        assert resp.status_code == 200
+        assert len(adapter.requests) == 5
+        assert sleeps == [1, 2, 4, 4]
+        assert adapter.requests[0].headers['PRIVATE-TOKEN'] == 'token'
+
+    def test_gives_up_after_max_retries(self, sleeps):
+        """The last response is returned once the retries are used up"""
+        client, adapter = make_client([(500, {})] * 3, max_retries=2)
+
+        assert client.get('/projects').status_code == 500
+        assert len(adapter.requests) == 3
+
+    def test_does_not_retry_non_idempotent_requests_on_server_errors(self, sleeps):
+        """A POST may have been processed before the 5xx so it is not sent again"""
+        client, adapter = make_client([(502, {})])
+
+        assert client.post('/notes').status_code == 502
+        assert len(adapter.requests) == 1
+        assert sleeps == []
+
+    def test_retries_connection_errors(self, sleeps):
+        """Connection errors are retried for idempotent requests and raised for the others"""
+        client, adapter = make_client([requests.ConnectionError('reset'), (200, {})])
+        assert client.get('/projects').status_code == 200
+        assert sleeps == [1]
+
+        client, adapter = make_client([requests.ConnectionError('reset')])
+        with pytest.raises(requests.ConnectionError):
+            client.post('/notes')
+
+    def test_honours_retry_after(self, sleeps):
+        """A 429 is retried (even for a POST) after the delay the server asked for, not the backoff limit"""
+        client, adapter = make_client([(429, {'Retry-After': '20'}), (201, {})])
+
+        assert client.post('/notes').status_code == 201
+        assert sleeps == [20.0]
+
+    def test_gives_up_when_retry_after_is_too_long(self, sleeps):
+        """A request the server asks to wait for longer than max_retry_after is not retried early"""
+        client, adapter = make_client([(429, {'Retry-After': '600'}), (200, {})], max_retry_after=300)
+
+        assert client.get('/projects').status_code == 429
+        assert len(adapter.requests) == 1
+        assert sleeps == []
+
+    def test_rate_limit_delays_later_requests(self, sleeps, monkeypatch):
+        """An exhausted rate limit makes the next request wait for the reset"""
+        monkeypatch.setattr('sparrow.http.http.time.time', lambda: 1000.0)
+        client, adapter = make_client([(200, {'RateLimit-Remaining': '0', 'RateLimit-Reset': '1060'}), (200, {})])
+
+        client.get('/projects')
+        assert sleeps == []
+        client.get('/projects')
+
+        assert sleeps == [60.0]
@@ -0,0 +1,84 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional, Set
+import contextvars
+import subprocess
+import threading
+
+from sparrow.jobs.exceptions import JobCancelledError
+from sparrow.logger import logger
+
+
+class CancellationToken:
+    '''
+        Cancels a job. Subprocesses the job registers with the token are terminated as soon as it is cancelled,
+        and the job stops at its next check
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes: Set[subprocess.Popen] = set()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.reason = reason
+            processes = list(self._processes)
+        for process in processes:
+            logger.info(f"Terminating process {process.pid}: {reason}")
+            process.terminate()
+
+    def raiseIfCancelled(self):
+        if self.cancelled:
+            raise JobCancelledError(self.reason)
+
+    def _track(self, process: subprocess.Popen):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self.cancelled
+        if cancelled:
+            process.terminate()
+
+    def _untrack(self, process: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(process)
+
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar('sparrow_cancellation_token', default=None)
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    '''Make token the cancellation token of the code (and fan out threads) run inside the context'''
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+def raise_if_cancelled():
+    '''Raise JobCancelledError if the job running in the current context was cancelled'''
+    if token := _current_token.get():
+        token.raiseIfCancelled()
+
+@contextmanager
+def tracked(process: subprocess.Popen) -> Iterator[subprocess.Popen]:
+    '''
+    Terminate the process if the current job is cancelled while it runs.
+    Raises JobCancelledError on exit when the job was cancelled
+    '''
+    token: Optional[CancellationToken] = _current_token.get()
+    if token is None:
+        yield process
+        return
+
+    token._track(process)
+    try:
+        yield process
+    finally:
+        token._untrack(process)
+    token.raiseIfCancelled()
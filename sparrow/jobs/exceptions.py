@@ -0,0 +1,15 @@
+
+
+class QueueFullError(Exception):
+    def __init__(self, depth: int):
+        self.depth = depth
+
+    def __str__(self):
+        return f"Job queue is full ({self.depth} jobs waiting)"
+
+class JobCancelledError(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+
+    def __str__(self):
+        return f"Job was cancelled: {self.reason}"
@@ -0,0 +1,50 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+
+class FanOut:
+    '''
+        Run a function over a list of targets on a thread pool.
+        Targets sharing a key (e.g. a cluster) are limited to a fixed number of concurrent calls across
+        every job in the process, and results are returned in target order regardless of completion order.
+    '''
+    def __init__(self, workers: int, per_key_limit: int):
+        self.workers = workers
+        self.per_key_limit = per_key_limit
+        self._lock = threading.Lock()
+        self._semaphores: Dict[Hashable, threading.BoundedSemaphore] = {}
+
+    def _getSemaphore(self, key: Hashable) -> threading.BoundedSemaphore:
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = threading.BoundedSemaphore(self.per_key_limit)
+            return self._semaphores[key]
+
+    def _run(self, fn: Callable, target, key: Hashable, index: int, on_result: Optional[Callable]):
+        with self._getSemaphore(key):
+            result = fn(target)
+        if on_result:
+            on_result(index, result)
+        return result
+
+    def map(self, fn: Callable, targets: Iterable, key: Callable[..., Hashable], on_result: Optional[Callable[[int, object], None]] = None) -> List:
+        '''
+        Call fn for every target and return the results in the order of targets.
+        on_result is called with the index of each target and its result as soon as that target finishes
+        '''
+        targets = list(targets)
+        if not targets:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(targets)), thread_name_prefix="sparrow-fanout") as executor:
+            ## Run each target in a copy of the caller's context so per-job state (e.g. metrics) follows it
+            futures = [executor.submit(contextvars.copy_context().run, self._run, fn, target, key(target), index, on_result) for index, target in enumerate(targets)]
+            try:
+                return [future.result() for future in futures]
+            except Exception:
+                ## Don't start any more work once a target has failed
+                for future in futures:
+                    future.cancel()
+                raise
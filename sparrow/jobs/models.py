@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+from sparrow.sparrowfile.models import ChartConfigurationView, ChartEnvironmentView
+
+
+@dataclass
+class ReleaseTarget:
+    '''A single chart deployed to a single environment'''
+    chart_path: str
+    chart_name: str
+    configuration: ChartConfigurationView
+    env: ChartEnvironmentView
@@ -0,0 +1,47 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Hashable
+import threading
+
+from sparrow.logger import logger
+
+
+class OrderedExecutor:
+    '''
+        Runs tasks on a shared thread pool without blocking the caller.
+        Tasks submitted under the same key run one after another in submission order, tasks under different keys
+        (or without a key) run concurrently.
+    '''
+    def __init__(self, workers: int, name: str = "sparrow-ordered"):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._tails: Dict[Hashable, Future] = {}
+
+    @staticmethod
+    def _run(previous: Future, fn: Callable, args, kwargs):
+        ## The previous task was submitted first so it is already running or done. Its outcome doesn't matter here
+        if previous:
+            wait([previous])
+        return fn(*args, **kwargs)
+
+    @staticmethod
+    def _logFailure(future: Future):
+        if not future.cancelled() and (e := future.exception()):
+            logger.error(f"Background task failed: {e}")
+
+    def _release(self, key: Hashable, future: Future):
+        with self._lock:
+            if self._tails.get(key) is future:
+                del self._tails[key]
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> Future:
+        '''Run fn after every task previously submitted under key. A key of None imposes no ordering'''
+        with self._lock:
+            previous = self._tails.get(key) if key is not None else None
+            future = self._executor.submit(OrderedExecutor._run, previous, fn, args, kwargs)
+            if key is not None:
+                self._tails[key] = future
+
+        future.add_done_callback(OrderedExecutor._logFailure)
+        if key is not None:
+            future.add_done_callback(lambda done: self._release(key, done))
+        return future
@@ -0,0 +1,66 @@
+import os
+import queue
+import threading
+from typing import Callable, List
+
+from sparrow.jobs.exceptions import QueueFullError
+from sparrow.logger import logger
+
+
+class JobQueue:
+    '''
+        A bounded in-process job queue served by a pool of worker threads.
+        Workers are started lazily on first submit so that every forked gunicorn worker owns its own pool.
+    '''
+    def __init__(self, handler: Callable, depth: int, workers: int):
+        self.handler = handler
+        self.depth = depth
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue: queue.Queue = None
+        self._threads: List[threading.Thread] = []
+
+    def _ensureWorkers(self):
+        '''Start the worker pool for this process if it has not been started yet'''
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            ## Threads do not survive a fork so build a fresh queue and pool in the new process
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.depth)
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"sparrow-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.workers} job workers with a queue depth of {self.depth}")
+
+    def _work(self):
+        job_queue = self._queue
+        while True:
+            job = job_queue.get()
+            try:
+                self.handler(job)
+            except Exception as e:
+                logger.exception(f"Unhandled exception in job worker: {e}")
+            finally:
+                job_queue.task_done()
+
+    def submit(self, job):
+        '''Put a job on the queue. Raises QueueFullError when the queue is at capacity'''
+        self._ensureWorkers()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError(self.depth)
+
+    def size(self) -> int:
+        '''Return the number of jobs waiting to be picked up by a worker'''
+        return self._queue.qsize() if self._queue else 0
+
+    def join(self):
+        '''Block until every submitted job has been handled'''
+        if self._queue:
+            self._queue.join()
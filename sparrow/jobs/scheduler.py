@@ -0,0 +1,129 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+import threading
+
+from sparrow.jobs.cancellation import CancellationToken, cancellation_scope
+from sparrow.jobs.exceptions import QueueFullError
+from sparrow.jobs.queue import JobQueue
+from sparrow.receivers.events import PullRequestEvent, PullRequestEventType
+from sparrow.logger import logger
+
+## Jobs whose result is only useful for the latest sha of their merge request
+SUPERSEDABLE_EVENTS = [PullRequestEventType.MR_OPENED, PullRequestEventType.MR_MODIFIED, PullRequestEventType.COMMENT_DIFF]
+
+
+@dataclass(eq=False)
+class _Job:
+    event: PullRequestEvent
+    token: CancellationToken = field(default_factory=CancellationToken)
+
+
+class MergeRequestScheduler:
+    '''
+        Schedule events on a JobQueue per merge request.
+        Diff events wait out a short debounce window and a newer event for the same merge request replaces them. An event
+        for a new sha cancels the queued and running diff jobs of older shas, terminating their helm processes. Other events
+        (e.g. apply commands) are queued right away and are never dropped or cancelled.
+        This state lives in the process, so every event of a merge request must reach the same process
+    '''
+    def __init__(self, handler: Callable, depth: int, workers: int, debounce: float, on_cancelled: Optional[Callable] = None):
+        self.handler = handler
+        self.debounce = debounce
+        self.on_cancelled = on_cancelled
+        self._queue = JobQueue(handler=self._run, depth=depth, workers=workers)
+        self._lock = threading.Lock()
+        self._pending: Dict[Hashable, Tuple[threading.Timer, _Job]] = {}
+        self._active: Dict[Hashable, List[_Job]] = {}
+
+    def _key(self, event: PullRequestEvent) -> Hashable:
+        return (event.repo.id, event.mr.id)
+
+    def _supersede(self, key: Hashable, sha: Optional[str]) -> List[_Job]:
+        '''Cancel the pending job and the active jobs of other shas of a merge request. Called with the lock held. Returns the dropped pending job'''
+        dropped = []
+        if pending := self._pending.pop(key, None):
+            timer, job = pending
+            timer.cancel()
+            job.token.cancel(f"replaced by a newer event for sha {sha}")
+            dropped.append(job)
+
+        for job in self._active.get(key, []):
+            if job.event.mr.sha != sha:
+                job.token.cancel(f"superseded by sha {sha}" if sha else "the merge request was closed")
+        return dropped
+
+    def _enqueue(self, key: Hashable, job: _Job):
+        '''Queue a job and track it as active until it has run. Called with the lock held'''
+        self._active.setdefault(key, []).append(job)
+        try:
+            self._queue.submit(job)
+        except QueueFullError:
+            self._active[key].remove(job)
+            raise
+
+    def _notifyCancelled(self, jobs: List[_Job]):
+        for job in jobs:
+            logger.info(f"Dropped {job.event.type} for sha {job.event.mr.sha}: {job.token.reason}")
+            if self.on_cancelled:
+                self.on_cancelled(job.event)
+
+    def submit(self, event: PullRequestEvent):
+        '''Schedule an event. Raises QueueFullError when the job queue is at capacity'''
+        key = self._key(event)
+        job = _Job(event)
+        dropped = []
+        with self._lock:
+            if event.type == PullRequestEventType.MR_CLOSED:
+                dropped = self._supersede(key, None)
+                self._queue.submit(job)
+            elif event.type not in SUPERSEDABLE_EVENTS:
+                self._queue.submit(job)
+            else:
+                dropped = self._supersede(key, event.mr.sha)
+                if self.debounce <= 0:
+                    self._enqueue(key, job)
+                else:
+                    ## Answer a full queue now rather than dropping the event once the window closes
+                    if self._queue.size() >= self._queue.depth:
+                        raise QueueFullError(self._queue.depth)
+                    timer = threading.Timer(self.debounce, self._fire, args=(key, job))
+                    timer.daemon = True
+                    self._pending[key] = (timer, job)
+                    timer.start()
+        self._notifyCancelled(dropped)
+
+    def _fire(self, key: Hashable, job: _Job):
+        '''Queue a job once its debounce window has passed without a newer event'''
+        with self._lock:
+            pending = self._pending.get(key)
+            if not pending or pending[1] is not job:
+                return
+            del self._pending[key]
+            try:
+                self._enqueue(key, job)
+            except QueueFullError as e:
+                logger.error(f"Dropping {job.event.type} for sha {job.event.mr.sha}: {e}")
+
+    def _run(self, job: _Job):
+        try:
+            if job.token.cancelled:
+                self._notifyCancelled([job])
+                return
+            with cancellation_scope(job.token):
+                self.handler(job.event)
+        finally:
+            with self._lock:
+                key = self._key(job.event)
+                if job in self._active.get(key, []):
+                    self._active[key].remove(job)
+                    if not self._active[key]:
+                        del self._active[key]
+
+    def size(self) -> int:
+        '''Return the number of jobs waiting to be picked up by a worker, including those waiting out the debounce window'''
+        with self._lock:
+            return self._queue.size() + len(self._pending)
+
+    def join(self):
+        '''Block until every queued job has been handled. Jobs still waiting out the debounce window are not waited for'''
+        self._queue.join()
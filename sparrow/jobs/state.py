@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+import threading
+import json
+
+from sparrow.cache.interface import ICache
+
+
+@dataclass
+class MergeRequestState:
+    '''
+    The last sha Sparrow diffed for a merge request and the diff of every (chart, environment) at that sha.
+    generation counts the applies to the merge request and applied holds the generation each (chart, environment) was last
+    applied at, so a diff taken before an apply is never stored after it
+    '''
+    sha: Optional[str]
+    results: Dict[Tuple[str, str], str] = field(default_factory=dict)
+    generation: int = 0
+    applied: Dict[Tuple[str, str], int] = field(default_factory=dict)
+
+
+class MergeRequestStateStore:
+    '''Persist MergeRequestState in a cache backend. Updates read the stored state and write it back under a lock'''
+    def __init__(self, backend: ICache):
+        self.backend = backend
+        self._lock = threading.Lock()
+
+    def _key(self, repo_id: int, mr_id: int) -> str:
+        return f"mr-state/{repo_id}/{mr_id}"
+
+    def get(self, repo_id: int, mr_id: int) -> Optional[MergeRequestState]:
+        value = self.backend.get(self._key(repo_id, mr_id))
+        if value is None:
+            return None
+        try:
+            data = json.loads(value)
+            return MergeRequestState(
+                sha=data['sha'],
+                results={(result['chart'], result['env']): result['diff'] for result in data['results']},
+                generation=data.get('generation', 0),
+                applied={(applied['chart'], applied['env']): applied['generation'] for applied in data.get('applied', [])}
+            )
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _write(self, repo_id: int, mr_id: int, state: MergeRequestState):
+        results = [{'chart': chart, 'env': env, 'diff': diff} for (chart, env), diff in state.results.items()]
+        applied = [{'chart': chart, 'env': env, 'generation': generation} for (chart, env), generation in state.applied.items()]
+        self.backend.set(self._key(repo_id, mr_id), json.dumps({'sha': state.sha, 'results': results, 'generation': state.generation, 'applied': applied}).encode())
+
+    def generation(self, repo_id: int, mr_id: int) -> int:
+        '''Return the number of applies recorded for a merge request. Read it before diffing and pass it to set'''
+        state = self.get(repo_id, mr_id)
+        return state.generation if state else 0
+
+    def set(self, repo_id: int, mr_id: int, state: MergeRequestState, since: Optional[int] = None):
+        '''
+        Store the diffs of a merge request. The applies recorded so far are kept, and results of (chart, environment) pairs
+        applied after generation since were taken against the release before the apply and are dropped
+        '''
+        with self._lock:
+            current = self.get(repo_id, mr_id)
+            if current:
+                results = {key: diff for key, diff in state.results.items() if since is None or current.applied.get(key, 0) <= since}
+                state = MergeRequestState(sha=state.sha, results=results, generation=current.generation, applied=current.applied)
+            self._write(repo_id, mr_id, state)
+
+    def forget(self, repo_id: int, mr_id: int, keys: Iterable[Tuple[str, str]]):
+        '''Drop the results of (chart, environment) pairs whose live release changed (e.g. was applied) so they are diffed again'''
+        with self._lock:
+            state = self.get(repo_id, mr_id) or MergeRequestState(sha=None)
+            state.generation += 1
+            for key in keys:
+                state.results.pop(key, None)
+                state.applied[key] = state.generation
+            self._write(repo_id, mr_id, state)
+
+    def delete(self, repo_id: int, mr_id: int):
+        with self._lock:
+            self.backend.delete(self._key(repo_id, mr_id))
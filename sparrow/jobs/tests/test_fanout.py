@@ -0,0 +1,51 @@
+from sparrow.jobs.fanout import FanOut
+from sparrow.telemetry import metrics
+import threading
+import time
+
+class TestFanOut():
+
+    def test_map_preserves_target_order(self):
+        """
+        Test that results come back in target order even when later targets finish first.
+        """
+        fanout = FanOut(workers=4, per_key_limit=4)
+        targets = [0.04, 0.03, 0.02, 0.01]
+
+        def run(delay):
+            time.sleep(delay)
+            return delay
+
+        assert fanout.map(run, targets, key=lambda target: 'cluster') == targets
+
+    def test_map_limits_concurrency_per_key(self):
+        """
+        Test that no more than per_key_limit calls run at once for the same key.
+        """
+        fanout = FanOut(workers=8, per_key_limit=2)
+        lock = threading.Lock()
+        running = {'a': 0, 'b': 0}
+        peak = {'a': 0, 'b': 0}
+
+        def run(target):
+            with lock:
+                running[target] += 1
+                peak[target] = max(peak[target], running[target])
+            time.sleep(0.02)
+            with lock:
+                running[target] -= 1
+
+        fanout.map(run, ['a', 'b'] * 6, key=lambda target: target)
+
+        assert peak == {'a': 2, 'b': 2}
+
+    def test_map_records_metrics_for_the_calling_job(self):
+        """
+        Test that counters incremented on fan-out threads are collected by the job that started them.
+        """
+        fanout = FanOut(workers=4, per_key_limit=4)
+
+        with metrics.job_metrics() as job_metrics:
+            fanout.map(lambda target: metrics.increment('targets'), range(5), key=lambda target: target)
+
+        assert job_metrics.snapshot() == {'targets': 5}
@@ -0,0 +1,79 @@
+from sparrow.jobs.ordered import OrderedExecutor
+from sparrow.vcs.gitlab.client import GitlabConfig, GitlabVCS
+from sparrow.receivers.events import PullRequestEvent, PullRequestEventType, MergeRequest, Repo
+from unittest.mock import MagicMock
+import threading
+import time
+
+class TestOrderedExecutor():
+
+    def test_same_key_runs_in_submission_order(self):
+        """
+        Test that tasks under one key run one after another in submission order even when the first one is slowest.
+        """
+        executor = OrderedExecutor(workers=4)
+        done = []
+
+        def run(delay, name):
+            time.sleep(delay)
+            done.append(name)
+
+        futures = [executor.submit('mr', run, delay, name) for delay, name in [(0.05, 'first'), (0.02, 'second'), (0, 'third')]]
+        for future in futures:
+            future.result(timeout=5)
+
+        assert done == ['first', 'second', 'third']
+
+    def test_other_keys_do_not_wait(self):
+        """
+        Test that a blocked task only holds back tasks submitted under the same key.
+        """
+        executor = OrderedExecutor(workers=4)
+        release = threading.Event()
+
+        blocked = executor.submit('a', release.wait, 5)
+        queued = executor.submit('a', lambda: 'a')
+        assert executor.submit('b', lambda: 'b').result(timeout=5) == 'b'
+        assert executor.submit(None, lambda: 'none').result(timeout=5) == 'none'
+        assert not queued.done()
+
+        release.set()
+        blocked.result(timeout=5)
+        assert queued.result(timeout=5) == 'a'
+
+
+class TestGitlabSideEffects():
+
+    def test_status_updates_stay_in_order_without_blocking_the_job(self):
+        """
+        Test that acknowledging an event and reporting its outcome return straight away while GitLab is slow,
+        that the reaction does not wait for the status update, and that the statuses land in the order they were issued.
+        """
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock())
+        release = threading.Event()
+        reacted = threading.Event()
+        states = []
+
+        def post(endpoint, body):
+            if 'award_emoji' in endpoint:
+                reacted.set()
+                return
+            ## GitLab takes a while to answer the first status update
+            if not states:
+                release.wait(5)
+            states.append(body['state'])
+
+        vcs.http_client.post.side_effect = post
+        vcs.http_client.get.return_value = MagicMock(status_code=200, headers={}, json=lambda: [])
+        event = PullRequestEvent(user=None, type=PullRequestEventType.COMMENT_APPLY, repo=Repo(id=1, http_clone_url=''), mr=MergeRequest(id=2, sha='abc', ref_name='feature'), comment_id=3)
+
+        started = time.monotonic()
+        vcs.acknowledgeEvent(event)
+        vcs.SetEventSuccess(event)
+        assert time.monotonic() - started < 1
+        assert reacted.wait(5)
+        assert states == []
+
+        release.set()
+        vcs._side_effects._executor.shutdown(wait=True)
+        assert states == ['running', 'success']
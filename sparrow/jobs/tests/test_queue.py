@@ -0,0 +1,58 @@
+from sparrow.jobs.queue import JobQueue
+from sparrow.jobs.exceptions import QueueFullError
+import threading
+import pytest
+
+class TestJobQueue():
+
+    def test_submit_runs_handler(self):
+        """
+        Test that submitted jobs are handed to the handler by the worker pool.
+        """
+        handled = []
+        jobs = JobQueue(handler=handled.append, depth=10, workers=2)
+        for job in range(5):
+            jobs.submit(job)
+        jobs.join()
+
+        assert sorted(handled) == [0, 1, 2, 3, 4]
+
+    def test_submit_raises_when_full(self):
+        """
+        Test that the queue applies backpressure once its depth is reached.
+        """
+        release = threading.Event()
+        started = threading.Event()
+
+        def handler(job):
+            started.set()
+            release.wait()
+
+        jobs = JobQueue(handler=handler, depth=1, workers=1)
+        jobs.submit('running')
+        started.wait(timeout=5)
+        jobs.submit('waiting')
+
+        with pytest.raises(QueueFullError):
+            jobs.submit('rejected')
+
+        release.set()
+        jobs.join()
+
+    def test_handler_exceptions_do_not_stop_workers(self):
+        """
+        Test that a failing job does not take its worker down with it.
+        """
+        handled = []
+
+        def handler(job):
+            if job == 'bad':
+                raise ValueError("bad job")
+            handled.append(job)
+
+        jobs = JobQueue(handler=handler, depth=10, workers=1)
+        jobs.submit('bad')
+        jobs.submit('good')
+        jobs.join()
+
+        assert handled == ['good']
@@ -0,0 +1,69 @@
+from sparrow.jobs.scheduler import MergeRequestScheduler
+from sparrow.jobs.cancellation import tracked
+from sparrow.jobs.exceptions import JobCancelledError
+from sparrow.receivers.events import PullRequestEvent, PullRequestEventType, MergeRequest, Repo
+import subprocess
+import threading
+import time
+
+def make_event(type: PullRequestEventType, sha: str) -> PullRequestEvent:
+    return PullRequestEvent(repo=Repo(id=1, http_clone_url=''), user=None, type=type, mr=MergeRequest(id=2, sha=sha, ref_name='feature'))
+
+class TestMergeRequestScheduler():
+
+    def test_debounce_merges_bursts(self):
+        """
+        Test that only the last of several pushes within the debounce window is handled and the others are reported as cancelled.
+        """
+        handled, cancelled = [], []
+        scheduler = MergeRequestScheduler(handler=lambda event: handled.append(event.mr.sha), depth=10, workers=1, debounce=0.05,
+                                          on_cancelled=lambda event: cancelled.append(event.mr.sha))
+
+        for sha in ['a', 'b', 'c']:
+            scheduler.submit(make_event(PullRequestEventType.MR_MODIFIED, sha))
+        time.sleep(0.2)
+        scheduler.join()
+
+        assert handled == ['c']
+        assert cancelled == ['a', 'b']
+
+    def test_new_sha_cancels_running_job(self):
+        """
+        Test that a push for a new sha terminates the helm processes of the running job for the older sha.
+        """
+        started = threading.Event()
+        results = {}
+
+        def handler(event):
+            if event.mr.sha != 'old':
+                return
+            process = subprocess.Popen(['sleep', '10'])
+            started.set()
+            try:
+                with tracked(process):
+                    process.wait()
+            except JobCancelledError:
+                results['cancelled'] = process.returncode
+
+        scheduler = MergeRequestScheduler(handler=handler, depth=10, workers=2, debounce=0)
+        scheduler.submit(make_event(PullRequestEventType.MR_MODIFIED, 'old'))
+        assert started.wait(5)
+
+        scheduler.submit(make_event(PullRequestEventType.MR_MODIFIED, 'new'))
+        scheduler.join()
+
+        assert results['cancelled'] is not None and results['cancelled'] != 0
+
+    def test_apply_is_never_dropped(self):
+        """
+        Test that apply commands run immediately and are not replaced or cancelled by later pushes.
+        """
+        handled = []
+        scheduler = MergeRequestScheduler(handler=lambda event: handled.append((event.type, event.mr.sha)), depth=10, workers=1, debounce=0.05)
+
+        scheduler.submit(make_event(PullRequestEventType.COMMENT_APPLY, 'a'))
+        scheduler.submit(make_event(PullRequestEventType.MR_MODIFIED, 'b'))
+        time.sleep(0.2)
+        scheduler.join()
+
+        assert handled == [(PullRequestEventType.COMMENT_APPLY, 'a'), (PullRequestEventType.MR_MODIFIED, 'b')]
@@ -0,0 +1,50 @@
+from sparrow.jobs.state import MergeRequestState, MergeRequestStateStore
+from sparrow.cache.memory import MemoryCache
+
+class TestMergeRequestStateStore():
+
+    def test_round_trip(self):
+        store = MergeRequestStateStore(MemoryCache(max_bytes=4096))
+        state = MergeRequestState(sha='abc', results={('charts/app', 'dev'): 'diff output'})
+
+        store.set(1, 2, state)
+
+        assert store.get(1, 2) == state
+        assert store.get(1, 3) is None
+
+    def test_delete(self):
+        store = MergeRequestStateStore(MemoryCache(max_bytes=4096))
+        store.set(1, 2, MergeRequestState(sha='abc'))
+
+        store.delete(1, 2)
+
+        assert store.get(1, 2) is None
+
+    def test_forget_applied_results(self):
+        store = MergeRequestStateStore(MemoryCache(max_bytes=4096))
+        store.set(1, 2, MergeRequestState(sha='abc', results={('charts/app', 'dev'): 'dev diff', ('charts/app', 'prod'): 'prod diff'}))
+
+        store.forget(1, 2, [('charts/app', 'dev')])
+
+        assert store.get(1, 2) == MergeRequestState(sha='abc', results={('charts/app', 'prod'): 'prod diff'}, generation=1, applied={('charts/app', 'dev'): 1})
+
+    def test_diff_taken_before_an_apply_is_not_stored_after_it(self):
+        """
+        Test that a diff job that read the state before an apply cannot store its diff of the applied release over it.
+        """
+        store = MergeRequestStateStore(MemoryCache(max_bytes=4096))
+        results = {('charts/app', 'dev'): 'dev diff', ('charts/app', 'prod'): 'prod diff'}
+
+        ## The first diff of the merge request is still running when dev is applied
+        since = store.generation(1, 2)
+        store.forget(1, 2, [('charts/app', 'dev')])
+        assert store.get(1, 2).sha is None
+        store.set(1, 2, MergeRequestState(sha='abc', results=results), since=since)
+
+        assert store.get(1, 2).results == {('charts/app', 'prod'): 'prod diff'}
+
+        ## A diff started after the apply is stored
+        since = store.generation(1, 2)
+        store.set(1, 2, MergeRequestState(sha='def', results=results), since=since)
+
+        assert store.get(1, 2) == MergeRequestState(sha='def', results=results, generation=1, applied={('charts/app', 'dev'): 1})
@@ -0,0 +1,7 @@
+class LockTimeoutError(Exception):
+    def __init__(self, key, timeout: float):
+        self.key = key
+        self.timeout = timeout
+
+    def __str__(self):
+        return f"Timed out after {self.timeout}s waiting for the lock on {self.key}"
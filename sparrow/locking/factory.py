@@ -1,24 +1,21 @@
+from sparrow.locking.interface import ILock
+from sparrow.locking.none import NoneLock
+from sparrow.locking.local import LocalLock
+from sparrow.locking.file import FileLock
 
 
-def LockFactory(lock_type):
+def LockFactory(lock_type: str, lock_dir: str = None, redis_url: str = None, lease: float = 60) -> ILock:
     if lock_type == 'None':
-        ...
-        # return NoneLock()
+        return NoneLock()
+    elif lock_type == 'Local':
+        return LocalLock()
     elif lock_type == 'File':
-        ...
-        # return FileLock()
+        return FileLock(lock_dir=lock_dir)
     elif lock_type == 'Redis':
-        ...
-        # return RedisLock()
-    elif lock_type == 'Etcd':
-        ...
-        # return EtcdLock()
-    elif lock_type == 'DynamoDB':
-        ...
-        # return DynamoDBLock()
-    elif lock_type == 'Memcached':     
-        ...
-        # return MemcachedLock()
+        ## Imported here so the redis package is only needed when it is used
+        from sparrow.locking.redis import RedisLock
+        if not redis_url:
+            raise ValueError("A Redis URL must be configured to use the Redis lock backend")
+        return RedisLock(url=redis_url, lease=lease)
     else:
         raise ValueError(f"Unknown lock type: {lock_type}")
-    
\ No newline at end of file
@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import hashlib
+import fcntl
+import time
+import os
+
+from sparrow.locking.exceptions import LockTimeoutError
+from sparrow.locking.interface import ILock
+from sparrow.locking.models import Lease, LockKey
+from sparrow.machine import system
+
+
+class FileLock(ILock):
+    '''
+        Release locks backed by flock on files under lock_dir, shared by every process on the host (e.g. gunicorn workers).
+        The kernel drops a lock when its holder exits, so a lease lasts as long as the process holding it.
+        flock does not queue writers behind readers, so every holder first passes through a gate file that an exclusive
+        holder keeps while it waits, which holds back new shared holders. Fencing tokens are kept in a counter file next
+        to each lock file
+    '''
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, lock_dir: str):
+        self.lock_dir = lock_dir
+
+    def _path(self, key: LockKey) -> str:
+        return system.join_paths(self.lock_dir, hashlib.sha256(str(key).encode()).hexdigest())
+
+    def _flock(self, fd: int, operation: int, key: LockKey, timeout: Optional[float], deadline: Optional[float]):
+        if deadline is None:
+            fcntl.flock(fd, operation)
+            return
+        while True:
+            try:
+                fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise LockTimeoutError(key, timeout)
+                time.sleep(FileLock.POLL_INTERVAL)
+
+    def _fence(self, path: str, increment: bool) -> int:
+        '''Read the fencing counter of a key, incrementing it first for exclusive holders'''
+        with system.file_lock(f"{path}.fence.lock"):
+            try:
+                with open(f"{path}.fence", 'r') as file:
+                    token = int(file.read() or 0)
+            except FileNotFoundError:
+                token = 0
+            if increment:
+                token += 1
+                with open(f"{path}.fence.tmp", 'w') as file:
+                    file.write(str(token))
+                os.replace(f"{path}.fence.tmp", f"{path}.fence")
+            return token
+
+    @contextmanager
+    def acquire(self, key: LockKey, shared: bool = False, timeout: Optional[float] = None) -> Iterator[Lease]:
+        path = self._path(key)
+        system.create_dir(self.lock_dir)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        ## Every acquisition opens its own file descriptions so threads of one process also exclude each other
+        gate = os.open(f"{path}.gate", os.O_RDWR | os.O_CREAT, 0o600)
+        fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            ## Shared holders only pass through the gate, an exclusive holder keeps it until it has the lock
+            self._flock(gate, fcntl.LOCK_EX, key, timeout, deadline)
+            try:
+                self._flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, key, timeout, deadline)
+            finally:
+                fcntl.flock(gate, fcntl.LOCK_UN)
+            try:
+                yield Lease(key=key, shared=shared, token=self._fence(path, increment=not shared))
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+            os.close(gate)
@@ -0,0 +1,18 @@
+from abc import abstractmethod
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sparrow.locking.models import Lease, LockKey
+
+
+class ILock:
+    '''Read/write locks on helm releases'''
+
+    @abstractmethod
+    @contextmanager
+    def acquire(self, key: LockKey, shared: bool = False, timeout: Optional[float] = None) -> Iterator[Lease]:
+        '''
+        Hold the lock on key for the duration of the context. Shared holders run side by side, an exclusive holder runs alone.
+        Raises LockTimeoutError if the lock could not be taken within timeout seconds (None waits forever)
+        '''
+        ...
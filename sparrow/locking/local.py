@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+import threading
+import time
+
+from sparrow.locking.exceptions import LockTimeoutError
+from sparrow.locking.interface import ILock
+from sparrow.locking.models import Lease, LockKey
+
+
+class _ReleaseState:
+    def __init__(self):
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.token = 0
+
+
+class LocalLock(ILock):
+    '''
+        An in-memory stand-in for the shared backends. Only locks between the threads of one process.
+        A waiting exclusive holder keeps new shared holders out so a stream of diffs cannot starve an apply
+    '''
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._states: Dict[LockKey, _ReleaseState] = {}
+
+    def _available(self, state: _ReleaseState, shared: bool) -> bool:
+        if shared:
+            return not state.writer and state.waiting_writers == 0
+        return not state.writer and state.readers == 0
+
+    @contextmanager
+    def acquire(self, key: LockKey, shared: bool = False, timeout: Optional[float] = None) -> Iterator[Lease]:
+        with self._condition:
+            state = self._states.setdefault(key, _ReleaseState())
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            if not shared:
+                state.waiting_writers += 1
+            try:
+                while not self._available(state, shared):
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise LockTimeoutError(key, timeout)
+                    self._condition.wait(remaining)
+            finally:
+                if not shared:
+                    state.waiting_writers -= 1
+                    ## Shared holders held back by this writer may go ahead if it gave up
+                    self._condition.notify_all()
+
+            if shared:
+                state.readers += 1
+            else:
+                state.writer = True
+                state.token += 1
+            lease = Lease(key=key, shared=shared, token=state.token)
+
+        try:
+            yield lease
+        finally:
+            with self._condition:
+                if shared:
+                    state.readers -= 1
+                else:
+                    state.writer = False
+                self._condition.notify_all()
@@ -0,0 +1,26 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class LockKey:
+    '''Identifies a helm release. Operations on different releases never wait for each other'''
+    cluster: str
+    namespace: str
+    release: str
+
+    def __str__(self):
+        return f"{self.cluster}/{self.namespace}/{self.release}"
+
+
+@dataclass(frozen=True)
+class Lease:
+    '''
+    A held lock.
+    The fencing token grows with every exclusive acquisition of a key, so work started under an older token can be told apart
+    from work started after the lock changed hands. expires_at is None when the lock lives as long as its holder
+    '''
+    key: LockKey
+    shared: bool
+    token: int
+    expires_at: Optional[float] = None
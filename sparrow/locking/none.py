@@ -0,0 +1,13 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sparrow.locking.interface import ILock
+from sparrow.locking.models import Lease, LockKey
+
+
+class NoneLock(ILock):
+    '''Does not lock anything. Only safe with a single job worker'''
+
+    @contextmanager
+    def acquire(self, key: LockKey, shared: bool = False, timeout: Optional[float] = None) -> Iterator[Lease]:
+        yield Lease(key=key, shared=shared, token=0)
@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+import threading
+import uuid
+import time
+
+from sparrow.locking.exceptions import LockTimeoutError
+from sparrow.locking.interface import ILock
+from sparrow.locking.models import Lease, LockKey
+from sparrow.logger import logger
+
+## KEYS: writer, readers, fence, waiting. ARGV: owner, lease (ms), wait mark (ms). Returns the fencing token or nil while
+## readers or a writer hold the lock. A writer held back by readers marks itself as waiting so no new readers are let in
+_ACQUIRE_EXCLUSIVE = '''
+local now = redis.call('TIME')
+local now_ms = now[1] * 1000 + math.floor(now[2] / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now_ms)
+local waiting = redis.call('GET', KEYS[4])
+if waiting and waiting ~= ARGV[1] then
+    return nil
+end
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('ZCARD', KEYS[2]) > 0 then
+    redis.call('SET', KEYS[4], ARGV[1], 'PX', ARGV[3])
+    return nil
+end
+redis.call('DEL', KEYS[4])
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return redis.call('INCR', KEYS[3])
+'''
+
+_ACQUIRE_SHARED = '''
+local now = redis.call('TIME')
+local now_ms = now[1] * 1000 + math.floor(now[2] / 1000)
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('EXISTS', KEYS[4]) == 1 then
+    return nil
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now_ms)
+redis.call('ZADD', KEYS[2], now_ms + tonumber(ARGV[2]), ARGV[1])
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+return tonumber(redis.call('GET', KEYS[3]) or '0')
+'''
+
+## Extend a lease. Returns 0 if the lease was lost (it expired and the lock may have changed hands)
+_RENEW = '''
+local now = redis.call('TIME')
+local now_ms = now[1] * 1000 + math.floor(now[2] / 1000)
+if ARGV[3] == 'shared' then
+    if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[2], now_ms + tonumber(ARGV[2]), ARGV[1])
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+    return 1
+end
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+return 1
+'''
+
+## Release a lease, or withdraw the waiting mark of a writer that gave up
+_RELEASE = '''
+if ARGV[2] == 'shared' then
+    return redis.call('ZREM', KEYS[2], ARGV[1])
+end
+if redis.call('GET', KEYS[4]) == ARGV[1] then
+    redis.call('DEL', KEYS[4])
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+class RedisLock(ILock):
+    '''
+        Release locks held in Redis, shared by every Sparrow host using the same server.
+        Locks are leases that expire lease seconds after the last renewal, and a background thread renews them while held,
+        so the lock of a crashed holder frees itself. A waiting writer keeps new readers out with a mark it refreshes on
+        every poll, so the mark of a crashed writer expires quickly. Fencing tokens come from an INCR counter per key
+    '''
+    POLL_INTERVAL = 0.2
+    WAIT_MARK = 2.0
+
+    def __init__(self, url: str, lease: float, prefix: str = "sparrow:lock"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The Redis lock backend requires the redis package. Install it with `pip install redis`")
+
+        self.client = redis.Redis.from_url(url)
+        self.lease = lease
+        self.prefix = prefix
+        self._acquire_exclusive = self.client.register_script(_ACQUIRE_EXCLUSIVE)
+        self._acquire_shared = self.client.register_script(_ACQUIRE_SHARED)
+        self._renew = self.client.register_script(_RENEW)
+        self._release = self.client.register_script(_RELEASE)
+
+    def _keys(self, key: LockKey) -> list:
+        base = f"{self.prefix}:{key}"
+        return [f"{base}:writer", f"{base}:readers", f"{base}:fence", f"{base}:waiting"]
+
+    def _renewUntil(self, stop: threading.Event, keys: list, owner: str, mode: str, key: LockKey):
+        lease_ms = int(self.lease * 1000)
+        while not stop.wait(self.lease / 3):
+            try:
+                if not self._renew(keys=keys, args=[owner, lease_ms, mode]):
+                    logger.error(f"Lost the lease on {key}")
+                    return
+            except Exception as e:
+                logger.warning(f"Could not renew the lease on {key}: {e}")
+
+    @contextmanager
+    def acquire(self, key: LockKey, shared: bool = False, timeout: Optional[float] = None) -> Iterator[Lease]:
+        keys = self._keys(key)
+        owner = uuid.uuid4().hex
+        mode = 'shared' if shared else 'exclusive'
+        script = self._acquire_shared if shared else self._acquire_exclusive
+        lease_ms = int(self.lease * 1000)
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while (token := script(keys=keys, args=[owner, lease_ms, int(RedisLock.WAIT_MARK * 1000)])) is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                if not shared:
+                    self._release(keys=keys, args=[owner, mode])
+                raise LockTimeoutError(key, timeout)
+            time.sleep(RedisLock.POLL_INTERVAL)
+
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renewUntil, args=(stop, keys, owner, mode, key), name="sparrow-lock-renew", daemon=True)
+        renewer.start()
+        try:
+            yield Lease(key=key, shared=shared, token=int(token), expires_at=time.time() + self.lease)
+        finally:
+            stop.set()
+            renewer.join()
+            self._release(keys=keys, args=[owner, mode])
@@ -0,0 +1,220 @@
+from sparrow.locking.file import FileLock
+from sparrow.locking.local import LocalLock
+from sparrow.locking.models import LockKey
+from sparrow.locking.exceptions import LockTimeoutError
+from sparrow.locking import redis as redis_lock
+from sparrow.locking.factory import LockFactory
+import threading
+import types
+import time
+import sys
+import pytest
+
+KEY = LockKey(cluster='dev-cluster', namespace='default', release='app')
+
+class FakeRedis():
+    '''Runs the lock scripts of RedisLock against in-memory state, with the same semantics as the Lua versions'''
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.writers = {}  # key: (owner, expires at ms)
+        self.readers = {}  # key: {owner: expires at ms}
+        self.waiting = {}  # key: (owner, expires at ms)
+        self.fences = {}
+
+    @classmethod
+    def from_url(cls, url):
+        return cls()
+
+    def _now(self):
+        return time.monotonic() * 1000
+
+    def _writer(self, key):
+        owner, expires = self.writers.get(key, (None, 0))
+        return owner if expires > self._now() else None
+
+    def _waiting(self, key):
+        owner, expires = self.waiting.get(key, (None, 0))
+        return owner if expires > self._now() else None
+
+    def _readers(self, key):
+        readers = {owner: expires for owner, expires in self.readers.get(key, {}).items() if expires > self._now()}
+        self.readers[key] = readers
+        return readers
+
+    def _acquireExclusive(self, keys, args):
+        if self._waiting(keys[3]) not in (None, args[0]):
+            return None
+        if self._writer(keys[0]) or self._readers(keys[1]):
+            self.waiting[keys[3]] = (args[0], self._now() + args[2])
+            return None
+        self.waiting.pop(keys[3], None)
+        self.writers[keys[0]] = (args[0], self._now() + args[1])
+        self.fences[keys[2]] = self.fences.get(keys[2], 0) + 1
+        return self.fences[keys[2]]
+
+    def _acquireShared(self, keys, args):
+        if self._writer(keys[0]) or self._waiting(keys[3]):
+            return None
+        self._readers(keys[1])[args[0]] = self._now() + args[1]
+        return self.fences.get(keys[2], 0)
+
+    def _renew(self, keys, args):
+        if args[2] == 'shared':
+            if args[0] not in self._readers(keys[1]):
+                return 0
+            self.readers[keys[1]][args[0]] = self._now() + args[1]
+            return 1
+        if self._writer(keys[0]) != args[0]:
+            return 0
+        self.writers[keys[0]] = (args[0], self._now() + args[1])
+        return 1
+
+    def _release(self, keys, args):
+        if args[1] == 'shared':
+            return 1 if self._readers(keys[1]).pop(args[0], None) else 0
+        if self._waiting(keys[3]) == args[0]:
+            del self.waiting[keys[3]]
+        if self._writer(keys[0]) == args[0]:
+            del self.writers[keys[0]]
+            return 1
+        return 0
+
+    def register_script(self, script):
+        run = {
+            redis_lock._ACQUIRE_EXCLUSIVE: self._acquireExclusive,
+            redis_lock._ACQUIRE_SHARED: self._acquireShared,
+            redis_lock._RENEW: self._renew,
+            redis_lock._RELEASE: self._release
+        }[script]
+        def call(keys, args):
+            with self.mutex:
+                return run(keys, args)
+        return call
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'redis', types.SimpleNamespace(Redis=FakeRedis))
+
+@pytest.fixture(params=['file', 'local', 'redis'])
+def lock(request, tmp_path, fake_redis):
+    if request.param == 'redis':
+        return redis_lock.RedisLock(url='redis://localhost:6379/0', lease=60)
+    return FileLock(lock_dir=str(tmp_path)) if request.param == 'file' else LocalLock()
+
+class TestLocks():
+
+    def test_shared_holders_run_together(self, lock):
+        with lock.acquire(KEY, shared=True):
+            with lock.acquire(KEY, shared=True, timeout=0.2) as lease:
+                assert lease.shared
+
+    def test_exclusive_excludes_other_holders(self, lock):
+        """
+        Test that an exclusive holder blocks shared and exclusive holders of the same release but not of other releases.
+        """
+        with lock.acquire(KEY):
+            with pytest.raises(LockTimeoutError):
+                with lock.acquire(KEY, shared=True, timeout=0.2):
+                    pass
+            with lock.acquire(LockKey(cluster='dev-cluster', namespace='default', release='other'), timeout=0.2):
+                pass
+
+        with lock.acquire(KEY, shared=True):
+            with pytest.raises(LockTimeoutError):
+                with lock.acquire(KEY, timeout=0.2):
+                    pass
+
+    def test_exclusive_waits_for_release(self, lock):
+        acquired = threading.Event()
+
+        def hold():
+            with lock.acquire(KEY, shared=True):
+                acquired.set()
+                threading.Event().wait(0.2)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        assert acquired.wait(5)
+        with lock.acquire(KEY, timeout=5):
+            pass
+        thread.join()
+
+    def test_waiting_writer_holds_back_new_readers(self, lock):
+        """
+        Test that once an exclusive holder waits for the current shared holders, new shared holders queue behind it
+        instead of keeping it waiting, and that they go ahead again once the writer is done or gave up.
+        """
+        reader = lock.acquire(KEY, shared=True)
+        reader.__enter__()
+        with pytest.raises(LockTimeoutError):
+            with lock.acquire(KEY, timeout=0.3):
+                pass
+        ## A writer that gave up no longer holds readers back
+        with lock.acquire(KEY, shared=True, timeout=0.3):
+            pass
+
+        acquired = threading.Event()
+        def write():
+            with lock.acquire(KEY, timeout=5):
+                acquired.set()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.5)
+        with pytest.raises(LockTimeoutError):
+            with lock.acquire(KEY, shared=True, timeout=0.3):
+                pass
+        assert not acquired.is_set()
+
+        reader.__exit__(None, None, None)
+        assert acquired.wait(5)
+        writer.join()
+        with lock.acquire(KEY, shared=True, timeout=0.3):
+            pass
+
+    def test_fencing_tokens_increase(self, lock):
+        with lock.acquire(KEY) as first:
+            pass
+        with lock.acquire(KEY) as second:
+            pass
+        with lock.acquire(KEY, shared=True) as shared:
+            pass
+
+        assert second.token > first.token
+        assert shared.token == second.token
+
+class TestRedisLock():
+
+    def test_lease_is_renewed_while_held(self, fake_redis):
+        lock = redis_lock.RedisLock(url='redis://localhost:6379/0', lease=0.3)
+        with lock.acquire(KEY):
+            time.sleep(0.6)
+            with pytest.raises(LockTimeoutError):
+                with lock.acquire(KEY, timeout=0.1):
+                    pass
+
+    def test_expired_lease_of_a_crashed_holder_is_taken_over(self, fake_redis):
+        """
+        Test that a writer that stopped renewing (e.g. its host crashed) loses the lock once its lease expires, and that
+        releasing the lost lease does not release the new holder.
+        """
+        lock = redis_lock.RedisLock(url='redis://localhost:6379/0', lease=60)
+        writer, readers, fence, waiting = lock._keys(KEY)
+        lock.client.writers[writer] = ('crashed', lock.client._now() + 100)
+        lock.client.fences[fence] = 3
+
+        with lock.acquire(KEY, timeout=5) as lease:
+            assert lease.token == 4
+            assert lock._release(keys=[writer, readers, fence, waiting], args=['crashed', 'exclusive']) == 0
+            with pytest.raises(LockTimeoutError):
+                with lock.acquire(KEY, shared=True, timeout=0.1):
+                    pass
+
+        with lock.acquire(KEY, shared=True, timeout=0.1):
+            pass
+
+    def test_factory_rejects_unknown_backends(self):
+        with pytest.raises(ValueError):
+            LockFactory('Etcd')
+        with pytest.raises(ValueError):
+            LockFactory('Redis')
@@ -0,0 +1,70 @@
+from tempfile import SpooledTemporaryFile
+
+
+class BoundedOutput:
+    '''
+        Collects a byte stream in bounded memory.
+        Bytes are held in memory up to memory_threshold and spilled to a temporary file beyond it. At most max_bytes are kept:
+        once the stream outgrows them the first and last max_bytes / 2 are kept and the bytes in between are counted as dropped
+    '''
+    def __init__(self, memory_threshold: int, max_bytes: int):
+        self._head_limit = max_bytes // 2
+        self._tail_limit = max_bytes - self._head_limit
+        self._head = SpooledTemporaryFile(max_size=memory_threshold)
+        self._head_size = 0
+        ## The tail is a ring buffer over its own file
+        self._tail = SpooledTemporaryFile(max_size=memory_threshold)
+        self._tail_pos = 0
+        self._tail_size = 0
+        self.total = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.total - self._head_size - self._tail_size
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        if self._head_size < self._head_limit:
+            take = min(len(data), self._head_limit - self._head_size)
+            self._head.write(data[:take])
+            self._head_size += take
+            data = data[take:]
+        if data and self._tail_limit:
+            self._writeTail(data)
+
+    def _writeTail(self, data: bytes):
+        if len(data) >= self._tail_limit:
+            self._tail.seek(0)
+            self._tail.write(data[-self._tail_limit:])
+            self._tail_pos = 0
+            self._tail_size = self._tail_limit
+            return
+
+        first = min(len(data), self._tail_limit - self._tail_pos)
+        self._tail.seek(self._tail_pos)
+        self._tail.write(data[:first])
+        if first < len(data):
+            self._tail.seek(0)
+            self._tail.write(data[first:])
+        self._tail_pos = (self._tail_pos + len(data)) % self._tail_limit
+        self._tail_size = min(self._tail_limit, self._tail_size + len(data))
+
+    def _readTail(self) -> bytes:
+        self._tail.seek(0)
+        if self._tail_size < self._tail_limit:
+            return self._tail.read(self._tail_size)
+        ring = self._tail.read(self._tail_limit)
+        return ring[self._tail_pos:] + ring[:self._tail_pos]
+
+    def text(self, encoding: str = 'utf-8') -> str:
+        '''Decode the kept bytes, marking where bytes were dropped'''
+        self._head.seek(0)
+        head = self._head.read(self._head_size).decode(encoding, errors='replace')
+        tail = self._readTail().decode(encoding, errors='replace')
+        if self.dropped:
+            return f"{head}\n\n... {self.dropped} bytes of output were dropped ...\n\n{tail}"
+        return head + tail
+
+    def close(self):
+        self._head.close()
+        self._tail.close()
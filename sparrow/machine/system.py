@@ -1,7 +1,12 @@
 
 from sparrow.machine import enum
 from sparrow.machine.decorators import handle_subprocess_exceptions
-from typing import List
+from sparrow.machine.output import BoundedOutput
+from typing import Callable, ContextManager, List, Optional
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+import threading
+import fcntl
 import sys
 import os
 import subprocess
@@ -106,4 +111,52 @@ def create_dir(directory: str):
 
 
 def set_file_permissions(file: str, mode: int):
-    os.chmod(file, mode)
\ No newline at end of file
+    os.chmod(file, mode)
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Hold an flock on path for the duration of the context. Works across threads and processes"""
+    create_dir(get_parent_dir(path))
+    with open(path, 'a') as file:
+        fcntl.flock(file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield file
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+@dataclass
+class BoundedProcessResult:
+    args: List[str]
+    returncode: int
+    stdout: str
+    stderr: str
+    stdout_dropped: int = 0
+    stderr_dropped: int = 0
+
+def _drain(pipe, output: BoundedOutput, chunk_size: int):
+    for chunk in iter(lambda: pipe.read1(chunk_size), b''):
+        output.write(chunk)
+    pipe.close()
+
+def run_bounded(cmd: List[str], env: Optional[dict] = None, memory_threshold: int = 1024 ** 2, max_bytes: int = 8 * 1024 ** 2,
+                watch: Optional[Callable[[subprocess.Popen], ContextManager]] = None, chunk_size: int = 64 * 1024) -> BoundedProcessResult:
+    """
+    Run a command and stream its stdout and stderr in chunks into BoundedOutput buffers, so a command with huge output
+    never needs more than memory_threshold bytes of memory per stream. watch wraps the wait for the process (e.g. to terminate it on cancellation)
+    """
+    stdout = BoundedOutput(memory_threshold, max_bytes)
+    stderr = BoundedOutput(memory_threshold, max_bytes)
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        with (watch or nullcontext)(process):
+            ## Read stderr on its own thread so neither pipe can fill up and block the process
+            stderr_reader = threading.Thread(target=_drain, args=(process.stderr, stderr, chunk_size), daemon=True)
+            stderr_reader.start()
+            _drain(process.stdout, stdout, chunk_size)
+            stderr_reader.join()
+            process.wait()
+        return BoundedProcessResult(cmd, process.returncode, stdout.text(), stderr.text(), stdout.dropped, stderr.dropped)
+    finally:
+        stdout.close()
+        stderr.close()
@@ -0,0 +1,33 @@
+from sparrow.machine.output import BoundedOutput
+from sparrow.machine import system
+import sys
+
+class TestBoundedOutput():
+
+    def test_keeps_everything_under_the_cap(self):
+        output = BoundedOutput(memory_threshold=4, max_bytes=100)
+        for chunk in [b'hello ', b'streamed ', b'world']:
+            output.write(chunk)
+
+        assert output.text() == 'hello streamed world'
+        assert output.dropped == 0
+
+    def test_keeps_head_and_tail_over_the_cap(self):
+        """
+        Test that once the cap is hit the first and last halves are kept and the dropped bytes are reported.
+        """
+        output = BoundedOutput(memory_threshold=4, max_bytes=10)
+        for index in range(26):
+            output.write(bytes([ord('a') + index]))
+
+        assert output.dropped == 16
+        assert output.text() == 'abcde\n\n... 16 bytes of output were dropped ...\n\nvwxyz'
+
+    def test_run_bounded_streams_large_output(self):
+        script = "import sys; sys.stdout.write('x' * 1000000 + 'end'); sys.stderr.write('warning')"
+        result = system.run_bounded([sys.executable, '-c', script], memory_threshold=1024, max_bytes=2048)
+
+        assert result.returncode == 0
+        assert result.stdout.endswith('x' * 1021 + 'end')
+        assert result.stdout_dropped == 1000003 - 2048
+        assert result.stderr == 'warning'
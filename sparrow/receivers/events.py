@@ -21,6 +21,7 @@ class MergeRequest:
     id: int
     sha: str
     ref_name: str
+    target_branch: str = None
 
 @dataclass
 class Repo:
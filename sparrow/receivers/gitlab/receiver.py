@@ -41,7 +41,8 @@ class GitlabReceiver(IReceiver):
                 mr = MergeRequest(
                     id = webhook_event.object_attributes.iid,
                     sha=webhook_event.object_attributes.last_commit.sha,
-                    ref_name=webhook_event.object_attributes.source_branch
+                    ref_name=webhook_event.object_attributes.source_branch,
+                    target_branch=webhook_event.object_attributes.target_branch
                 )
 
                 repo = Repo(
@@ -81,7 +82,8 @@ class GitlabReceiver(IReceiver):
                 mr = MergeRequest(
                     id = webhook_event.merge_request.iid,
                     sha=webhook_event.merge_request.last_commit.sha,
-                    ref_name=webhook_event.merge_request.source_branch
+                    ref_name=webhook_event.merge_request.source_branch,
+                    target_branch=webhook_event.merge_request.target_branch
                 )
 
                 repo = Repo(
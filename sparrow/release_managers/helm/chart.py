@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import os
+import yaml
+
+from sparrow.cache.lru import LRUCache
+
+## Use libyaml when PyYAML was built with it
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_cache = LRUCache(max_size=256)
+
+
+@dataclass(frozen=True)
+class ChartDependency:
+    name: str
+    version: Optional[str] = None
+    repository: Optional[str] = None
+    alias: Optional[str] = None
+    condition: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ChartMetadata:
+    '''The fields of a Chart.yaml that Sparrow uses'''
+    name: str
+    version: Optional[str]
+    namespace: str
+    release_name: str
+    dependencies: Tuple[ChartDependency, ...]
+
+
+def load_chart_metadata(chart_path: str) -> ChartMetadata:
+    '''
+    Read chart_path/Chart.yaml once and return its metadata.
+    Results are cached by the file's path, mtime and size so unchanged charts are never parsed twice
+    '''
+    yaml_file = f'{chart_path}/Chart.yaml'
+    try:
+        stat = os.stat(yaml_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Could not find the Chart.yaml file at {yaml_file}")
+
+    key = (yaml_file, stat.st_mtime_ns, stat.st_size)
+    if metadata := _cache.get(key):
+        return metadata
+
+    with open(yaml_file, 'r') as file:
+        chart_data = yaml.load(file, Loader=_Loader) or {}
+
+    metadata = ChartMetadata(
+        name=chart_data.get('name'),
+        version=chart_data.get('version'),
+        namespace=chart_data.get('namespace', 'default'),
+        release_name=chart_data.get('releaseName') or chart_data.get('name'),
+        dependencies=tuple(
+            ChartDependency(
+                name=dependency.get('name'),
+                version=dependency.get('version'),
+                repository=dependency.get('repository'),
+                alias=dependency.get('alias'),
+                condition=dependency.get('condition')
+            )
+            for dependency in chart_data.get('dependencies') or []
+        )
+    )
+    _cache.set(key, metadata)
+    return metadata
@@ -0,0 +1,131 @@
+from typing import Callable, Dict, Optional
+import dataclasses
+import threading
+import hashlib
+import shutil
+import json
+import yaml
+import os
+
+from sparrow.cache.lru import LRUCache
+from sparrow.machine import system
+from sparrow.logger import logger
+from sparrow.telemetry import metrics
+from sparrow.release_managers.helm.chart import ChartMetadata, load_chart_metadata
+
+
+def _linkOrCopy(src: str, dst: str):
+    '''Hardlink a cached file into a checkout, falling back to a copy across filesystems'''
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class DependencyCache:
+    '''
+        A content addressed store of resolved chart dependencies (the charts/ directory) shared by every checkout.
+        Entries are keyed by the digest of the chart's Chart.lock together with the dependencies declared in Chart.yaml, so
+        a dependency bumped in Chart.yaml without regenerating the lock never reuses the old charts/. Charts without a
+        Chart.lock, or with one that does not match Chart.yaml, are always resolved with helm
+        A hit links the stored charts/ directory into the checkout instead of calling helm, a miss resolves the
+        dependencies once and stores the result. A chart path is only resolved again once its charts/ directory is gone,
+        e.g. when the checkout was evicted and checked out again
+    '''
+    def __init__(self, cache_dir: str, resolve: Callable[[str], bool]):
+        self.cache_dir = cache_dir
+        self._resolve = resolve
+        self._lock = threading.Lock()
+        self._chart_locks: Dict[str, threading.Lock] = {}
+        self._resolved = LRUCache(max_size=1024)
+
+    def _getChartLock(self, chart_path: str) -> threading.Lock:
+        with self._lock:
+            return self._chart_locks.setdefault(chart_path, threading.Lock())
+
+    def _isConsistent(self, metadata: ChartMetadata, lock: dict) -> bool:
+        '''Whether a Chart.lock locks exactly the dependencies declared in Chart.yaml, at the declared version when it is exact'''
+        locked = {(dependency.get('name'), dependency.get('repository')): dependency.get('version') for dependency in lock.get('dependencies') or []}
+        declared = {(dependency.name, dependency.repository): dependency.version for dependency in metadata.dependencies}
+        if locked.keys() != declared.keys():
+            return False
+        return all(
+            locked[key] == version for key, version in declared.items()
+            if version and not any(operator in version for operator in '^~<>=*xX|, ')
+        )
+
+    def _digest(self, chart_path: str) -> Optional[str]:
+        '''Return the cache key of a chart's dependencies. None if they cannot be cached (e.g. local file:// charts or no usable Chart.lock)'''
+        metadata = load_chart_metadata(chart_path)
+        if any((dependency.repository or '').startswith('file://') for dependency in metadata.dependencies):
+            return None
+
+        lock_file = f'{chart_path}/Chart.lock'
+        if not system.file_exists(lock_file):
+            return None
+        with open(lock_file, 'rb') as file:
+            lock_content = file.read()
+        try:
+            lock = yaml.safe_load(lock_content) or {}
+        except yaml.YAMLError:
+            return None
+        if not isinstance(lock, dict) or not self._isConsistent(metadata, lock):
+            logger.info(f"Chart.lock of {chart_path} does not match the dependencies in Chart.yaml")
+            return None
+
+        dependencies = [dataclasses.asdict(dependency) for dependency in metadata.dependencies]
+        return hashlib.sha256(json.dumps({
+            'lock': hashlib.sha256(lock_content).hexdigest(),
+            'dependencies': dependencies
+        }, sort_keys=True).encode()).hexdigest()
+
+    def _materialize(self, entry: str, chart_path: str):
+        charts_dir = f'{chart_path}/charts'
+        system.create_dir(charts_dir)
+        shutil.copytree(entry, charts_dir, copy_function=_linkOrCopy, dirs_exist_ok=True)
+
+    def _store(self, entry: str, chart_path: str):
+        charts_dir = f'{chart_path}/charts'
+        if not system.dir_exists(charts_dir):
+            return
+        ## Copy next to the entry and rename it into place so readers never see a partial entry
+        staging = f'{entry}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copytree(charts_dir, staging)
+        os.rename(staging, entry)
+
+    def ensure(self, chart_path: str) -> bool:
+        '''Make sure the dependencies of the chart are present in its charts/ directory. Returns whether that succeeded'''
+        metadata = load_chart_metadata(chart_path)
+        if not metadata.dependencies:
+            return True
+
+        with self._getChartLock(chart_path):
+            ## The checkout may have been removed and checked out again since, without its charts/
+            if chart_path in self._resolved and system.dir_exists(f'{chart_path}/charts'):
+                return True
+
+            key = self._digest(chart_path)
+            if key is None:
+                logger.debug(f"Dependencies of {chart_path} cannot be cached. Resolving with helm")
+                resolved = self._resolve(chart_path)
+            else:
+                entry = system.join_paths(self.cache_dir, key)
+                ## Builds of the same dependency set wait for each other, distinct sets run in parallel
+                with system.file_lock(f'{entry}.lock'):
+                    if system.dir_exists(entry):
+                        logger.debug(f"Dependency cache hit for {chart_path} ({key})")
+                        self._materialize(entry, chart_path)
+                        metrics.increment('helm_dependency_cache_hit')
+                        resolved = True
+                    else:
+                        logger.debug(f"Dependency cache miss for {chart_path} ({key})")
+                        metrics.increment('helm_dependency_cache_miss')
+                        resolved = self._resolve(chart_path)
+                        if resolved:
+                            self._store(entry, chart_path)
+
+            if resolved:
+                self._resolved.set(chart_path, True)
+            return resolved
@@ -0,0 +1,57 @@
+from typing import List, Optional
+import hashlib
+import json
+import os
+
+from sparrow.cache.interface import ICache
+from sparrow.machine import system
+from sparrow.telemetry import metrics
+
+
+def chart_digest(chart_path: str) -> str:
+    '''Hash every file of a chart, including the resolved dependencies in its charts/ directory'''
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(chart_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(path, chart_path).encode())
+            digest.update(b'\0')
+            with open(path, 'rb') as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+class DiffCache:
+    '''
+        Cached helm diff output.
+        helm diff compares the rendered chart with the manifest stored in the live release, so the output is fully
+        determined by the chart content, the values, where the release lives and the release revision it was diffed against
+    '''
+    def __init__(self, backend: ICache, context_lines: str):
+        self.backend = backend
+        self.context_lines = context_lines
+
+    def key(self, chart_path: str, release_name: str, namespace: str, values_files: List[str], cluster: str, revision: str) -> str:
+        values = []
+        for values_file in values_files:
+            with open(system.join_paths(chart_path, values_file), 'rb') as file:
+                values.append([values_file, hashlib.sha256(file.read()).hexdigest()])
+
+        return hashlib.sha256(json.dumps({
+            'chart': chart_digest(chart_path),
+            'values': values,
+            'namespace': namespace,
+            'release': release_name,
+            'cluster': cluster,
+            'revision': revision,
+            'context': self.context_lines
+        }, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        metrics.increment('helm_diff_cache_hit' if value is not None else 'helm_diff_cache_miss')
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, diff: str):
+        self.backend.set(key, diff.encode())
@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+import hashlib
+import io
+import re
+
+from sparrow.cache.lru import LRUCache
+
+## The line helm diff starts the changes of every resource with, e.g. "default, web, Deployment (apps) has changed:"
+_HEADER = re.compile(r'^(?P<namespace>[^,\s]*), (?P<name>[^,\s]+), (?P<kind>[^,\s]+)(?: \([^)]*\))? (?P<action>has changed|has been added|has been removed|changed ownership):?$')
+_ANSI = re.compile(r'\x1b\[[0-9;]*m')
+
+_cache = LRUCache(max_size=256)
+
+
+@dataclass
+class ResourceChange:
+    '''
+    The changes helm diff reports for one resource. In a changed resource, a removed line directly followed by an added
+    line counts as one changed line
+    '''
+    kind: str
+    name: str
+    namespace: str
+    action: str
+    added: int = 0
+    removed: int = 0
+    changed: int = 0
+
+
+@dataclass(frozen=True)
+class DiffSummary:
+    resources: Tuple[ResourceChange, ...]
+
+    @property
+    def added(self) -> int:
+        return sum(resource.added for resource in self.resources)
+
+    @property
+    def removed(self) -> int:
+        return sum(resource.removed for resource in self.resources)
+
+    @property
+    def changed(self) -> int:
+        return sum(resource.changed for resource in self.resources)
+
+
+def parse_diff(lines: Iterable[str]) -> Iterator[ResourceChange]:
+    '''Parse helm diff output line by line and yield a record for every resource once its changes are counted'''
+    resource: Optional[ResourceChange] = None
+    ## Removed lines that a following added line can still pair up with
+    unpaired = 0
+    for line in lines:
+        line = _ANSI.sub('', line.rstrip('\r\n'))
+        if match := _HEADER.match(line):
+            if resource:
+                yield resource
+            resource = ResourceChange(kind=match['kind'], name=match['name'], namespace=match['namespace'], action=match['action'])
+            unpaired = 0
+        elif resource is None:
+            continue
+        elif line.startswith('-'):
+            resource.removed += 1
+            unpaired += 1
+        elif line.startswith('+'):
+            if unpaired and resource.action == 'has changed':
+                unpaired -= 1
+                resource.removed -= 1
+                resource.changed += 1
+            else:
+                resource.added += 1
+        else:
+            unpaired = 0
+    if resource:
+        yield resource
+
+
+def summarize_diff(diff: str) -> DiffSummary:
+    '''Summarize helm diff output. Summaries are cached by content since the same diff is rendered on every comment update'''
+    digest = hashlib.sha256(diff.encode()).digest()
+    if (summary := _cache.get(digest)) is not None:
+        return summary
+    summary = DiffSummary(resources=tuple(parse_diff(io.StringIO(diff))))
+    _cache.set(digest, summary)
+    return summary
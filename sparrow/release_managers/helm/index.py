@@ -0,0 +1,67 @@
+from typing import Iterable, List, Optional
+import os
+import git
+
+from sparrow.cache.lru import LRUCache
+from sparrow.logger import logger
+
+
+class ChartIndex:
+    '''
+        A path trie of every Helm chart root in a checkout.
+        A chart root is a directory containing a Chart.yaml file and a templates/ directory. Paths are resolved to the
+        deepest chart that contains them by walking their components, without touching the filesystem
+    '''
+    _CHART = '/'  # Cannot clash with a path component
+    _cache = LRUCache(max_size=64)
+
+    def __init__(self, chart_roots: Iterable[str]):
+        self._trie = {}
+        self.chart_roots: List[str] = []
+        for chart_root in chart_roots:
+            node = self._trie
+            for part in ChartIndex._split(chart_root):
+                node = node.setdefault(part, {})
+            node[ChartIndex._CHART] = chart_root
+            self.chart_roots.append(chart_root)
+
+    @staticmethod
+    def _split(path: str) -> List[str]:
+        return [part for part in path.split('/') if part and part != '.']
+
+    @classmethod
+    def build(cls, repo_path: str) -> 'ChartIndex':
+        '''Walk the checkout once and index every chart root relative to repo_path'''
+        chart_roots = []
+        for dirpath, dirnames, filenames in os.walk(repo_path):
+            if '.git' in dirnames:
+                dirnames.remove('.git')
+            if 'Chart.yaml' in filenames and 'templates' in dirnames:
+                chart_roots.append(os.path.relpath(dirpath, repo_path).replace(os.sep, '/'))
+        logger.debug(f"Indexed {len(chart_roots)} charts in {repo_path}")
+        return cls(chart_roots)
+
+    @classmethod
+    def forCheckout(cls, repo_path: str) -> 'ChartIndex':
+        '''Return the index of a checkout, reusing the one built for any earlier checkout of the same git tree'''
+        try:
+            tree_sha = git.Repo(repo_path).head.commit.tree.hexsha
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError, ValueError):
+            return cls.build(repo_path)
+
+        if index := cls._cache.get(tree_sha):
+            return index
+        index = cls.build(repo_path)
+        cls._cache.set(tree_sha, index)
+        return index
+
+    def resolve(self, path: str) -> Optional[str]:
+        '''Return the root of the deepest chart containing path (relative to the repo), or None'''
+        node = self._trie
+        chart_root = node.get(ChartIndex._CHART)
+        for part in ChartIndex._split(path):
+            node = node.get(part)
+            if node is None:
+                break
+            chart_root = node.get(ChartIndex._CHART, chart_root)
+        return chart_root
@@ -3,57 +3,142 @@ from sparrow.machine import system
 from sparrow.machine import enum as machine_enum
 from sparrow.logger import logger
 from sparrow.release_managers.helm import enum, plugins
+from sparrow.release_managers.helm.index import ChartIndex
+from sparrow.release_managers.helm.dependencies import DependencyCache
+from sparrow.release_managers.helm.repositories import RepositoryIndexCache
+from sparrow.release_managers.helm.diffcache import DiffCache, chart_digest
+from sparrow.release_managers.helm.manifests import diff_manifests
+from sparrow.cache.factory import CacheFactory
+from sparrow.telemetry import metrics
+from sparrow.jobs import cancellation
+from sparrow.jobs.exceptions import JobCancelledError
 import subprocess
 from sparrow.vcs.models import MergeRequestDiff
-from typing import List
-from sparrow.settings import DIFF_CONTEXT
+from typing import Dict, Iterable, List, Optional
+from sparrow.settings import DIFF_CONTEXT, HELM_DEPENDENCY_CACHE_DIR, HELM_REPOSITORY_CACHE_DIR, HELM_REPOSITORY_INDEX_TTL
+from sparrow.settings import DIFF_CACHE_BACKEND, DIFF_CACHE_DIR, DIFF_CACHE_MAX_BYTES
+from sparrow.settings import HELM_OUTPUT_MEMORY_BYTES, HELM_OUTPUT_MAX_BYTES
+import json
+import os
+from sparrow.cloudproviders.models import KubeContext
 
 
 class Helm:
     BASE_INSTALL_URL = "https://get.helm.sh"
+    NO_CHANGES = "No changes for the chart in this environment were detected. Everything is up to date."
 
     def __init__(self, version, bin_path: str):
         self.version = version
         self.bin_path = bin_path
+        self._dependencies = DependencyCache(cache_dir=HELM_DEPENDENCY_CACHE_DIR, resolve=self._updateChartDependencies)
+        self._repositories = RepositoryIndexCache(cache_dir=HELM_REPOSITORY_CACHE_DIR, ttl=HELM_REPOSITORY_INDEX_TTL)
+        self._diffs = DiffCache(CacheFactory(DIFF_CACHE_BACKEND, directory=DIFF_CACHE_DIR, max_bytes=DIFF_CACHE_MAX_BYTES), context_lines=DIFF_CONTEXT)
         self._installVersion()
         plugins.HelmDiff.install()
 
-    def _getChartDependencies(self, chart_path: str) -> List[str]:
-        '''Get the dependencies of a Helm chart'''
+    def _getChartDependencies(self, chart_path: str) -> bool:
+        '''Get the dependencies of a Helm chart from the dependency cache, resolving them with helm on a miss'''
+        return self._dependencies.ensure(chart_path)
+
+    def _run(self, cmd: List[str], env: dict) -> system.BoundedProcessResult:
+        '''
+        Run a helm command, streaming its output into bounded buffers that spill to disk.
+        It is terminated if the job running it is cancelled
+        '''
+        result = system.run_bounded(cmd, env=env, memory_threshold=HELM_OUTPUT_MEMORY_BYTES, max_bytes=HELM_OUTPUT_MAX_BYTES, watch=cancellation.tracked)
+        if result.stdout_dropped or result.stderr_dropped:
+            logger.warning(f"Dropped {result.stdout_dropped} bytes of stdout and {result.stderr_dropped} bytes of stderr from: {' '.join(cmd)}")
+        return result
+
+    def _runDependencyUpdate(self, chart_path: str, refresh: bool) -> system.BoundedProcessResult:
         cmd = ['helm', 'dependency', 'update', chart_path]
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        stdout, stderr = process.communicate()
+        if not refresh:
+            cmd.append('--skip-refresh')
+        return self._run(cmd, env=self._repositories.env())
+
+    def _updateChartDependencies(self, chart_path: str) -> bool:
+        '''
+        Resolve the dependencies of a Helm chart with helm, refreshing the repository indexes at most once per TTL.
+        A chart that cannot be resolved from fresh indexes fails without another refresh until the TTL expires
+        '''
+        if self._repositories.isFresh():
+            return self._resolveFromCachedIndexes(chart_path)
+
+        with self._repositories.refreshing() as stale:
+            ## Another worker may have refreshed the indexes while this one waited for the lock
+            if not stale:
+                return self._resolveFromCachedIndexes(chart_path)
+
+            process = self._runDependencyUpdate(chart_path, refresh=True)
+            metrics.increment('helm_repository_index_refresh')
+            ## Failed refreshes count too, otherwise every chart that cannot be resolved would refresh again
+            self._repositories.markRefreshed()
+            if process.returncode != 0:
+                logger.error(f"Error getting dependencies for chart {chart_path}. Error: {process.stderr}")
+                return False
+            return True
+
+    def _resolveFromCachedIndexes(self, chart_path: str) -> bool:
+        process = self._runDependencyUpdate(chart_path, refresh=False)
         if process.returncode != 0:
-            logger.error(f"Error getting dependencies for chart {chart_path}. Error: {stderr}")
+            logger.error(f"Error getting dependencies for chart {chart_path} from the repository indexes refreshed in the last {self._repositories.ttl}s. Error: {process.stderr}")
             return False
+        metrics.increment('helm_repository_index_hit')
         return True
 
-    def generateDiff(self, chart_path: str, release_name: str, namespace: str, values_files: List[str]) -> str:
+    def _getReleaseRevision(self, release_name: str, namespace: str, kube_context: KubeContext) -> Optional[str]:
+        '''
+        Return the revision of the live release, "unreleased" if it is not installed, or None if it could not be read.
+        helm history only returns the metadata of the revision, unlike helm status which includes the whole release
+        '''
+        cmd = ['helm', 'history', release_name, '--namespace', namespace, '--max', '1', '-o', 'json']
+        process = self._run(cmd, env=kube_context.env())
+        if process.returncode != 0:
+            if 'not found' in process.stderr:
+                return 'unreleased'
+            logger.debug(f"Could not read the revision of release {release_name} in {kube_context.cluster}/{namespace}: {process.stderr}")
+            return None
+        try:
+            return str(json.loads(process.stdout)[-1]['revision'])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+
+    def generateDiff(self, chart_path: str, release_name: str, namespace: str, values_files: List[str], kube_context: KubeContext) -> str:
         try:
             if not self._getChartDependencies(chart_path):
                 raise subprocess.CalledProcessError("Error getting chart dependencies")
 
+            ## Serve unchanged (chart, environment) pairs from the diff cache. Without a known revision the diff is not cached
+            cache_key = None
+            if revision := self._getReleaseRevision(release_name, namespace, kube_context):
+                cache_key = self._diffs.key(chart_path, release_name, namespace, values_files, kube_context.cluster, revision)
+                if (cached := self._diffs.get(cache_key)) is not None:
+                    logger.debug(f"Using cached diff of release {release_name} at revision {revision} in {kube_context.cluster}/{namespace}")
+                    return cached
+
             cmd=['helm', 'diff', 'upgrade', release_name, chart_path, '--allow-unreleased', '--namespace', namespace, '-C', DIFF_CONTEXT]
             for values_file in values_files:
                 cmd.extend(['-f', f"{chart_path}/{values_file}"])
             
             logger.debug(f"Running diff command: {' '.join(cmd)}")
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-      
-            # Capture stdout and stderr
-            stdout_output, stderr_output = process.communicate()
-
-            # # Join the output lists into strings
-            stdout_output = ''.join(stdout_output).strip()
-            stderr_output = ''.join(stderr_output).strip()
+            process = self._run(cmd, env=kube_context.env())
+            stdout_output = process.stdout.strip()
+            stderr_output = process.stderr.strip()
             
             # logger.debug(f"Diff command output: {stdout_output}")
             # logger.debug(f"Diff command error: {stderr_output}")
 
             if not stdout_output and not stderr_output:
-                return "No changes for the chart in this environment were detected. Everything is up to date." 
-            
-            return stderr_output if stderr_output else stdout_output
+                diff = Helm.NO_CHANGES
+            else:
+                diff = stderr_output if stderr_output else stdout_output
+
+            ## Only clean diffs are cached so errors and warnings are retried on the next event
+            if cache_key and process.returncode == 0 and not stderr_output:
+                self._diffs.set(cache_key, diff)
+            return diff
+        except JobCancelledError:
+            raise
         except subprocess.CalledProcessError as e:
             logger.error(f"Error generating diff: {e}")
             return None
@@ -61,7 +146,54 @@ class Helm:
             logger.error(f"Error generating diff: {e}")
             return None
         
-    def performUpgradeOrInstall(self, chart_path: str, release_name: str, namespace: str, values_files: List[str]) -> str:
+    def _template(self, chart_path: str, release_name: str, namespace: str, values_files: List[str]) -> system.BoundedProcessResult:
+        '''Render the manifests of a chart locally. Values files the chart does not have (e.g. at the base of a new environment) are skipped'''
+        cmd = ['helm', 'template', release_name, chart_path, '--namespace', namespace]
+        for values_file in values_files:
+            if system.file_exists(f"{chart_path}/{values_file}"):
+                cmd.extend(['-f', f"{chart_path}/{values_file}"])
+        logger.debug(f"Running template command: {' '.join(cmd)}")
+        return self._run(cmd, env=os.environ)
+
+    def generateRenderDiff(self, base_chart_path: Optional[str], chart_path: str, release_name: str, namespace: str, values_files: List[str]) -> str:
+        '''
+        Diff the chart as rendered at the base of the merge request against the chart as rendered at its head.
+        Nothing is read from the cluster, so no credentials are needed. A chart missing at the base is diffed against nothing
+        '''
+        try:
+            for path in filter(None, [base_chart_path, chart_path]):
+                if not self._getChartDependencies(path):
+                    logger.error(f"Error getting the dependencies of chart {path}")
+                    return None
+
+            ## Both renders are determined by the content of the two charts
+            base = f"render:{chart_digest(base_chart_path)}" if base_chart_path else "render:none"
+            cache_key = self._diffs.key(chart_path, release_name, namespace, values_files, "", base)
+            if (cached := self._diffs.get(cache_key)) is not None:
+                return cached
+
+            renders = {}
+            for label, path in (('base', base_chart_path), ('head', chart_path)):
+                if not path:
+                    renders[label] = ""
+                    continue
+                process = self._template(path, release_name, namespace, values_files)
+                ## A truncated render would show up as removed resources
+                if process.returncode != 0 or process.stdout_dropped:
+                    ## stdout holds the rendered manifests, Secrets included, so only stderr is shown
+                    return f"Could not render the chart at the {label} of the merge request:\n{process.stderr.strip()}"
+                renders[label] = process.stdout
+
+            diff = diff_manifests(renders['base'], renders['head'], namespace, context=int(DIFF_CONTEXT)) or Helm.NO_CHANGES
+            self._diffs.set(cache_key, diff)
+            return diff
+        except JobCancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating render diff: {e}")
+            return None
+
+    def performUpgradeOrInstall(self, chart_path: str, release_name: str, namespace: str, values_files: List[str], kube_context: KubeContext) -> str:
         try:
             if not self._getChartDependencies(chart_path):
                 raise subprocess.CalledProcessError("Error getting chart dependencies")
@@ -71,14 +203,9 @@ class Helm:
                 cmd.extend(['-f', f"{chart_path}/{values_file}"])
             
             logger.debug(f"Running apply command: {' '.join(cmd)}")
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-      
-            # Capture stdout and stderr
-            stdout_output, stderr_output = process.communicate()
-
-            # # Join the output lists into strings
-            stdout_output = ''.join(stdout_output).strip()
-            stderr_output = ''.join(stderr_output).strip()
+            process = self._run(cmd, env=kube_context.env())
+            stdout_output = process.stdout.strip()
+            stderr_output = process.stderr.strip()
             
             logger.debug(f"Apply command output: {stdout_output}")
             logger.debug(f"Apply command error: {stderr_output}")
@@ -87,6 +214,8 @@ class Helm:
                 return "" 
             
             return stderr_output if stderr_output else stdout_output
+        except JobCancelledError:
+            raise
         except subprocess.CalledProcessError as e:
             logger.error(f"Error calling apply: {e}")
             return None
@@ -94,76 +223,29 @@ class Helm:
             logger.error(f"Error running apply: {e}")
             return None
 
-    def fileIsInChartDirectory(self, file_path, root_dir) -> str:
-        '''Check if the file is in a Helm chart directory. If so return the root directory of the chart. Otherwise return None'''
-        if file_path == '':
-            return None
-        
-        if file_path == root_dir:
-            ## Stop recursion
-            return file_path if self.isHelmChartDirectory(file_path) else None
-        
-        ## Recurse up the directory tree
-        if self.isHelmChartDirectory(file_path):
-            return file_path
-        else:
-            return self.fileIsInChartDirectory(file_path=system.get_parent_dir(file_path), root_dir=root_dir)
-    
-    def isHelmChartDirectory(self, dir_path: str) -> bool :
-        # Define required files and directories for a basic Helm chart
-        required_files = ['Chart.yaml']
-        required_dirs = ['templates']
-
-        logger.debug(f"Checking if {dir_path} is a helm chart directory")
-        
-        # Check if the directory exists
-        if not system.dir_exists(dir_path):
-            logger.debug(f"Directory {dir_path} does not exist")
-            return False
-        
-        # Check for required files
-        for file in required_files:
-            file_path = system.join_paths(dir_path, file)
-            if not system.file_exists(file_path):
-                logger.debug(f"Required file {file_path} does not exist")
-                return False
-        
-        # Check for required directories
-        for dir in required_dirs:
-            dir_path = system.join_paths(dir_path, dir)
-            if not system.dir_exists(dir_path):
-                logger.debug(f"Required dir {file_path} does not exist")
-                return False
-        
-        return True
+    def detectChangedFiles(self, repo_path: str, diffs: Iterable[MergeRequestDiff]) -> Dict[str, List[str]]:
+        '''Map the path of every changed helm chart to the files changed in it, relative to the chart root. Charts keep the order they were first changed in'''
+        index = ChartIndex.forCheckout(repo_path)
 
-    def detectChangedReleases(self, repo_path: str, diffs: List[MergeRequestDiff]) -> List[str]:
-        '''Detect if any of the changed files from the list of diffs are in a helm chart directory. Return a list of paths to changed helm charts'''
-        changed_charts_paths = []
+        changed_files: Dict[str, List[str]] = {}
         for diff in diffs:
-            old_path = system.join_paths(repo_path, diff.old_path) 
-            new_path = system.join_paths(repo_path, diff.new_path)
-
-            ## If multiple files are changed in the same chart and this path is a child of a chart path, skip it
-            new_path_is_under_known_chart_path = any(changed_charts_path in new_path for changed_charts_path in changed_charts_paths)
-            old_path_is_under_known_chart_path = any(changed_charts_path in old_path for changed_charts_path in changed_charts_paths)
-            if  new_path_is_under_known_chart_path or old_path_is_under_known_chart_path:
-                logger.info(f"Already detected changes detected in this chart path. Skipping...")
-                continue
-            
-            ## Check the new file path
-            if chart_root := self.fileIsInChartDirectory(file_path=new_path, root_dir=repo_path):
-                changed_charts_paths.append(chart_root)
-            else:
-                logger.info(f"Modified Path {diff.new_path} is not in a helm chart directory")
-            
-            ## If the file has an old path that is diff from new_path, check if it was a helm chart directory
-            if old_path != new_path:
-                if chart_root := self.fileIsInChartDirectory(file_path=old_path, root_dir=repo_path):
-                    changed_charts_paths.append(chart_root)
+            ## Check the new file path and, if the file was moved, the old one
+            paths = [diff.new_path] if diff.old_path == diff.new_path else [diff.new_path, diff.old_path]
+            for path in paths:
+                if (chart_root := index.resolve(path)) is not None:
+                    chart_path = system.join_paths(repo_path, chart_root) if chart_root != '.' else repo_path
+                    files = changed_files.setdefault(chart_path, [])
+                    relative_path = os.path.relpath(path, chart_root)
+                    if relative_path not in files:
+                        files.append(relative_path)
                 else:
-                    logger.info(f"Old Path {diff.old_path} is not in a helm chart directory")
-        return changed_charts_paths
+                    logger.info(f"Modified Path {path} is not in a helm chart directory")
+
+        return changed_files
+
+    def detectChangedReleases(self, repo_path: str, diffs: Iterable[MergeRequestDiff]) -> List[str]:
+        '''Detect if any of the changed files from the list of diffs are in a helm chart directory. Return a list of paths to changed helm charts'''
+        return list(self.detectChangedFiles(repo_path, diffs))
 
 
     def _ensureVersion(self) -> bool:
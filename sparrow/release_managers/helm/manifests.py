@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import binascii
+import difflib
+import base64
+import re
+import yaml
+
+## Use libyaml when PyYAML was built with it
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_DOCUMENT = re.compile(r'^---\s*$', re.MULTILINE)
+
+## (namespace, name, kind) identifies a resource the way helm diff does
+ResourceKey = Tuple[str, str, str]
+
+
+def split_manifests(manifests: str, namespace: str) -> Dict[ResourceKey, Tuple[str, str]]:
+    '''
+    Split the output of helm template into its resources, in order. Maps every resource to its header (in the format of
+    helm diff) and its manifest. Resources without a namespace are in the release namespace
+    '''
+    resources: OrderedDict = OrderedDict()
+    for document in _DOCUMENT.split(manifests):
+        content = yaml.load(document, Loader=_Loader)
+        if not isinstance(content, dict) or not content.get('kind'):
+            continue
+        metadata = content.get('metadata') or {}
+        key = (metadata.get('namespace') or namespace, f"{metadata.get('name')}", content['kind'])
+        api_version = f"{content.get('apiVersion', '')}"
+        group = api_version.split('/')[0] if '/' in api_version else api_version
+        resources[key] = (f"{key[0]}, {key[1]}, {key[2]} ({group})", document.strip('\n'))
+    return resources
+
+
+def _diffLines(before: List[str], after: List[str], context: int) -> List[str]:
+    matcher = difflib.SequenceMatcher(a=before, b=after, autojunk=False)
+    ## A negative context shows every line, like helm diff -C -1
+    groups = [matcher.get_opcodes()] if context < 0 else list(matcher.get_grouped_opcodes(context))
+    lines = []
+    for number, group in enumerate(groups):
+        if number:
+            lines.append('...')
+        for tag, before_start, before_end, after_start, after_end in group:
+            if tag == 'equal':
+                lines.extend(f"  {line}" for line in before[before_start:before_end])
+                continue
+            lines.extend(f"- {line}" for line in before[before_start:before_end])
+            lines.extend(f"+ {line}" for line in after[after_start:after_end])
+    return lines
+
+
+def _secretData(content: dict) -> Dict[str, bytes]:
+    '''Return the decoded values of a Secret. stringData wins over data like it does in the API server'''
+    values = {}
+    for key, value in (content.get('data') or {}).items():
+        try:
+            values[key] = base64.b64decode(f"{value}", validate=True)
+        except (binascii.Error, ValueError):
+            values[key] = f"{value}".encode()
+    for key, value in (content.get('stringData') or {}).items():
+        values[key] = f"{value}".encode()
+    return values
+
+
+def _redactSecrets(before: Optional[str], after: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    '''
+    Replace the values of a Secret with markers the way helm diff does, so the diff shows which keys changed and their
+    sizes but never their contents
+    '''
+    contents = [yaml.load(manifest, Loader=_Loader) if manifest is not None else None for manifest in (before, after)]
+    values = [_secretData(content) if content is not None else {} for content in contents]
+    masked = []
+    for index, marker in enumerate(('--------', '++++++++')):
+        if contents[index] is None:
+            masked.append(None)
+            continue
+        other = values[1 - index]
+        content = {key: value for key, value in contents[index].items() if key not in ('data', 'stringData')}
+        if values[index]:
+            content['data'] = {
+                key: f"{'REDACTED' if other.get(key) == value else marker} # ({len(value)} bytes)" for key, value in values[index].items()
+            }
+        masked.append(yaml.safe_dump(content, sort_keys=False).strip('\n'))
+    return masked[0], masked[1]
+
+
+def diff_manifests(before: str, after: str, namespace: str, context: int) -> str:
+    '''
+    Diff two renders of a chart resource by resource and return the changes in the output format of helm diff.
+    Returns an empty string when nothing changed
+    '''
+    before_resources = split_manifests(before, namespace)
+    after_resources = split_manifests(after, namespace)
+    output = []
+    for key in [*after_resources, *(key for key in before_resources if key not in after_resources)]:
+        header = (after_resources.get(key) or before_resources[key])[0]
+        before_manifest = before_resources[key][1] if key in before_resources else None
+        after_manifest = after_resources[key][1] if key in after_resources else None
+        if before_manifest == after_manifest:
+            continue
+        ## Like helm diff, never show the contents of a Secret
+        if key[2] == 'Secret':
+            before_manifest, after_manifest = _redactSecrets(before_manifest, after_manifest)
+            if before_manifest == after_manifest:
+                continue
+
+        if before_manifest is None:
+            output.append(f"{header} has been added:")
+        elif after_manifest is None:
+            output.append(f"{header} has been removed:")
+        else:
+            output.append(f"{header} has changed:")
+        output.extend(_diffLines(before_manifest.splitlines() if before_manifest is not None else [],
+                                 after_manifest.splitlines() if after_manifest is not None else [], context))
+    return '\n'.join(output)
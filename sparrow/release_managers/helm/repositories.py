@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from typing import Iterator
+import time
+import os
+
+from sparrow.machine import system
+
+
+class RepositoryIndexCache:
+    '''
+        A helm repository cache directory owned by Sparrow.
+        Repository indexes in it are refreshed at most once per ttl seconds. Refreshes are serialized with a file lock
+        across worker threads and processes, every other dependency resolution runs against the cached indexes
+    '''
+    STAMP = '.sparrow-refreshed'
+
+    def __init__(self, cache_dir: str, ttl: int):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def _stampPath(self) -> str:
+        return system.join_paths(self.cache_dir, RepositoryIndexCache.STAMP)
+
+    def env(self) -> dict:
+        '''Return an environment for a helm subprocess that uses this repository cache'''
+        return os.environ | {'HELM_REPOSITORY_CACHE': self.cache_dir}
+
+    def isFresh(self) -> bool:
+        try:
+            return time.time() - os.stat(self._stampPath()).st_mtime < self.ttl
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def refreshing(self) -> Iterator[bool]:
+        '''
+        Hold the refresh lock. Yields whether the indexes are still stale once the lock is held, so a caller that
+        waited on another refresh can use its result instead of refreshing again
+        '''
+        with system.file_lock(system.join_paths(self.cache_dir, '.refresh.lock')):
+            yield not self.isFresh()
+
+    def markRefreshed(self):
+        system.create_dir(self.cache_dir)
+        with open(self._stampPath(), 'a'):
+            pass
+        os.utime(self._stampPath())
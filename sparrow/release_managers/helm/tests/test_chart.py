@@ -0,0 +1,66 @@
+from sparrow.release_managers.helm.chart import ChartDependency, load_chart_metadata
+import os
+import pytest
+
+CHART = """name: app
+version: 0.1.0
+releaseName: web
+namespace: apps
+dependencies:
+  - name: redis
+    version: ^18.0.0
+    repository: https://charts.example.com
+    alias: cache
+    condition: redis.enabled
+  - name: common
+    repository: file://../common
+"""
+
+class TestLoadChartMetadata():
+
+    def _chart(self, tmp_path, content):
+        (tmp_path / 'Chart.yaml').write_text(content)
+        return str(tmp_path)
+
+    def test_reads_chart_fields_and_dependencies(self, tmp_path):
+        metadata = load_chart_metadata(self._chart(tmp_path, CHART))
+
+        assert (metadata.name, metadata.version, metadata.release_name, metadata.namespace) == ('app', '0.1.0', 'web', 'apps')
+        assert metadata.dependencies == (
+            ChartDependency(name='redis', version='^18.0.0', repository='https://charts.example.com', alias='cache', condition='redis.enabled'),
+            ChartDependency(name='common', repository='file://../common')
+        )
+
+    def test_defaults(self, tmp_path):
+        """
+        Test that the release is named after the chart and lives in the default namespace unless Chart.yaml says otherwise.
+        """
+        metadata = load_chart_metadata(self._chart(tmp_path, "name: app\n"))
+
+        assert (metadata.release_name, metadata.namespace, metadata.version, metadata.dependencies) == ('app', 'default', None, ())
+
+    def test_unchanged_chart_is_parsed_once(self, tmp_path, monkeypatch):
+        chart_path = self._chart(tmp_path, CHART)
+        first = load_chart_metadata(chart_path)
+        monkeypatch.setattr('sparrow.release_managers.helm.chart.yaml.load', lambda *args, **kwargs: pytest.fail("Chart.yaml parsed again"))
+
+        assert load_chart_metadata(chart_path) is first
+
+    def test_changed_chart_is_parsed_again(self, tmp_path):
+        """
+        Test that editing Chart.yaml invalidates the cached metadata, even when the file keeps its size.
+        """
+        chart_path = self._chart(tmp_path, "name: app\nversion: 0.1.0\n")
+        assert load_chart_metadata(chart_path).version == '0.1.0'
+
+        stat = os.stat(tmp_path / 'Chart.yaml')
+        self._chart(tmp_path, "name: app\nversion: 0.2.0\n")
+        os.utime(tmp_path / 'Chart.yaml', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        assert load_chart_metadata(chart_path).version == '0.2.0'
+
+        self._chart(tmp_path, "name: app\nversion: 0.10.0\n")
+        assert load_chart_metadata(chart_path).version == '0.10.0'
+
+    def test_missing_chart(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            load_chart_metadata(str(tmp_path))
@@ -0,0 +1,97 @@
+from pathlib import Path
+import shutil
+from sparrow.release_managers.helm.dependencies import DependencyCache
+from sparrow.telemetry import metrics
+
+CHART = """name: app
+version: 0.1.0
+dependencies:
+  - name: redis
+    version: {version}
+    repository: https://charts.example.com
+"""
+
+LOCK = """dependencies:
+- name: redis
+  repository: https://charts.example.com
+  version: {version}
+digest: sha256:abc
+"""
+
+class TestDependencyCache():
+
+    def _chart(self, tmp_path, name, version='1.0.0', locked='1.0.0'):
+        chart = tmp_path / name
+        chart.mkdir()
+        (chart / 'Chart.yaml').write_text(CHART.format(version=version))
+        if locked:
+            (chart / 'Chart.lock').write_text(LOCK.format(version=locked))
+        return chart
+
+    def _cache(self, tmp_path, resolved):
+        def resolve(chart_path):
+            resolved.append(chart_path)
+            (Path(chart_path) / 'charts').mkdir()
+            (Path(chart_path) / 'charts' / 'redis.tgz').write_text(f"resolved for {chart_path}")
+            return True
+        return DependencyCache(cache_dir=str(tmp_path / 'cache'), resolve=resolve)
+
+    def test_hit_reuses_resolved_charts(self, tmp_path):
+        """
+        Test that a second checkout of the same dependencies is served from the cache without calling helm.
+        """
+        resolved = []
+        cache = self._cache(tmp_path, resolved)
+        first, second = self._chart(tmp_path, 'first'), self._chart(tmp_path, 'second')
+
+        with metrics.job_metrics() as job_metrics:
+            assert cache.ensure(str(first))
+            assert cache.ensure(str(second))
+
+        assert resolved == [str(first)]
+        assert (second / 'charts' / 'redis.tgz').read_text() == f"resolved for {first}"
+        assert job_metrics.snapshot() == {'helm_dependency_cache_miss': 1, 'helm_dependency_cache_hit': 1}
+
+    def test_dependency_bump_without_lock_update_misses(self, tmp_path):
+        """
+        Test that changing the declared dependencies invalidates the entry even though Chart.lock is unchanged.
+        """
+        resolved = []
+        cache = self._cache(tmp_path, resolved)
+        first = self._chart(tmp_path, 'first', version='^1.0.0')
+        bumped = self._chart(tmp_path, 'bumped', version='^2.0.0')
+
+        cache.ensure(str(first))
+        cache.ensure(str(bumped))
+
+        assert resolved == [str(first), str(bumped)]
+
+    def test_missing_or_inconsistent_lock_is_not_cached(self, tmp_path):
+        resolved = []
+        cache = self._cache(tmp_path, resolved)
+        unlocked = self._chart(tmp_path, 'unlocked', locked=None)
+        stale = self._chart(tmp_path, 'stale', version='2.0.0', locked='1.0.0')
+
+        cache.ensure(str(unlocked))
+        cache.ensure(str(stale))
+
+        assert resolved == [str(unlocked), str(stale)]
+        assert not (tmp_path / 'cache').exists()
+
+    def test_recreated_checkout_gets_its_charts_back(self, tmp_path):
+        """
+        Test that a checkout evicted and checked out again at the same path has its charts/ restored from the cache.
+        """
+        resolved = []
+        cache = self._cache(tmp_path, resolved)
+        chart = self._chart(tmp_path, 'checkout')
+        assert cache.ensure(str(chart))
+
+        shutil.rmtree(chart)
+        chart = self._chart(tmp_path, 'checkout')
+        with metrics.job_metrics() as job_metrics:
+            assert cache.ensure(str(chart))
+
+        assert (chart / 'charts' / 'redis.tgz').read_text() == f"resolved for {chart}"
+        assert resolved == [str(chart)]
+        assert job_metrics.snapshot() == {'helm_dependency_cache_hit': 1}
@@ -0,0 +1,38 @@
+from sparrow.release_managers.helm.diffcache import DiffCache
+from sparrow.cache.memory import MemoryCache
+
+class TestDiffCache():
+
+    def _chart(self, tmp_path):
+        chart = tmp_path / 'chart'
+        (chart / 'templates').mkdir(parents=True)
+        (chart / 'Chart.yaml').write_text('name: chart\n')
+        (chart / 'templates' / 'deployment.yaml').write_text('kind: Deployment\n')
+        (chart / 'values-prod.yaml').write_text('replicas: 2\n')
+        return chart
+
+    def test_key_is_stable_for_unchanged_inputs(self, tmp_path):
+        chart = self._chart(tmp_path)
+        cache = DiffCache(MemoryCache(max_bytes=1024), context_lines='-1')
+        key = cache.key(str(chart), 'release', 'default', ['values-prod.yaml'], 'cluster', '3')
+
+        assert key == cache.key(str(chart), 'release', 'default', ['values-prod.yaml'], 'cluster', '3')
+        assert key != cache.key(str(chart), 'release', 'default', ['values-prod.yaml'], 'cluster', '4')
+        assert key != cache.key(str(chart), 'release', 'default', ['values-prod.yaml'], 'other-cluster', '3')
+
+    def test_key_changes_with_chart_and_dependency_content(self, tmp_path):
+        """
+        Test that editing a values file or a resolved dependency under charts/ invalidates cached diffs.
+        """
+        chart = self._chart(tmp_path)
+        cache = DiffCache(MemoryCache(max_bytes=1024), context_lines='-1')
+        key = lambda: cache.key(str(chart), 'release', 'default', ['values-prod.yaml'], 'cluster', '3')
+        original = key()
+
+        (chart / 'values-prod.yaml').write_text('replicas: 3\n')
+        edited = key()
+        assert edited != original
+
+        (chart / 'charts').mkdir()
+        (chart / 'charts' / 'dependency-1.0.0.tgz').write_bytes(b'dependency')
+        assert key() != edited
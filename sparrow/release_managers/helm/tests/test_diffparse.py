@@ -0,0 +1,37 @@
+from sparrow.release_managers.helm.diffparse import parse_diff, summarize_diff
+
+DIFF = """\x1b[33mdefault, web, Deployment (apps) has changed:\x1b[0m
+  # Source: app/templates/deployment.yaml
+  spec:
+-   replicas: 1
+-   paused: true
++   replicas: 2
+    template:
++     annotations: {}
+default, web, Service (v1) has been added:
++ apiVersion: v1
++ kind: Service
+default, old, ConfigMap (v1) has been removed:
+- apiVersion: v1
+- kind: ConfigMap
+"""
+
+class TestParseDiff():
+
+    def test_counts_changes_per_resource(self):
+        resources = list(parse_diff(DIFF.splitlines()))
+
+        assert [(resource.kind, resource.namespace, resource.name, resource.action) for resource in resources] == [
+            ('Deployment', 'default', 'web', 'has changed'),
+            ('Service', 'default', 'web', 'has been added'),
+            ('ConfigMap', 'default', 'old', 'has been removed')
+        ]
+        assert (resources[0].added, resources[0].removed, resources[0].changed) == (1, 1, 1)
+        assert (resources[1].added, resources[1].removed, resources[1].changed) == (2, 0, 0)
+        assert (resources[2].added, resources[2].removed, resources[2].changed) == (0, 2, 0)
+
+    def test_output_without_resources(self):
+        summary = summarize_diff("No changes for the chart in this environment were detected. Everything is up to date.")
+
+        assert summary.resources == ()
+        assert summary.added == summary.removed == summary.changed == 0
@@ -0,0 +1,65 @@
+from sparrow.release_managers.helm.manager import Helm
+from sparrow.release_managers.helm.diffcache import DiffCache
+from sparrow.release_managers.helm.repositories import RepositoryIndexCache
+from sparrow.cache.memory import MemoryCache
+from sparrow.cloudproviders.models import KubeContext
+from sparrow.machine.system import BoundedProcessResult
+from unittest.mock import MagicMock
+
+CONTEXT = KubeContext(cluster='dev-cluster', kubeconfig='/tmp/kubeconfig')
+
+class TestHelm():
+
+    def _helm(self, tmp_path, outputs):
+        '''A Helm whose commands answer with outputs[<helm subcommand>] instead of running'''
+        helm = Helm.__new__(Helm)
+        helm._dependencies = MagicMock(ensure=MagicMock(return_value=True))
+        helm._diffs = DiffCache(MemoryCache(max_bytes=10 ** 6), context_lines='-1')
+        helm.commands = []
+        def run(cmd, env):
+            helm.commands.append(cmd)
+            return BoundedProcessResult(args=cmd, **outputs[cmd[1]])
+        helm._run = run
+        (tmp_path / 'Chart.yaml').write_text('name: app\n')
+        (tmp_path / 'values-dev.yaml').write_text('replicas: 2\n')
+        return helm
+
+    def test_release_revision_is_read_from_history(self, tmp_path):
+        helm = self._helm(tmp_path, {'history': dict(returncode=0, stdout='[{"revision": 7, "status": "deployed"}]', stderr='')})
+
+        assert helm._getReleaseRevision('app', 'default', CONTEXT) == '7'
+        assert helm.commands == [['helm', 'history', 'app', '--namespace', 'default', '--max', '1', '-o', 'json']]
+
+    def test_release_revision_of_a_missing_release(self, tmp_path):
+        helm = self._helm(tmp_path, {'history': dict(returncode=1, stdout='', stderr='Error: release: not found')})
+
+        assert helm._getReleaseRevision('app', 'default', CONTEXT) == 'unreleased'
+
+    def test_diff_with_warnings_is_not_cached(self, tmp_path):
+        """
+        Test that a diff that printed to stderr is served but diffed again next time, while a clean diff is cached.
+        """
+        outputs = {
+            'history': dict(returncode=0, stdout='[{"revision": 7}]', stderr=''),
+            'diff': dict(returncode=0, stdout='default, app, Deployment (apps) has changed:', stderr='WARNING: kubeconfig is group-readable')
+        }
+        helm = self._helm(tmp_path, outputs)
+
+        assert helm.generateDiff(str(tmp_path), 'app', 'default', ['values-dev.yaml'], CONTEXT) == 'WARNING: kubeconfig is group-readable'
+        outputs['diff'] = dict(returncode=0, stdout='default, app, Deployment (apps) has changed:', stderr='')
+        assert helm.generateDiff(str(tmp_path), 'app', 'default', ['values-dev.yaml'], CONTEXT) == 'default, app, Deployment (apps) has changed:'
+        helm.generateDiff(str(tmp_path), 'app', 'default', ['values-dev.yaml'], CONTEXT)
+
+        assert [cmd[1] for cmd in helm.commands] == ['history', 'diff', 'history', 'diff', 'history']
+
+    def test_failed_refresh_waits_for_the_ttl(self, tmp_path):
+        """
+        Test that a chart whose dependencies cannot be resolved refreshes the repository indexes once per TTL, not on every call.
+        """
+        helm = self._helm(tmp_path, {'dependency': dict(returncode=1, stdout='', stderr='Error: no repository definition')})
+        helm._repositories = RepositoryIndexCache(cache_dir=str(tmp_path / 'repository'), ttl=60)
+
+        assert not helm._updateChartDependencies(str(tmp_path))
+        assert not helm._updateChartDependencies(str(tmp_path))
+
+        assert ['--skip-refresh' in cmd for cmd in helm.commands] == [False, True]
@@ -0,0 +1,28 @@
+from sparrow.release_managers.helm.index import ChartIndex
+import pytest
+import os
+
+class TestChartIndex():
+
+    @pytest.fixture
+    def repo_path(self, tmp_path):
+        for chart in ['clusters/team/redis', 'clusters/team/redis-ha', 'clusters/team/redis/charts/common']:
+            os.makedirs(tmp_path / chart / 'templates')
+            (tmp_path / chart / 'Chart.yaml').write_text(f'name: {os.path.basename(chart)}')
+        ## Has a Chart.yaml but no templates so it is not a chart
+        os.makedirs(tmp_path / 'clusters/team/docs')
+        (tmp_path / 'clusters/team/docs/Chart.yaml').write_text('name: docs')
+        return str(tmp_path)
+
+    def test_resolve(self, repo_path):
+        """
+        Test that files resolve to the deepest chart containing them and that sibling charts sharing a prefix are kept apart.
+        """
+        index = ChartIndex.build(repo_path)
+
+        assert sorted(index.chart_roots) == ['clusters/team/redis', 'clusters/team/redis-ha', 'clusters/team/redis/charts/common']
+        assert index.resolve('clusters/team/redis/values-dev.yaml') == 'clusters/team/redis'
+        assert index.resolve('clusters/team/redis-ha/templates/sts.yaml') == 'clusters/team/redis-ha'
+        assert index.resolve('clusters/team/redis/charts/common/templates/_helpers.tpl') == 'clusters/team/redis/charts/common'
+        assert index.resolve('clusters/team/docs/Chart.yaml') is None
+        assert index.resolve('README.md') is None
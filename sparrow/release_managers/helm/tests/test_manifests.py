@@ -0,0 +1,92 @@
+from sparrow.release_managers.helm.manifests import split_manifests, diff_manifests
+from sparrow.release_managers.helm.diffparse import summarize_diff
+
+BEFORE = """---
+# Source: app/templates/service.yaml
+apiVersion: v1
+kind: Service
+metadata:
+  name: web
+---
+# Source: app/templates/deployment.yaml
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: web
+  namespace: apps
+spec:
+  replicas: 1
+  paused: false
+"""
+
+AFTER = """---
+# Source: app/templates/deployment.yaml
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: web
+  namespace: apps
+spec:
+  replicas: 2
+  paused: false
+---
+# Source: app/templates/configmap.yaml
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: web
+"""
+
+SECRET = """---
+apiVersion: v1
+kind: Secret
+metadata:
+  name: db
+data:
+  username: YWRtaW4=
+  password: {password}
+{extra}"""
+
+class TestManifests():
+
+    def test_split_manifests_keys_resources_like_helm_diff(self):
+        resources = split_manifests(BEFORE, namespace='default')
+
+        assert list(resources) == [('default', 'web', 'Service'), ('apps', 'web', 'Deployment')]
+        assert resources[('apps', 'web', 'Deployment')][0] == 'apps, web, Deployment (apps)'
+
+    def test_diff_manifests_in_helm_diff_format(self):
+        """
+        Test that changed, added and removed resources are reported the way helm diff reports them so the diff parser summarizes them.
+        """
+        diff = diff_manifests(BEFORE, AFTER, namespace='default', context=1)
+
+        assert "apps, web, Deployment (apps) has changed:\n  spec:\n-   replicas: 1\n+   replicas: 2\n    paused: false" in diff
+        assert [(resource.kind, resource.action) for resource in summarize_diff(diff).resources] == [
+            ('Deployment', 'has changed'), ('ConfigMap', 'has been added'), ('Service', 'has been removed')
+        ]
+        assert diff_manifests(AFTER, AFTER, namespace='default', context=-1) == ""
+
+    def test_diff_manifests_redacts_secrets(self):
+        """
+        Test that Secret values never appear in the diff, only which keys changed and their sizes, like helm diff.
+        """
+        before = SECRET.format(password='aHVudGVyMg==', extra='')
+        after = SECRET.format(password='czNjcjN0IQ==', extra='stringData:\n  token: t0ps3cr3t\n')
+
+        diff = diff_manifests(before, after, namespace='default', context=-1)
+
+        for value in ('YWRtaW4=', 'aHVudGVyMg==', 'czNjcjN0IQ==', 'admin', 'hunter2', 's3cr3t!', 't0ps3cr3t'):
+            assert value not in diff
+        assert "default, db, Secret (v1) has changed:" in diff
+        assert "    username: 'REDACTED # (5 bytes)'" in diff
+        assert "-   password: '-------- # (7 bytes)'" in diff
+        assert "+   password: '++++++++ # (7 bytes)'" in diff
+        assert "+   token: '++++++++ # (9 bytes)'" in diff
+
+        added = diff_manifests("", after, namespace='default', context=-1)
+        assert "default, db, Secret (v1) has been added:" in added
+        assert 't0ps3cr3t' not in added and 'czNjcjN0IQ==' not in added
+
+        ## Re-encoding the same values is not a change
+        assert diff_manifests(before, before.replace('YWRtaW4=', '"YWRtaW4="'), namespace='default', context=-1) == ""
@@ -0,0 +1,35 @@
+from sparrow.release_managers.helm.repositories import RepositoryIndexCache
+import os
+import time
+
+class TestRepositoryIndexCache():
+
+    def test_is_fresh_until_ttl_expires(self, tmp_path):
+        """
+        Test that indexes are stale until refreshed and become stale again once the TTL has passed.
+        """
+        cache = RepositoryIndexCache(cache_dir=str(tmp_path / 'repository'), ttl=60)
+        assert not cache.isFresh()
+
+        cache.markRefreshed()
+        assert cache.isFresh()
+
+        expired = time.time() - 120
+        os.utime(tmp_path / 'repository' / RepositoryIndexCache.STAMP, (expired, expired))
+        assert not cache.isFresh()
+
+    def test_refreshing_reports_a_refresh_made_while_waiting(self, tmp_path):
+        """
+        Test that a worker taking the refresh lock after another refreshed sees the indexes as fresh.
+        """
+        cache = RepositoryIndexCache(cache_dir=str(tmp_path / 'repository'), ttl=60)
+        with cache.refreshing() as stale:
+            assert stale
+            cache.markRefreshed()
+
+        with cache.refreshing() as stale:
+            assert not stale
+
+    def test_env_points_helm_at_the_cache(self, tmp_path):
+        cache = RepositoryIndexCache(cache_dir=str(tmp_path), ttl=60)
+        assert cache.env()['HELM_REPOSITORY_CACHE'] == str(tmp_path)
@@ -1,14 +1,19 @@
 from abc import abstractmethod
 from sparrow.vcs.models import MergeRequestDiff
-from typing import List
+from sparrow.cloudproviders.models import KubeContext
+from typing import Dict, Iterable, List, Optional
 class IReleaseManager:
 
     @abstractmethod
-    def generateDiff(self, chart_path: str, release_name: str, namespace: str, values_files: List[str]) -> str:
+    def generateDiff(self, chart_path: str, release_name: str, namespace: str, values_files: List[str], kube_context: KubeContext) -> str:
+        ...
+
+    @abstractmethod
+    def generateRenderDiff(self, base_chart_path: Optional[str], chart_path: str, release_name: str, namespace: str, values_files: List[str]) -> str:
         ...
     
     @abstractmethod
-    def performUpgradeOrInstall(self,  chart_path: str, release_name: str, namespace: str, values_files: List[str]) -> str:
+    def performUpgradeOrInstall(self,  chart_path: str, release_name: str, namespace: str, values_files: List[str], kube_context: KubeContext) -> str:
         ...
 
     @abstractmethod
@@ -20,5 +25,9 @@ class IReleaseManager:
         ...
     
     @abstractmethod
-    def detectChangedReleases(self, repo_path: str, diffs: List[MergeRequestDiff]) -> List[str]:
-        ...
\ No newline at end of file
+    def detectChangedReleases(self, repo_path: str, diffs: Iterable[MergeRequestDiff]) -> List[str]:
+        ...
+
+    @abstractmethod
+    def detectChangedFiles(self, repo_path: str, diffs: Iterable[MergeRequestDiff]) -> Dict[str, List[str]]:
+        ...
@@ -6,9 +6,28 @@ import traceback
 
 from sparrow.cloudproviders.exceptions import AuthenticationError
 from sparrow.middleware.auth import BasicAuthMiddleware
-from sparrow.sparrowfile.models import SparrowFile
+from sparrow.sparrowfile.models import SparrowFile, DiffMode
+from sparrow.machine import system
 from sparrow.sparrowfile.exceptions import ClusterNotDefinedError
 
+from sparrow.jobs.scheduler import MergeRequestScheduler
+from sparrow.jobs.exceptions import QueueFullError, JobCancelledError
+from sparrow.jobs.cancellation import raise_if_cancelled
+from sparrow.jobs.fanout import FanOut
+from sparrow.jobs.models import ReleaseTarget
+from sparrow.jobs.state import MergeRequestState, MergeRequestStateStore
+from sparrow.cache.factory import CacheFactory
+from sparrow.telemetry import metrics
+from sparrow.locking.models import LockKey
+from sparrow.comments.publisher import ProgressiveComment
+from sparrow.comments.render import CommentRenderer, DIFF_EPILOGUE
+from sparrow.comments.artifacts import ArtifactStore
+from sparrow.release_managers.helm.diffparse import summarize_diff
+from sparrow.locking.exceptions import LockTimeoutError
+from sparrow.settings import JOB_QUEUE_DEPTH, JOB_WORKERS, JOB_RETRY_AFTER, JOB_DEBOUNCE, DIFF_WORKERS, CLUSTER_CONCURRENCY, MR_STATE_DIR, MR_STATE_MAX_BYTES, LOCK_TIMEOUT, COMMENT_UPDATE_INTERVAL, COMMENT_MAX_BYTES, ARTIFACT_DIR, ARTIFACT_MAX_BYTES, EXTERNAL_URL
+from typing import Callable, Dict, List, Optional, Tuple
+from contextlib import nullcontext
+
 from flask import Flask
 from .config import *
 
@@ -21,12 +40,136 @@ def on_event():
     # logger.info(f"Got payload: {request.json}")
     try:
         event = Config.receiver.getEvent(request.json)
-        handle_event(event)
+    except Exception as e:
+        logger.warning(f"Exception: {e}")
+        traceback.print_exc()
+        return "", 200
+
+    ## Ignore None events
+    if not event:
+        return "", 200
+
+    ## Hand the event to the job queue so the webhook is answered right away
+    try:
+        jobs.submit(event)
+    except QueueFullError as e:
+        logger.warning(f"Rejecting event: {e}")
+        return "", 503, {"Retry-After": str(JOB_RETRY_AFTER)}
+    return "", 202
+
+@app.route(f'{Config.server_path_prefix}/metrics', methods=['GET'])
+def get_metrics():
+    ## Counters summed over every job handled by this process
+    return metrics.totals(), 200
+
+@app.route(f'{Config.server_path_prefix}/artifacts/<artifact_id>', methods=['GET'])
+def get_artifact(artifact_id: str):
+    ## Full outputs that were truncated in a comment
+    content = artifacts.load(artifact_id) if artifacts else None
+    if content is None:
+        return "", 404
+    return content, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+## Events that check the repo out and so must hold a lease on their workspace
+CHECKOUT_EVENTS = [PullRequestEventType.COMMENT_DIFF, PullRequestEventType.COMMENT_APPLY, PullRequestEventType.MR_OPENED, PullRequestEventType.MR_MODIFIED]
+
+def workspace_owner(event: PullRequestEvent) -> str:
+    return f"{event.repo.id}!{event.mr.id}"
+
+def run_job(event: PullRequestEvent):
+    '''Handle a queued event and mark it as failed in the VCS if anything goes wrong'''
+    try:
+        ## Hold the checkout for the whole job so it cannot be evicted underneath us
+        lease = Config.workspace.lease(Config.vcs.getRepoPath(event), owner=workspace_owner(event)) if event.type in CHECKOUT_EVENTS else nullcontext()
+        with lease, metrics.job_metrics() as job_metrics:
+            handle_event(event)
+        logger.info(f"Metrics for {event.type} on MR {event.mr.id}: {job_metrics.snapshot()}")
+    except JobCancelledError as e:
+        logger.info(f"Stopped {event.type} for sha {event.mr.sha}: {e}")
+        Config.vcs.SetEventCanceled(event)
     except Exception as e:
         logger.warning(f"Exception: {e}")
         traceback.print_exc()
         Config.vcs.SetEventFailure(event)
-    return "", 200
+
+## Diff jobs of a merge request are debounced and superseded by newer pushes. Apply jobs always run
+jobs = MergeRequestScheduler(handler=run_job, depth=JOB_QUEUE_DEPTH, workers=JOB_WORKERS, debounce=JOB_DEBOUNCE, on_cancelled=lambda event: Config.vcs.SetEventCanceled(event))
+fanout = FanOut(workers=DIFF_WORKERS, per_key_limit=CLUSTER_CONCURRENCY)
+mr_state = MergeRequestStateStore(CacheFactory("disk", directory=MR_STATE_DIR, max_bytes=MR_STATE_MAX_BYTES))
+## Without the URL Sparrow is reachable at there is nothing to link to, so truncated outputs are not stored
+artifacts = ArtifactStore(CacheFactory("disk", directory=ARTIFACT_DIR, max_bytes=ARTIFACT_MAX_BYTES), base_url=f"{EXTERNAL_URL}{Config.server_path_prefix}") if EXTERNAL_URL else None
+diff_comment = CommentRenderer("diff", "diff", "Show Diffs", max_bytes=COMMENT_MAX_BYTES, epilogue=DIFF_EPILOGUE, artifacts=artifacts, summarize=summarize_diff)
+apply_comment = CommentRenderer("apply", "logs", "Show Apply Logs", max_bytes=COMMENT_MAX_BYTES, artifacts=artifacts)
+
+def run_targets(targets: List[ReleaseTarget], run: Callable, on_result: Optional[Callable] = None) -> List:
+    '''
+    Run every target concurrently, at most CLUSTER_CONCURRENCY at a time per cluster.
+    Results are returned in the order of targets so rendered comments stay stable. on_result sees each result as it finishes.
+    '''
+    return fanout.map(run, targets, key=lambda target: target.env.cluster.name, on_result=on_result)
+
+def reusable_diffs(event: PullRequestEvent, repo_path: str, targets: List[ReleaseTarget]) -> Dict[Tuple[str, str], str]:
+    '''
+    Return the stored diffs of the targets whose charts did not change since the last sha diffed for this merge request.
+    Only new pushes reuse diffs. Anything that makes the comparison unreliable means everything is diffed again
+    '''
+    if event.type != PullRequestEventType.MR_MODIFIED:
+        return {}
+
+    state = mr_state.get(event.repo.id, event.mr.id)
+    ## Only applies were recorded so far
+    if not state or not state.sha:
+        return {}
+
+    changes = Config.vcs.getChangesBetween(event, state.sha)
+    if changes is None:
+        return {}
+
+    ## The sparrowfile decides the environments of every chart
+    if any("sparrowfile.yaml" in (change.old_path, change.new_path) for change in changes):
+        logger.info(f"The sparrowfile changed since {state.sha}. Diffing every chart again")
+        return {}
+
+    changed_files = Config.release_manager.detectChangedFiles(repo_path, changes)
+    reusable = {}
+    for target in targets:
+        key = (target.chart_name, target.env.name)
+        changed = target.chart_path in changed_files and target.env in target.configuration.get_affected_environments(changed_files[target.chart_path])
+        if not changed and key in state.results:
+            reusable[key] = state.results[key]
+    logger.info(f"Reusing {len(reusable)} of {len(targets)} diffs from {state.sha}")
+    return reusable
+
+def generate_diff(target: ReleaseTarget) -> dict:
+    ## Each target gets its own credentials so diffs against different clusters can run side by side
+    with target.env.cluster.provider_config.authenticate() as kube_context:
+        ## Diffs of a release run side by side but never while it is being applied
+        lock_key = LockKey(cluster=kube_context.cluster, namespace=target.env.namespace, release=target.configuration.release_name)
+        try:
+            with Config.lock.acquire(lock_key, shared=True, timeout=LOCK_TIMEOUT):
+                logger.debug(f"Generating diff for chart {target.chart_path} in namespace {target.env.namespace} working with values files {target.env.valuesFiles}")
+                diff = Config.release_manager.generateDiff(target.chart_path, target.configuration.release_name, target.env.namespace, target.env.valuesFiles, kube_context)
+        except LockTimeoutError as e:
+            logger.error(f"Could not generate diff: {e}")
+            diff = None
+        return {
+            "chart": target.chart_name,
+            "env": target.env.name,
+            "diff": diff
+            }
+
+def generate_render_diff(target: ReleaseTarget, base_repo_path: str) -> dict:
+    ## Render diffs compare the chart at the base and head of the merge request and never touch the cluster
+    base_chart_path = system.join_paths(base_repo_path, target.chart_name)
+    if not system.dir_exists(base_chart_path):
+        base_chart_path = None
+    logger.debug(f"Generating render diff for chart {target.chart_path} against {base_chart_path} working with values files {target.env.valuesFiles}")
+    diff = Config.release_manager.generateRenderDiff(base_chart_path, target.chart_path, target.configuration.release_name, target.env.namespace, target.env.valuesFiles)
+    return {
+        "chart": target.chart_name,
+        "env": target.env.name,
+        "diff": diff
+        }
 
 def handle_event(event: PullRequestEvent):
     logger.info(f"Handling Event: {event}")
@@ -45,8 +188,9 @@ def handle_event(event: PullRequestEvent):
                 logger.info("Cloning repo")
                 repo_path = Config.vcs.cloneRepoAtSha(event)
 
-                ## check if the changed files are dependencies of a chart
-                changed_charts = Config.release_manager.detectChangedReleases(repo_path, diffs)
+                ## check if the changed files are dependencies of a chart and keep the files changed in each chart
+                changed_files = Config.release_manager.detectChangedFiles(repo_path, diffs)
+                changed_charts = list(changed_files)
 
                 ## Changed charts paths will be in the format:
                 ## f'{settings.SPARROW_CLONE_DIR}/{repo-id}-{sha}/{path to chart in repo}'
@@ -65,7 +209,7 @@ def handle_event(event: PullRequestEvent):
                     return
                 
                 ## TODO: run a plan on the chart but lock the plan using a repo+path hash dir so that two mrs don't conflict
-                diffs = []
+                targets = []
                 for chart in changed_charts:
                     ## Get the cluster values mapping for this chart from the sparrowfile
                     chart_configuration = sparrowfile.getChartConfiguration(chart, repo_path)
@@ -76,36 +220,65 @@ def handle_event(event: PullRequestEvent):
                         Config.vcs.postComment(event, f"Configuration applicable to `{chart_name}` were not found in the sparrowfile. Cannot generate diff for this chart.")
                         continue
 
-                    for env in chart_configuration.environments:
-                        try:
-                            with env.cluster.provider_config.authenticate():
-                                ## Get the diff
-                                logger.debug(f"Generating diff for chart {chart} in namespace {env.namespace} working with values files {env.valuesFiles}")
-                                diffs.append({ 
-                                    "chart": chart_name,
-                                    "env": env.name,
-                                    "diff": Config.release_manager.generateDiff(chart, chart_configuration.release_name, env.namespace, env.valuesFiles)
-                                    })
-                        except AuthenticationError as e:
-                            logger.error(f"Could not authenticate with cluster: {e}")
-                            Config.vcs.postComment(event, f"Could not authenticate with cluster: {e}")
-                            return
-                if diffs:
+                    ## Only diff the environments whose values the changes can affect
+                    for env in chart_configuration.get_affected_environments(changed_files[chart]):
+                        targets.append(ReleaseTarget(chart_path=chart, chart_name=chart_name, configuration=chart_configuration, env=env))
 
-                    prologue = f"Ran diff for {len(diffs)} charts:\n"
-                    diff_block = ""
-                    epilogue = "* ⏩ To **apply all diffs** from this pull request, comment:\n  * `sparrow apply`\n"
-                    epilogue += "* ⏩ To **apply specific diffs** from this pull request, comment:\n  * `sparrow apply -f <chart>@<environment>`\n\n"
-                    
-                    for index, diff in enumerate(diffs):
-                        chart_name = diff.get('chart').removeprefix(f"{repo_path}/")
-                        prologue += f"{index+1}. `{chart_name}` environment: `{diff.get('env')}`\n"
-                    
-                        diff_block += f"## {index+1}. `{diff.get('chart')}` environment: `{diff.get('env')}`\n"
-                        diff_block += f"<details><summary>Show Diffs</summary>\n\n"
-                        diff_block += f"```\n{diff.get('diff')}\n```\n\n"
-                        diff_block += "</details>\n\n"
-                    Config.vcs.postComment(event, f"{prologue}\n\n{diff_block}\n\n---\n{epilogue}")
+                ## On a new push only the charts changed since the last processed sha are diffed again.
+                ## Diffs of releases applied from here on are taken against the old release and will not be stored
+                generation = mr_state.generation(event.repo.id, event.mr.id)
+                reused = reusable_diffs(event, repo_path, targets)
+                pending = [index for index, target in enumerate(targets) if (target.chart_name, target.env.name) not in reused]
+                diffs = [
+                    {"chart": target.chart_name, "env": target.env.name, "diff": reused[(target.chart_name, target.env.name)]} if index not in pending
+                    else {"chart": target.chart_name, "env": target.env.name}
+                    for index, target in enumerate(targets)
+                ]
+
+                ## Environments in render mode are diffed against the base of the merge request instead of the cluster.
+                ## Diffs asked for with a comment always run against the cluster
+                base_repo_path = None
+                if event.type != PullRequestEventType.COMMENT_DIFF and any(targets[index].env.diffMode == DiffMode.RENDER for index in pending):
+                    if base_sha := Config.vcs.getMergeBase(event):
+                        base_repo_path = Config.vcs.getRepoPath(event, base_sha)
+                    else:
+                        logger.warning(f"Could not find the base of MR {event.mr.id}. Diffing every environment against the cluster")
+                diff_target = lambda target: generate_render_diff(target, base_repo_path) if base_repo_path and target.env.diffMode == DiffMode.RENDER else generate_diff(target)
+
+                ## Lease the base checkout before creating it so it cannot be evicted underneath us
+                base_lease = Config.workspace.lease(base_repo_path, owner=workspace_owner(event)) if base_repo_path else nullcontext()
+                with base_lease:
+                    if base_repo_path:
+                        logger.info("Cloning the base of the merge request")
+                        Config.vcs.cloneRepoAtSha(event, base_sha)
+
+                    ## Publish one summary note and fill it in as each diff finishes
+                    summary = ProgressiveComment(Config.vcs, event, render=diff_comment.render, min_interval=COMMENT_UPDATE_INTERVAL)
+                    if diffs:
+                        summary.publish(diffs)
+                    try:
+                        generated = run_targets([targets[index] for index in pending], diff_target, on_result=lambda index, diff: summary.update(pending[index], diff))
+                        for index, diff in zip(pending, generated):
+                            diffs[index] = diff
+
+                        ## Don't record or post the results of a job that a newer push superseded
+                        raise_if_cancelled()
+                    except AuthenticationError as e:
+                        logger.error(f"Could not authenticate with cluster: {e}")
+                        summary.finish(f"Could not authenticate with cluster: {e}")
+                        return
+                    except JobCancelledError:
+                        if diffs:
+                            summary.finish(f"The diff for `{event.mr.sha}` was cancelled because a newer push superseded it.")
+                        raise
+
+                ## Failed diffs are left out so the next push runs them again
+                mr_state.set(event.repo.id, event.mr.id, MergeRequestState(
+                    sha=event.mr.sha,
+                    results={(diff.get('chart'), diff.get('env')): diff.get('diff') for diff in diffs if diff.get('diff') is not None}
+                ), since=generation)
+                if diffs:
+                    summary.finish()
 
             case PullRequestEventType.COMMENT_APPLY:
                 ## Update the VCS provider UI to acknowledge that changes are being processed
@@ -150,6 +323,10 @@ def handle_event(event: PullRequestEvent):
                         valid_targeted_charts.append(f"{repo_path}/{user_targeted_chart}" if repo_path not in user_targeted_chart else user_targeted_chart)
 
                 logger.debug(f"Valid targeted charts: {valid_targeted_charts}")
+
+                ## Publish one summary note and fill it in as each apply finishes
+                summary = ProgressiveComment(Config.vcs, event, render=apply_comment.render, min_interval=COMMENT_UPDATE_INTERVAL)
+                apply_logs = []
                 for chart in valid_targeted_charts:
                     chart_path = chart.split('@')[0]
                     chart_env = chart.split('@')[1] if len(chart.split('@')) > 1 else None
@@ -169,41 +346,47 @@ def handle_event(event: PullRequestEvent):
                             target_envs = [chart_env_config]
                         else:
                             Config.vcs.postComment(event, f"Environment `{chart_env}` not found in the chart configuration. Cannot apply changes...")
+                            if apply_logs:
+                                summary.finish()
                             raise ValueError(f"Environment {chart_env} not found in the chart configuration")
                     else:
                         target_envs = chart_configuration.environments
 
-                    
-                    apply_logs = []
+
                     for env in target_envs:
+                        index = len(apply_logs)
+                        apply_logs.append({"chart": chart_path.removeprefix(f"{repo_path}/"), "env": env.name})
+                        summary.publish(apply_logs)
                         try:
-                            with env.cluster.provider_config.authenticate():
-                                ## Apply the charts
-                                logger.debug(f"Applying {chart} in namespace {env.namespace} working with values files {env.valuesFiles}")
-                                apply_logs.append({ 
-                                    "chart": chart_path,
-                                    "env": env.name,
-                                    "logs": Config.release_manager.performUpgradeOrInstall(chart_path, chart_configuration.release_name, env.namespace, env.valuesFiles)
-                                    })
+                            with env.cluster.provider_config.authenticate() as kube_context:
+                                ## Nothing else may diff or apply the release while it is applied
+                                lock_key = LockKey(cluster=kube_context.cluster, namespace=env.namespace, release=chart_configuration.release_name)
+                                with Config.lock.acquire(lock_key, timeout=LOCK_TIMEOUT) as lease:
+                                    ## Apply the charts
+                                    logger.debug(f"Applying {chart} in namespace {env.namespace} working with values files {env.valuesFiles} (fencing token {lease.token})")
+                                    logs = Config.release_manager.performUpgradeOrInstall(chart_path, chart_configuration.release_name, env.namespace, env.valuesFiles, kube_context)
+                        except LockTimeoutError as e:
+                            logger.error(f"Could not apply: {e}")
+                            logs = str(e)
                         except AuthenticationError as e:
                             logger.error(f"Could not authenticate with cluster: {e}")
-                            Config.vcs.postComment(event, f"Could not authenticate with cluster: {e}")
+                            summary.update(index, apply_logs[index] | {"logs": f"Could not authenticate with cluster: {e}"})
+                            summary.finish()
                             return
-                        
+                        ## The stored diff was taken against the release before it was applied and must not be reused
+                        mr_state.forget(event.repo.id, event.mr.id, [(apply_logs[index]["chart"], env.name)])
+                        apply_logs[index] = apply_logs[index] | {"logs": logs}
+                        summary.update(index, apply_logs[index])
+
                 if apply_logs:
+                    summary.finish()
 
-                    prologue = f"Ran apply for {len(apply_logs)} charts:\n"
-                    log_block = ""
-                    
-                    for index, log in enumerate(apply_logs):
-                        chart_name = log.get('chart').removeprefix(f"{repo_path}/")
-                        prologue += f"{index+1}. `{chart_name}` environment: `{log.get('env')}`\n"
-                    
-                        log_block += f"## {index+1}. `{chart_name}` environment: `{log.get('env')}`\n"
-                        log_block += f"<details><summary>Show Apply Logs</summary>\n\n"
-                        log_block += f"```\n{log.get('logs')}\n```\n\n"
-                        log_block += "</details>\n\n"
-                    Config.vcs.postComment(event, f"{prologue}\n\n{log_block}\n")
+            case PullRequestEventType.MR_CLOSED:
+                ## Nothing will run against this merge request again so free its checkouts right away
+                logger.info(f"Purging workspace for closed merge request {event.mr.id}")
+                Config.workspace.purge(workspace_owner(event))
+                mr_state.delete(event.repo.id, event.mr.id)
+                return
 
             case PullRequestEventType.COMMENT_SUGGESTION:
                 '''
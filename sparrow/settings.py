@@ -18,6 +18,10 @@ SPARROW_CLONE_DIR = os.environ.get("SPARROW_CLONE_DIR", f"{_workspace}/repos")
 SPARROW_PLAN_DIR = os.environ.get("SPARROW_PLAN_DIR", f"{_workspace}/plans")
 SPARROW_KUBECONFIG_DIR = os.environ.get("SPARROW_KUBECONFIG_DIR", f"{_workspace}/kubeconfigs")
 
+## Budget for the checkouts kept under SPARROW_CLONE_DIR
+WORKSPACE_MAX_BYTES = int(os.environ.get("SPARROW_WORKSPACE_MAX_BYTES", str(10 * 1024 ** 3)))
+WORKSPACE_MAX_CHECKOUTS = int(os.environ.get("SPARROW_WORKSPACE_MAX_CHECKOUTS", "50"))
+
 ## Access the Version Control Provider
 VCS_BASE_URL = os.environ.get("SPARROW_VCS_BASE_URL")
 if not VCS_BASE_URL:
@@ -27,15 +31,80 @@ VCS_TOKEN = os.environ.get("SPARROW_VCS_TOKEN")
 if not VCS_BASE_URL:
     raise ValueError("SPARROW_VCS_BASE_URL is not set")
 
+## Configure the HTTP client used for the VCS API
+HTTP_POOL_SIZE = int(os.environ.get("SPARROW_HTTP_POOL_SIZE", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("SPARROW_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("SPARROW_HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_RETRIES = int(os.environ.get("SPARROW_HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF = float(os.environ.get("SPARROW_HTTP_BACKOFF", "0.5"))
+HTTP_MAX_BACKOFF = float(os.environ.get("SPARROW_HTTP_MAX_BACKOFF", "30"))
+HTTP_MAX_RETRY_AFTER = float(os.environ.get("SPARROW_HTTP_MAX_RETRY_AFTER", "300"))
+
+## Number of threads that issue VCS UI updates (statuses, reactions) in the background
+VCS_SIDE_EFFECT_WORKERS = int(os.environ.get("SPARROW_VCS_SIDE_EFFECT_WORKERS", "4"))
+
+## Configure the cache of VCS API reads (merge request diffs, pipelines)
+VCS_CACHE_SIZE = int(os.environ.get("SPARROW_VCS_CACHE_SIZE", "512"))
+VCS_CACHE_MAX_AGE = float(os.environ.get("SPARROW_VCS_CACHE_MAX_AGE", "30"))
+VCS_DIFFS_PER_PAGE = int(os.environ.get("SPARROW_VCS_DIFFS_PER_PAGE", "100"))
+
 ## Allow configuring a path for binary installation
 BINARY_PATH = os.environ.get("SPARROW_BINARY_PATH", "/app/bin")
 
 ## Configure helm
 HELM_VERSION = os.environ.get("SPARROW_HELM_VERSION", "3.15.0")
+HELM_DEPENDENCY_CACHE_DIR = os.environ.get("SPARROW_HELM_DEPENDENCY_CACHE_DIR", f"{_workspace}/helm/dependencies")
+HELM_REPOSITORY_CACHE_DIR = os.environ.get("SPARROW_HELM_REPOSITORY_CACHE_DIR", f"{_workspace}/helm/repository")
+HELM_REPOSITORY_INDEX_TTL = int(os.environ.get("SPARROW_HELM_REPOSITORY_INDEX_TTL", "600"))
+
+## Bound the output kept from each helm command. Output beyond the memory threshold is spilled to disk
+HELM_OUTPUT_MEMORY_BYTES = int(os.environ.get("SPARROW_HELM_OUTPUT_MEMORY_BYTES", str(1024 ** 2)))
+HELM_OUTPUT_MAX_BYTES = int(os.environ.get("SPARROW_HELM_OUTPUT_MAX_BYTES", str(8 * 1024 ** 2)))
+
+## Configure the cache of helm diff results. Backends: disk, memory
+DIFF_CACHE_BACKEND = os.environ.get("SPARROW_DIFF_CACHE_BACKEND", "disk")
+DIFF_CACHE_DIR = os.environ.get("SPARROW_DIFF_CACHE_DIR", f"{_workspace}/cache/diffs")
+DIFF_CACHE_MAX_BYTES = int(os.environ.get("SPARROW_DIFF_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+
+## Where the last diffed sha and diffs of every merge request are kept for incremental re-diffs
+MR_STATE_DIR = os.environ.get("SPARROW_MR_STATE_DIR", f"{_workspace}/cache/merge_requests")
+MR_STATE_MAX_BYTES = int(os.environ.get("SPARROW_MR_STATE_MAX_BYTES", str(256 * 1024 ** 2)))
 
 ## Configure Azure
 AZURE_SUBSCRIPTION_ID = os.environ.get("AZURE_SUBSCRIPTION_ID")
 
+## Configure the kubeconfig cache
+KUBECONFIG_CACHE_TTL = int(os.environ.get("SPARROW_KUBECONFIG_CACHE_TTL", "3600"))
+KUBECONFIG_REFRESH_MARGIN = int(os.environ.get("SPARROW_KUBECONFIG_REFRESH_MARGIN", "300"))
+
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 
 DIFF_CONTEXT = os.environ.get("SPARROW_DIFF_CONTEXT", "-1")
+
+## Configure the job queue behind the webhook endpoint
+JOB_QUEUE_DEPTH = int(os.environ.get("SPARROW_JOB_QUEUE_DEPTH", "100"))
+JOB_WORKERS = int(os.environ.get("SPARROW_JOB_WORKERS", "4"))
+JOB_RETRY_AFTER = int(os.environ.get("SPARROW_JOB_RETRY_AFTER", "30"))
+## How long (seconds) diff events for a merge request wait for newer pushes before running
+JOB_DEBOUNCE = float(os.environ.get("SPARROW_JOB_DEBOUNCE", "2"))
+
+## Configure the locks that keep concurrent operations on the same release apart. Backends: File, Redis, Local, None
+LOCK_BACKEND = os.environ.get("SPARROW_LOCK_BACKEND", "File")
+LOCK_DIR = os.environ.get("SPARROW_LOCK_DIR", f"{_workspace}/locks")
+LOCK_REDIS_URL = os.environ.get("SPARROW_LOCK_REDIS_URL")
+LOCK_LEASE = float(os.environ.get("SPARROW_LOCK_LEASE", "60"))
+LOCK_TIMEOUT = float(os.environ.get("SPARROW_LOCK_TIMEOUT", "900"))
+
+## The shortest time (seconds) between two edits of a summary comment while results come in
+COMMENT_UPDATE_INTERVAL = float(os.environ.get("SPARROW_COMMENT_UPDATE_INTERVAL", "5"))
+## The largest comment (bytes) Sparrow posts. Longer summaries are split over several comments
+COMMENT_MAX_BYTES = int(os.environ.get("SPARROW_COMMENT_MAX_BYTES", "1000000"))
+
+## Where outputs too large for a comment are kept, and the URL Sparrow is reachable at to link to them
+ARTIFACT_DIR = os.environ.get("SPARROW_ARTIFACT_DIR", f"{_workspace}/cache/artifacts")
+ARTIFACT_MAX_BYTES = int(os.environ.get("SPARROW_ARTIFACT_MAX_BYTES", str(1024 ** 3)))
+EXTERNAL_URL = os.environ.get("SPARROW_EXTERNAL_URL", "")
+
+## Configure the diff fan-out
+DIFF_WORKERS = int(os.environ.get("SPARROW_DIFF_WORKERS", "8"))
+CLUSTER_CONCURRENCY = int(os.environ.get("SPARROW_CLUSTER_CONCURRENCY", "4"))
@@ -1,13 +1,19 @@
 from contextlib import contextmanager
 from dataclasses import dataclass
-import copy
 from abc import abstractmethod
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
+import hashlib
 from enum import StrEnum
+import tempfile
+import fcntl
 import yaml
+import os
 
-from sparrow.cloudproviders.azure.client import AzureClient
+from sparrow.cloudproviders.azure.client import kubeconfig_cache
+from sparrow.cloudproviders.models import KubeContext
 from sparrow.settings import SPARROW_KUBECONFIG_DIR
+from sparrow.cache.lru import LRUCache
+from sparrow.release_managers.helm.chart import load_chart_metadata
 from sparrow.machine import system
 import logging
 
@@ -19,59 +25,62 @@ class ClusterProviderType(StrEnum):
     LOCAL = 'local'
     AZURE = 'azure'
 
+class DiffMode(StrEnum):
+    LIVE = 'live'  # helm diff against the release in the cluster
+    RENDER = 'render'  # helm template at the base and head of the merge request, diffed without cluster access
+
 @dataclass
 class ClusterProvider:
 
     @abstractmethod
     @contextmanager
-    def authenticate(self):
-        """Autheticate to the cluster"""
+    def authenticate(self) -> Iterator[KubeContext]:
+        """Autheticate to the cluster and yield a KubeContext that is only valid inside the context"""
         pass
 
 @dataclass
 class LocalCluster(ClusterProvider):
     kubeconfig: str
 
+    @contextmanager
+    def authenticate(self) -> Iterator[KubeContext]:
+        if not self.kubeconfig:
+            raise ValueError("A kubeconfig must be provided to authenticate to a Local Cluster")
+        yield KubeContext(cluster=self.kubeconfig, kubeconfig=self.kubeconfig)
+
 @dataclass
 class AzureCluster(ClusterProvider):
     cluster_name: str
     resource_group: str
 
     @contextmanager
-    def authenticate(self):
+    def authenticate(self) -> Iterator[KubeContext]:
         if not self.resource_group or not self.cluster_name:
             raise ValueError("Resource Group and Cluster Name must be provided to authenticate to an Azure Cluster")
         
         ## Enter the conext manager for the cluster
-        kubeconfig = AzureClient().getKubeConfig(self.resource_group, self.cluster_name)
+        kubeconfig = kubeconfig_cache.get(self.resource_group, self.cluster_name)
 
         kubeconfig_dir = f'{SPARROW_KUBECONFIG_DIR}/{self.resource_group}'
-        kubeconfig_file = f'{kubeconfig_dir}/{self.cluster_name}.yaml'
-
-        if system.file_exists(kubeconfig_file):
-            logger.debug(f"Removing existing kubeconfig file: {kubeconfig_file}")
-            system.remove_file(kubeconfig_file)
 
         ## Create the directory if it does not exist
         system.create_dir(kubeconfig_dir)
 
-        # Store the kubeconfig to a file
-        with open(kubeconfig_file, 'w') as file:
+        ## Every context gets its own file so concurrent jobs never share or delete each other's kubeconfig.
+        ## mkstemp creates the file readable and writable by the current user only
+        fd, kubeconfig_file = tempfile.mkstemp(prefix=f'{self.cluster_name}-', suffix='.yaml', dir=kubeconfig_dir)
+        with os.fdopen(fd, 'w') as file:
             file.write(kubeconfig)
+            file.flush()
+            ## A shared flock marks the file as in use so the workspace sweep leaves it alone however long the job runs
+            fcntl.flock(file.fileno(), fcntl.LOCK_SH)
 
-        # Set file permissions to read and write only for the current user
-        system.set_file_permissions(kubeconfig_file, 0o600)
-        
-        ## Set the KUBECONFIG env variable
-        system.set_env_var('KUBECONFIG', kubeconfig_file)
-        
-        try:
-            ## Allow the context to run
-            yield 
-        finally:
-            ## Remove the env var and file
-            system.unset_env_var('KUBECONFIG')
-            system.remove_file(kubeconfig_file)
+            try:
+                ## Allow the context to run
+                yield KubeContext(cluster=f'{self.resource_group}/{self.cluster_name}', kubeconfig=kubeconfig_file)
+            finally:
+                ## Remove the file
+                system.remove_file(kubeconfig_file)
 
 @dataclass
 class Cluster:
@@ -86,6 +95,7 @@ class ChartEnvironment:
     valuesFiles: List[str]
     cluster: Cluster
     namespace: Optional[str] = None
+    diffMode: DiffMode = DiffMode.LIVE
 
 
 @dataclass
@@ -100,59 +110,106 @@ class ChartConfiguration:
                 return env
         return None
 
+
+@dataclass(frozen=True)
+class ChartEnvironmentView:
+    '''An environment of a ChartConfiguration resolved for a single chart'''
+    name: str
+    valuesFiles: Tuple[str, ...]
+    cluster: Cluster
+    namespace: str
+    diffMode: DiffMode = DiffMode.LIVE
+
+
+@dataclass(frozen=True)
+class ChartConfigurationView:
+    '''
+    A read only view of the ChartConfiguration that applies to a single chart, with the chart's release name and namespace filled in.
+    Views share the clusters of the parsed Sparrowfile instead of copying them
+    '''
+    path: str
+    environments: Tuple[ChartEnvironmentView, ...]
+    release_name: str
+
+    def get_environment(self, name: str) -> Optional[ChartEnvironmentView]:
+        for env in self.environments:
+            if env.name == name:
+                return env
+        return None
+
+    def get_affected_environments(self, changed_files: Iterable[str]) -> Tuple[ChartEnvironmentView, ...]:
+        '''
+        Return the environments affected by changes to files of the chart (relative to the chart root).
+        A values file only affects the environments that list it in valuesFiles. Any other file (templates, Chart.yaml,
+        values.yaml, dependencies) affects every environment
+        '''
+        affected = set()
+        for changed_file in changed_files:
+            changed_file = os.path.normpath(changed_file)
+            referencing = [env.name for env in self.environments if changed_file in (os.path.normpath(values_file) for values_file in env.valuesFiles)]
+            if not referencing:
+                return self.environments
+            affected.update(referencing)
+        return tuple(env for env in self.environments if env.name in affected)
+
+
 @dataclass
 class SparrowFile:
     clusters: List[Cluster]
     chartConfigurations: List[ChartConfiguration]
 
-    def _getChartNamespace(self, chart_path: str) -> str:
-        '''Load the yaml file Chart.yaml at chart_path/Chart.yaml get the namespace key'''
-        yaml_file = f'{chart_path}/Chart.yaml'
-        if not system.file_exists(yaml_file):
-            raise FileNotFoundError(f"Could not find the Chart.yaml file at {yaml_file}")
-        
-        with open(yaml_file, 'r') as file:
-            chart_data = yaml.safe_load(file)
-            return chart_data.get('namespace', 'default')
-        
-    def _getChartReleaseName(self, chart_path: str) -> str:
-        '''Load the yaml file Chart.yaml at chart_path/Chart.yaml get the releaseName key'''
-        yaml_file = f'{chart_path}/Chart.yaml'
-        if not system.file_exists(yaml_file):
-            raise FileNotFoundError(f"Could not find the Chart.yaml file at {yaml_file}")
-        
-        with open(yaml_file, 'r') as file:
-            chart_data = yaml.safe_load(file)
-            release_name = chart_data.get('releaseName')
-            if not release_name:
-                release_name = chart_data.get('name')
-            return release_name
-        
-    def getChartConfiguration(self, chart_path: str, repo_path: str) -> ChartConfiguration:
-        chart_config = None
-        greatest_match_length = -1
-        short_chart_path = chart_path.removeprefix(repo_path)
+    _CONFIGURATION = '/'  # Marks a trie node that a configuration path ends on. Cannot clash with a path component
+    _cache = LRUCache(max_size=32)
 
+    def __post_init__(self):
+        ## Compile the configuration paths into a path component trie for longest prefix lookups
+        self._trie = {}
         for config in self.chartConfigurations:
-            match_length = system.path_match_length(config.path.lstrip("/"), short_chart_path.lstrip("/"))
-            if match_length > greatest_match_length:
-                chart_config = config
-                greatest_match_length = match_length
-        
-        logger.debug(f"Found chart configuration: {chart_config.path}")
-        ## Create a deep copy to avoid modifying the original
-        chart_config_copy = copy.deepcopy(chart_config)
-
-        if chart_config_copy:
-            chart_config_copy.release_name = self._getChartReleaseName(chart_path)
-            chart_namespace = self._getChartNamespace(chart_path)
-            for env in chart_config_copy.environments:
-                if env.namespace is None:
-                    env.namespace = chart_namespace
-        else:
+            node = self._trie
+            for part in SparrowFile._splitPath(config.path):
+                node = node.setdefault(part, {})
+            node.setdefault(SparrowFile._CONFIGURATION, config)
+
+    @staticmethod
+    def _splitPath(path: str) -> List[str]:
+        return [part for part in (path or '').split('/') if part and part != '.']
+
+    def _matchConfiguration(self, short_chart_path: str) -> Optional[ChartConfiguration]:
+        '''Return the configuration with the longest path that is a prefix (by path component) of the chart path'''
+        node = self._trie
+        match = node.get(SparrowFile._CONFIGURATION)
+        for part in SparrowFile._splitPath(short_chart_path):
+            node = node.get(part)
+            if node is None:
+                break
+            match = node.get(SparrowFile._CONFIGURATION, match)
+        return match
+
+    def getChartConfiguration(self, chart_path: str, repo_path: str) -> Optional[ChartConfigurationView]:
+        short_chart_path = chart_path.removeprefix(repo_path)
+        chart_config = self._matchConfiguration(short_chart_path)
+
+        if not chart_config:
             logger.info(f"No chart configuration found for chart at {chart_path}")
-    
-        return chart_config_copy
+            return None
+
+        logger.debug(f"Found chart configuration: {chart_config.path}")
+        chart_metadata = load_chart_metadata(chart_path)
+        chart_namespace = chart_metadata.namespace
+        return ChartConfigurationView(
+            path=chart_config.path,
+            release_name=chart_metadata.release_name,
+            environments=tuple(
+                ChartEnvironmentView(
+                    name=env.name,
+                    valuesFiles=tuple(env.valuesFiles),
+                    cluster=env.cluster,
+                    namespace=env.namespace if env.namespace is not None else chart_namespace,
+                    diffMode=env.diffMode
+                )
+                for env in chart_config.environments
+            )
+        )
 
     
     @staticmethod
@@ -188,6 +245,7 @@ class SparrowFile:
                 valuesFiles = env.get('valuesFiles', [])
                 cluster_name = env.get('cluster')
                 namespace = env.get('namespace')
+                diff_mode = DiffMode(env.get('diffMode', DiffMode.LIVE))
                 cluster = None
                 for c in clusters:
                     if c.name == cluster_name:
@@ -196,7 +254,7 @@ class SparrowFile:
                 if cluster is None:
                     raise ClusterNotDefinedError(cluster_name)
                 
-                environments.append(ChartEnvironment(name=name, valuesFiles=valuesFiles, cluster=cluster, namespace=namespace))
+                environments.append(ChartEnvironment(name=name, valuesFiles=valuesFiles, cluster=cluster, namespace=namespace, diffMode=diff_mode))
             
             chartConfigurations.append(ChartConfiguration(path=path, environments=environments))
         return chartConfigurations
@@ -204,16 +262,21 @@ class SparrowFile:
 
     @classmethod
     def from_yaml(cls, yaml_file: str) -> 'SparrowFile':
+        '''Parse a Sparrowfile. Parsed files are cached by the hash of their content so a repo's Sparrowfile is only parsed once'''
         if not system.file_exists(yaml_file):
             raise FileNotFoundError(f"Could not find the Sparrowfile at {yaml_file}")
         
-        try:
-            with open(yaml_file, 'r') as file:
-                yaml_data = yaml.safe_load(file)
+        with open(yaml_file, 'rb') as file:
+            content = file.read()
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        if sparrowfile := cls._cache.get(content_hash):
+            return sparrowfile
 
-            clusters = cls._parse_clusters(yaml_data)
-            chartConfigurations = cls._parse_chart_configurations(yaml_data, clusters)
-        except Exception as e:
-            raise e
+        yaml_data = yaml.safe_load(content)
+        clusters = cls._parse_clusters(yaml_data)
+        chartConfigurations = cls._parse_chart_configurations(yaml_data, clusters)
 
-        return SparrowFile(clusters=clusters, chartConfigurations=chartConfigurations)
\ No newline at end of file
+        sparrowfile = SparrowFile(clusters=clusters, chartConfigurations=chartConfigurations)
+        cls._cache.set(content_hash, sparrowfile)
+        return sparrowfile
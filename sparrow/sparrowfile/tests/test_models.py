@@ -1,4 +1,5 @@
 from sparrow.sparrowfile.models import SparrowFile, Cluster
+from sparrow.release_managers.helm.chart import ChartMetadata
 import pytest
 import os
 from unittest.mock import patch, Mock
@@ -56,11 +57,13 @@ class TestSparrowFileAzure():
                         'name': 'dev',
                         'valuesFiles': ['values-dev.yaml'],
                         'cluster': 'dev-cluster',
+                        'diffMode': 'live',
                     },
                     {
                         'name': 'test',
                         'valuesFiles': ['values-test.yaml'],
                         'cluster': 'test-cluster',
+                        'diffMode': 'render',
                     }
                 ]
             }
@@ -76,6 +79,7 @@ class TestSparrowFileAzure():
                 assert env.valuesFiles == expected_env['valuesFiles']
                 assert env.cluster.name == expected_env['cluster']
                 assert env.namespace == None
+                assert env.diffMode == expected_env['diffMode']
     
     def test_getChartConfiguration(self, azure_sparrowfile_path):
         """
@@ -91,11 +95,13 @@ class TestSparrowFileAzure():
             None
         """
         sparrowfile = SparrowFile.from_yaml(azure_sparrowfile_path)
-        with patch('sparrow.sparrowfile.models.SparrowFile._getChartNamespace') as mock_getChartNamespace:
-            mock_getChartNamespace.return_value = 'default'
+        repo_path = os.path.dirname(azure_sparrowfile_path)
+        with patch('sparrow.sparrowfile.models.load_chart_metadata') as mock_load_chart_metadata:
+            mock_load_chart_metadata.return_value = ChartMetadata(name='chartA', version='0.1.0', namespace='default', release_name='chartA', dependencies=())
             
-            chart_config = sparrowfile.getChartConfiguration('clusters/softwareTeam/chartA')
+            chart_config = sparrowfile.getChartConfiguration(f'{repo_path}/clusters/softwareTeam/chartA', repo_path)
             assert chart_config.path == 'clusters/softwareTeam/'
+            assert chart_config.release_name == 'chartA'
 
             assert len(chart_config.environments) == 2
             for env in chart_config.environments:
@@ -103,13 +109,39 @@ class TestSparrowFileAzure():
                 assert env.namespace == 'default'
                 if env.cluster.name == 'dev-cluster':
                     assert env.name == 'dev'
-                    assert env.valuesFiles == ['values-dev.yaml']
+                    assert env.valuesFiles == ('values-dev.yaml',)
                 elif env.cluster.name == 'test-cluster':
                     assert env.name == 'test'
-                    assert env.valuesFiles == ['values-test.yaml']
+                    assert env.valuesFiles == ('values-test.yaml',)
                 else:
                     assert False, "Unexpected cluster name"
-            
 
+    def test_getChartConfiguration_requires_path_prefix(self, azure_sparrowfile_path):
+        """
+        Test that a chart outside of every configured path gets no configuration.
+        """
+        sparrowfile = SparrowFile.from_yaml(azure_sparrowfile_path)
+        repo_path = os.path.dirname(azure_sparrowfile_path)
+
+        assert sparrowfile.getChartConfiguration(f'{repo_path}/clusters/otherTeam/chartB', repo_path) is None
+
+    def test_from_yaml_is_cached(self, azure_sparrowfile_path):
+        """
+        Test that parsing the same Sparrowfile content twice returns the already parsed object.
+        """
+        assert SparrowFile.from_yaml(azure_sparrowfile_path) is SparrowFile.from_yaml(azure_sparrowfile_path)
+
+    def test_get_affected_environments(self, azure_sparrowfile_path):
+        """
+        Test that a values file only affects the environments listing it while any other chart file affects them all.
+        """
+        sparrowfile = SparrowFile.from_yaml(azure_sparrowfile_path)
+        repo_path = os.path.dirname(azure_sparrowfile_path)
+        with patch('sparrow.sparrowfile.models.load_chart_metadata') as mock_load_chart_metadata:
+            mock_load_chart_metadata.return_value = ChartMetadata(name='chartA', version='0.1.0', namespace='default', release_name='chartA', dependencies=())
+            chart_config = sparrowfile.getChartConfiguration(f'{repo_path}/clusters/softwareTeam/chartA', repo_path)
 
-        
\ No newline at end of file
+        assert [env.name for env in chart_config.get_affected_environments(['values-dev.yaml'])] == ['dev']
+        assert [env.name for env in chart_config.get_affected_environments(['./values-test.yaml', 'values-dev.yaml'])] == ['dev', 'test']
+        assert [env.name for env in chart_config.get_affected_environments(['values-dev.yaml', 'templates/deployment.yaml'])] == ['dev', 'test']
+        assert [env.name for env in chart_config.get_affected_environments(['values.yaml'])] == ['dev', 'test']
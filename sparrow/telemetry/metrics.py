@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator
+import contextvars
+import threading
+
+
+class JobMetrics:
+    '''Counters collected while handling a single job'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        with self._lock:
+            self._counters[name] = value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+
+## Totals for the whole process and the metrics of the job running in the current context
+_totals = JobMetrics()
+_current_job: contextvars.ContextVar = contextvars.ContextVar('sparrow_job_metrics', default=None)
+
+
+@contextmanager
+def job_metrics() -> Iterator[JobMetrics]:
+    '''Collect the metrics recorded inside the context (and in threads started with a copy of it) for one job'''
+    metrics = JobMetrics()
+    token = _current_job.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_job.reset(token)
+
+def increment(name: str, value: float = 1):
+    '''Add to a counter of the current job and of the process'''
+    _totals.increment(name, value)
+    if metrics := _current_job.get():
+        metrics.increment(name, value)
+
+def observe(name: str, value: float):
+    '''Record a measurement (e.g. a duration) on the current job and add it to the sum and count kept for the process'''
+    _totals.increment(f"{name}_sum", value)
+    _totals.increment(f"{name}_count")
+    if metrics := _current_job.get():
+        metrics.set(name, value)
+
+def current_job() -> JobMetrics | None:
+    return _current_job.get()
+
+def totals() -> Dict[str, float]:
+    return _totals.snapshot()
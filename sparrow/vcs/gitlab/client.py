@@ -3,17 +3,22 @@
 from sparrow.vcs.interface import IVersionControlSystem
 from sparrow.http.interface import IHTTPClient
 from .enum import CommitState, CommitStatusName, CommitStatusDescription
-from .models import GitlabPipeline
-from sparrow.vcs.models import MergeRequestDiff
-from .schema import MergeRequestDiff, PipelineSchema, CommitStatusBodySchema, EmojiBodySchema, NoteBodySchema
+from .models import GitlabPipeline, CachedResponse
+from sparrow.vcs import models as vcs_models
+from .schema import PipelineSchema, CommitStatusBodySchema, EmojiBodySchema, NoteBodySchema
 from .endpoints import ENDPOINTS
 from sparrow.receivers.events import PullRequestEvent, PullRequestEventType, Repo
 from marshmallow import ValidationError
 from sparrow.logger import logger
 import time
-from typing import List
+import os
+from typing import Any, Callable, Iterator, List, Optional
+import requests
 import git
 from sparrow.machine import system
+from sparrow.jobs.ordered import OrderedExecutor
+from sparrow.cache.lru import LRUCache
+from sparrow.settings import VCS_SIDE_EFFECT_WORKERS, VCS_CACHE_SIZE, VCS_CACHE_MAX_AGE, VCS_DIFFS_PER_PAGE
 
 class GitlabConfig:
     def __init__(self, token: str, base_url: str="https://gitlab.com/"):
@@ -33,29 +38,73 @@ class GitlabVCS(IVersionControlSystem):
         )
         self.token = config.token
         self.working_dir = working_dir
+        self._side_effects = OrderedExecutor(workers=VCS_SIDE_EFFECT_WORKERS, name="sparrow-vcs")
+        self._cache = LRUCache(max_size=VCS_CACHE_SIZE)
 
-    def postComment(self, event: PullRequestEvent, comment: str):
+    def postComment(self, event: PullRequestEvent, comment: str) -> Optional[int]:
         return self._commentOnMergeRequest(project_id=event.repo.id, mr_iid=event.mr.id, comment=comment)
 
-    def _commentOnMergeRequest(self, project_id: int, mr_iid: int, comment: str):
-        endpoint = ENDPOINTS.get("projects").get("merge_requests").get("notes").get("base").format(project_id=project_id, mr_iid=mr_iid)
+    def updateComment(self, event: PullRequestEvent, note_id: int, comment: str) -> bool:
+        return self._updateMergeRequestComment(project_id=event.repo.id, mr_iid=event.mr.id, note_id=note_id, comment=comment)
+
+    def _serializeComment(self, comment: str) -> dict:
         try:
-            payload = NoteBodySchema().dump(dict(body=comment))
+            return NoteBodySchema().dump(dict(body=comment))
         except ValidationError as e:
             raise Exception(f"Failed to serialize comment to be posted to mr: {e}")
-        
-        self.http_client.post(endpoint, body=payload)
-        
 
-    def _getLatestPipeline(self, project_id: str, ref_name: str) -> GitlabPipeline:
-        endpoint = ENDPOINTS.get("projects").get("pipelines").get("latest").format(project_id=project_id, ref=ref_name)
-        resp = self.http_client.get(endpoint)
+    def _commentOnMergeRequest(self, project_id: int, mr_iid: int, comment: str) -> Optional[int]:
+        '''Post a note on the merge request and return its id, or None if it could not be created'''
+        endpoint = ENDPOINTS.get("projects").get("merge_requests").get("notes").get("base").format(project_id=project_id, mr_iid=mr_iid)
+        resp = self.http_client.post(endpoint, body=self._serializeComment(comment))
+        if not resp.ok:
+            logger.error(f"Failed to comment on mr {mr_iid} in project {project_id}: {resp.status_code} {resp.text}")
+            return None
         try:
-            ret = PipelineSchema().load(resp.json)
-        except ValidationError as e:
-            logger.warning(f"Could not find any running pipelines for ref: {ref_name}. Returning None.")
-            ret = None
-        return ret
+            return resp.json().get('id')
+        except ValueError:
+            return None
+
+    def _updateMergeRequestComment(self, project_id: int, mr_iid: int, note_id: int, comment: str) -> bool:
+        '''Replace the body of an existing note. Returns whether the note was updated'''
+        endpoint = ENDPOINTS.get("projects").get("merge_requests").get("notes").get("filter_id").format(project_id=project_id, mr_iid=mr_iid, note_id=note_id)
+        resp = self.http_client.put(endpoint, body=self._serializeComment(comment))
+        if not resp.ok:
+            logger.error(f"Failed to update note {note_id} on mr {mr_iid} in project {project_id}: {resp.status_code} {resp.text}")
+        return resp.ok
+
+    def _cachedGet(self, key: tuple, endpoint: str, load: Callable[[requests.Response], Any]) -> Any:
+        '''
+        Read through the response cache. Entries younger than VCS_CACHE_MAX_AGE are served as is, older entries are
+        revalidated with If-None-Match so an unchanged resource costs a 304 instead of a full body
+        '''
+        cached: CachedResponse = self._cache.get(key)
+        if cached and time.time() - cached.fetched_at < VCS_CACHE_MAX_AGE:
+            return cached.value
+
+        headers = {'If-None-Match': cached.etag} if cached and cached.etag else {}
+        resp = self.http_client.get(endpoint, headers=headers)
+        if cached and resp.status_code == 304:
+            cached.fetched_at = time.time()
+            self._cache.set(key, cached)
+            return cached.value
+
+        value = load(resp)
+        self._cache.set(key, CachedResponse(etag=resp.headers.get('ETag'), value=value, fetched_at=time.time()))
+        return value
+
+    def _getLatestPipeline(self, project_id: str, ref_name: str, sha: str) -> GitlabPipeline:
+        endpoint = ENDPOINTS.get("projects").get("pipelines").get("filter_sha").format(project_id=project_id, ref=ref_name, sha=sha)
+        try:
+            ret = self._cachedGet(("pipeline", project_id, ref_name, sha), endpoint, lambda resp: PipelineSchema(many=True).load(resp.json()))
+        except (ValidationError, ValueError) as e:
+            logger.warning(f"Could not load the pipelines for ref: {ref_name} sha: {sha}. Returning None. Exception: {e}")
+            return None
+
+        if not ret:
+            logger.warning(f"Could not find any pipelines for ref: {ref_name} sha: {sha}. Returning None.")
+            return None
+        return ret[0]
     
     def _getStatusMetadata(self, event_type: PullRequestEventType) -> tuple[CommitStatusName, CommitStatusDescription]:
         match event_type:
@@ -74,8 +123,7 @@ class GitlabVCS(IVersionControlSystem):
         # https://github.com/runatlantis/atlantis/pull/2745/files/a2dd0a28bcb894ecf8c932d80bae17e5757a8741#diff-22d1bafb2e6e476aabe2f33484daa3f74932c6e0266f0830d7d948b8b9f60183
         # https://gitlab.com/gitlab-org/gitlab/-/issues/431660#note_1792942299
         
-        # no good needs to be this sha
-        pipeline = self._getLatestPipeline(project_id=project_id, ref_name=ref_name)
+        pipeline = self._getLatestPipeline(project_id=project_id, ref_name=ref_name, sha=sha)
 
         name, desc = self._getStatusMetadata(event_type)
         if not name or not desc:
@@ -99,25 +147,34 @@ class GitlabVCS(IVersionControlSystem):
     def _setCommitStatusFailure(self, project_id: str, sha: str, ref_name: str, event_type: PullRequestEventType):
         self._setCommitStatus(CommitState.FAILED, project_id, sha, ref_name, event_type)
     
+    def _setCommitStatusCanceled(self, project_id: str, sha: str, ref_name: str, event_type: PullRequestEventType):
+        self._setCommitStatus(CommitState.CANCELED, project_id, sha, ref_name, event_type)
+    
     def _setEmoji(self, project_id, mr_iid, comment_id: str, emoji="eyes"):
         endpoint = ENDPOINTS.get("projects").get("merge_requests").get("notes").get("react_emoji").format(project_id=project_id, mr_iid=mr_iid, note_id=comment_id)
         self.http_client.post(endpoint, body=EmojiBodySchema().dump(dict(name="eyes")))
 
 
+    def _sideEffectKey(self, event: PullRequestEvent) -> tuple:
+        '''Status updates for the same merge request must land in the order they were issued'''
+        return (event.repo.id, event.mr.id)
+
     def acknowledgeEvent(self, event: PullRequestEvent):
         '''
-        Acknowledge a recieved event to the user
+        Acknowledge a recieved event to the user.
+        The UI updates are issued in the background so they overlap with the rest of the job
         '''
         logger.info(f"ack event: {event.__dict__}")
         match event.type:
             case (PullRequestEventType.COMMENT_APPLY | PullRequestEventType.COMMENT_DIFF | PullRequestEventType.MR_OPENED | PullRequestEventType.MR_MODIFIED):
                 logger.info("set status")
-                self._setCommitStatusRunning(project_id=event.repo.id, sha=event.mr.sha, ref_name=event.mr.ref_name, event_type=event.type)
+                self._side_effects.submit(self._sideEffectKey(event), self._setCommitStatusRunning,
+                    project_id=event.repo.id, sha=event.mr.sha, ref_name=event.mr.ref_name, event_type=event.type)
                 
                 ## React to new comments commands
                 if event.type in [PullRequestEventType.COMMENT_APPLY, PullRequestEventType.COMMENT_DIFF]:
                     logger.info("set emoji")
-                    self._setEmoji(project_id=event.repo.id, mr_iid=event.mr.id, comment_id=event.comment_id)
+                    self._side_effects.submit(None, self._setEmoji, project_id=event.repo.id, mr_iid=event.mr.id, comment_id=event.comment_id)
                 return
             
             case PullRequestEventType.COMMENT_SUGGESTION:
@@ -129,24 +186,70 @@ class GitlabVCS(IVersionControlSystem):
                 return
     
     def SetEventSuccess(self, event: PullRequestEvent):
-        self._setCommitStatusSucess(project_id=event.repo.id, sha=event.mr.sha, ref_name=event.mr.ref_name, event_type=event.type)
+        self._side_effects.submit(self._sideEffectKey(event), self._setCommitStatusSucess,
+            project_id=event.repo.id, sha=event.mr.sha, ref_name=event.mr.ref_name, event_type=event.type)
 
     def SetEventFailure(self, event: PullRequestEvent):
-        self._setCommitStatusFailure(project_id=event.repo.id, sha=event.mr.sha, ref_name=event.mr.ref_name, event_type=event.type)
+        self._side_effects.submit(self._sideEffectKey(event), self._setCommitStatusFailure,
+            project_id=event.repo.id, sha=event.mr.sha, ref_name=event.mr.ref_name, event_type=event.type)
 
-    def getChanges(self, event: PullRequestEvent) -> List[MergeRequestDiff]:
-        '''Return a list of MergeRequestDiff objects that represent the file changed. In particular the old path and new path of all modified files'''
-        ## TODO: Add page checking
-        endpoint = ENDPOINTS.get("projects").get("merge_requests").get("diffs").format(project_id=event.repo.id, mr_iid=event.mr.id)
-        resp = self.http_client.get(endpoint)
-        try:
-            diffs = MergeRequestDiff(many=True).load(resp.json())
-        except ValidationError as e:
-            logger.warning(f"Could not deserialize the Gitlab diffs in project {event.repo.id} mr {event.mr.id}. Returning None. Exception: {e}")
-            return None
-        
-        return diffs  
+    def SetEventCanceled(self, event: PullRequestEvent):
+        self._side_effects.submit(self._sideEffectKey(event), self._setCommitStatusCanceled,
+            project_id=event.repo.id, sha=event.mr.sha, ref_name=event.mr.ref_name, event_type=event.type)
+
+    def _loadDiffPage(self, resp: requests.Response) -> tuple[List[vcs_models.MergeRequestDiff], Optional[int]]:
+        '''Keep only the paths of a page of diffs so the diff bodies can be released straight away'''
+        page = resp.json()
+        if not isinstance(page, list):
+            raise ValueError(f"Expected a list of diffs but got: {page}")
+        paths = [vcs_models.MergeRequestDiff(old_path=diff['old_path'], new_path=diff['new_path']) for diff in page]
+        next_page = resp.headers.get('X-Next-Page')
+        return paths, int(next_page) if next_page else None
+
+    def getChanges(self, event: PullRequestEvent) -> Iterator[vcs_models.MergeRequestDiff]:
+        '''
+        Yield MergeRequestDiff objects that represent the files changed. In particular the old path and new path of all modified files.
+        Pages are fetched one at a time as the caller consumes them so memory use does not grow with the size of the merge request
+        '''
+        page = 1
+        while page:
+            endpoint = ENDPOINTS.get("projects").get("merge_requests").get("diffs_page").format(project_id=event.repo.id, mr_iid=event.mr.id, page=page, per_page=VCS_DIFFS_PER_PAGE)
+            try:
+                paths, page = self._cachedGet(("diffs", event.repo.id, event.mr.id, event.mr.sha, page), endpoint, self._loadDiffPage)
+            except (KeyError, ValueError) as e:
+                raise Exception(f"Could not deserialize the Gitlab diffs in project {event.repo.id} mr {event.mr.id}: {e}")
+            yield from paths
     
+    def getChangesBetween(self, event: PullRequestEvent, base_sha: str) -> Optional[List[vcs_models.MergeRequestDiff]]:
+        '''
+        Return the files changed between base_sha and the event sha by comparing them in the repo mirror.
+        Returns None when either commit is not in the mirror (e.g. base_sha was never fetched)
+        '''
+        mirror_path = self._get_mirror_path(event.repo.id)
+        if not system.dir_exists(mirror_path):
+            return None
+
+        with system.file_lock(f"{mirror_path}.lock", shared=True):
+            try:
+                output = git.Repo(mirror_path).git.diff('--name-status', '-M', '-z', base_sha, event.mr.sha)
+            except git.GitCommandError as e:
+                logger.info(f"Could not compare {base_sha} and {event.mr.sha} in mirror {mirror_path}: {e}")
+                return None
+
+        ## -z output is a flat list of status, path and, for renames and copies, a second path
+        fields = output.split('\0')
+        changes = []
+        index = 0
+        while index < len(fields) and fields[index]:
+            status = fields[index]
+            if status[0] in ('R', 'C'):
+                changes.append(vcs_models.MergeRequestDiff(old_path=fields[index + 1], new_path=fields[index + 2]))
+                index += 3
+            else:
+                changes.append(vcs_models.MergeRequestDiff(old_path=fields[index + 1], new_path=fields[index + 1]))
+                index += 2
+        return changes
+
     def _authenticate_url(self, url: str):
         '''Authenticate an http git clone url with the token'''
         return url.replace("https://", f"https://oauth2:{self.token}@")
@@ -155,35 +258,108 @@ class GitlabVCS(IVersionControlSystem):
         '''Return a path to the repo in the local environment that is unique to the repo and sha'''
         return system.join_paths(self.working_dir, f"{repo_id}-{sha}")
 
-    def cloneRepoAtSha(self, event: PullRequestEvent) -> str:
-        '''Clones a repo to the local working dir and returns the path to the repo'''
+    def getRepoPath(self, event: PullRequestEvent, sha: Optional[str] = None) -> str:
+        return self._get_local_repo_path(event.repo.id, sha or event.mr.sha)
+
+    def _get_mirror_path(self, repo_id: Repo) -> str:
+        '''Return the path to the persistent bare mirror of a repo'''
+        return system.join_paths(self.working_dir, f"{repo_id}.git")
+
+    def _shaRef(self, sha: str) -> str:
+        '''The mirror ref that keeps a fetched commit. Refs give later fetches local tips to negotiate from'''
+        return f"refs/sparrow/heads/{sha}"
+
+    def _ensureCommit(self, mirror: git.Repo, git_http_url: str, sha: str):
+        '''Fetch the commit into a ref of the mirror unless it is already there'''
+        try:
+            mirror.git.cat_file('-e', f"{sha}^{{commit}}")
+            logger.info(f"Commit {sha} already in mirror {mirror.git_dir}")
+            return
+        except git.GitCommandError:
+            pass
+
+        ## The refs of the mirror are advertised as haves so only objects the mirror does not have yet are transferred.
+        ## The token never ends up in the mirror's config
+        logger.info(f"Fetching commit {sha} into mirror {mirror.git_dir}...")
+        mirror.git.fetch('--no-tags', git_http_url, f"+{sha}:{self._shaRef(sha)}")
+
+    def forgetCheckout(self, path: str):
+        '''Drop the mirror ref of a checkout that was removed so the mirror does not keep every commit ever fetched'''
+        repo_id, _, sha = os.path.basename(path).rpartition('-')
+        mirror_path = self._get_mirror_path(repo_id)
+        if not repo_id or not system.dir_exists(mirror_path):
+            return
+
+        with system.file_lock(f"{mirror_path}.lock"):
+            mirror = git.Repo(mirror_path)
+            try:
+                mirror.git.update_ref('-d', self._shaRef(sha))
+                mirror.git.worktree('prune')
+            except git.GitCommandError as e:
+                logger.warning(f"Could not drop the ref of checkout {path} from mirror {mirror_path}: {e}")
+
+    def cloneRepoAtSha(self, event: PullRequestEvent, sha: Optional[str] = None) -> str:
+        '''
+        Check the repo out at sha (the event sha by default) and return the path to the checkout.
+        Each repo is fetched incrementally into a bare mirror and every sha is materialized as a git worktree of it
+        '''
 
         git_http_url = event.repo.http_clone_url
         git_http_url = self._authenticate_url(git_http_url)
 
-        local_repo_path = self._get_local_repo_path(event.repo.id, event.mr.sha)
+        local_repo_path = self.getRepoPath(event, sha)
 
         ## Check if there is a local repo-sha copy already
         if system.dir_exists(local_repo_path):
             logger.info(f"Local repo {local_repo_path} already exists. Skipping clone")
             return local_repo_path
 
+        mirror_path = self._get_mirror_path(event.repo.id)
+
+        ## Serialize work on the mirror across worker threads and processes
+        with system.file_lock(f"{mirror_path}.lock"):
+            if system.dir_exists(local_repo_path):
+                logger.info(f"Local repo {local_repo_path} was checked out while waiting. Skipping clone")
+                return local_repo_path
 
-        ## Clone repo into unique repo hash dir
-        logger.info("Cloning repo...")
+            if system.dir_exists(mirror_path):
+                mirror = git.Repo(mirror_path)
+            else:
+                logger.info(f"Creating mirror for repo {event.repo.id}...")
+                mirror = git.Repo.init(mirror_path, bare=True)
 
-        repo: git.Repo = git.Repo.clone_from(git_http_url, local_repo_path, depth=1)
+            commit_hash = sha or event.mr.sha
+            self._ensureCommit(mirror, git_http_url, commit_hash)
 
-        ## Checkout the commit hash
-        commit_hash = event.mr.sha
-        logger.info(f"Checking out commit hash {commit_hash}...")
-        repo.git.fetch('--depth', '1', 'origin', commit_hash)
-        repo.git.checkout(commit_hash)
+            ## Drop worktree records whose checkout directories have been removed
+            mirror.git.worktree('prune')
+
+            logger.info(f"Checking out commit hash {commit_hash} to {local_repo_path}...")
+            mirror.git.worktree('add', '--detach', local_repo_path, commit_hash)
 
         return local_repo_path
-        
-                
 
+    def getMergeBase(self, event: PullRequestEvent) -> Optional[str]:
+        '''
+        Return the merge base of the event sha and the target branch, or None if it cannot be found.
+        The target branch is fetched into a remote tracking ref of the mirror on every call since it moves independently
+        of the merge request. The ref doubles as a tip for later fetches to negotiate from
+        '''
+        if not event.mr.target_branch:
+            return None
 
+        git_http_url = self._authenticate_url(event.repo.http_clone_url)
+        mirror_path = self._get_mirror_path(event.repo.id)
+        target_ref = f"refs/remotes/origin/{event.mr.target_branch}"
+        with system.file_lock(f"{mirror_path}.lock"):
+            if not system.dir_exists(mirror_path):
+                return None
+            mirror = git.Repo(mirror_path)
 
-    
\ No newline at end of file
+            try:
+                self._ensureCommit(mirror, git_http_url, event.mr.sha)
+                mirror.git.fetch('--no-tags', git_http_url, f"+refs/heads/{event.mr.target_branch}:{target_ref}")
+                return mirror.git.merge_base(target_ref, event.mr.sha)
+            except git.GitCommandError as e:
+                logger.warning(f"Could not find the merge base of {event.mr.sha} and {event.mr.target_branch}: {e}")
+                return None
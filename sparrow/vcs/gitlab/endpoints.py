@@ -8,6 +8,7 @@ ENDPOINTS = {
             "base": "/projects/{project_id}/merge_requests",
             "filter_iid": "/projects/{project_id}/merge_requests/{mr_iid}",
             "diffs": "/projects/{project_id}/merge_requests/{mr_iid}/diffs",
+            "diffs_page": "/projects/{project_id}/merge_requests/{mr_iid}/diffs?page={page}&per_page={per_page}",
             "notes": {
                 "base": "/projects/{project_id}/merge_requests/{mr_iid}/notes", # supports POST and GET
                 "filter_id": "/projects/{project_id}/merge_requests/{mr_iid}/notes/{note_id}",
@@ -19,7 +20,8 @@ ENDPOINTS = {
             "update": "/projects/{project_id}/statuses/{sha}"
         },
         "pipelines": {
-            "latest": "/projects/{project_id}/pipelines/latest?ref={ref}"
+            "latest": "/projects/{project_id}/pipelines/latest?ref={ref}",
+            "filter_sha": "/projects/{project_id}/pipelines?ref={ref}&sha={sha}&per_page=1"
         }
     },
 }
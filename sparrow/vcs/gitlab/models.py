@@ -1,6 +1,13 @@
 from dataclasses import dataclass
+from typing import Any, Optional
 
 
 @dataclass
 class GitlabPipeline:
     id: int
+
+@dataclass
+class CachedResponse:
+    etag: Optional[str]
+    value: Any
+    fetched_at: float
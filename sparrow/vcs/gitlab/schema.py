@@ -35,6 +35,9 @@ class CommitStatusBodySchema(Schema):
 class PipelineSchema(Schema):
     id = fields.Int()
 
+    class Meta:
+        unknown = EXCLUDE
+
     @post_load
     def make_object(self, data, **kwargs) -> gitlab_models.GitlabPipeline:
         return gitlab_models.GitlabPipeline(**data)
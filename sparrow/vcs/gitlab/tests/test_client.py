@@ -0,0 +1,193 @@
+from sparrow.vcs.gitlab.client import GitlabConfig, GitlabVCS
+from sparrow.vcs.models import MergeRequestDiff
+from sparrow.receivers.events import PullRequestEvent, PullRequestEventType, MergeRequest, Repo
+from sparrow.cache.lru import LRUCache
+from unittest.mock import MagicMock
+import requests
+import json
+import git
+import os
+
+def make_response(status_code: int, body=None, headers: dict = {}) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers)
+    resp._content = json.dumps(body).encode() if body is not None else b''
+    return resp
+
+
+class TestGitlabVCS():
+
+    def _commit(self, repo: git.Repo, files: dict, message: str) -> str:
+        for path, content in files.items():
+            file = repo.working_tree_dir + '/' + path
+            if content is None:
+                repo.index.remove([path], working_tree=True)
+                continue
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            with open(file, 'w') as f:
+                f.write(content)
+            repo.index.add([path])
+        return repo.index.commit(message).hexsha
+
+    def test_getChangesBetween(self, tmp_path):
+        """
+        Test that the files changed between two commits are read from the repo mirror.
+        """
+        work = git.Repo.init(tmp_path / 'work')
+        base = self._commit(work, {'charts/a/values.yaml': 'a', 'charts/b/values.yaml': 'b'}, 'base')
+        head = self._commit(work, {'charts/a/values.yaml': 'changed', 'charts/b/values.yaml': None}, 'head')
+
+        git.Repo.clone_from(work.working_tree_dir, tmp_path / 'repos' / '1.git', bare=True)
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock(), working_dir=str(tmp_path / 'repos'))
+        event = PullRequestEvent(user=None, type=PullRequestEventType.MR_MODIFIED, repo=Repo(id=1, http_clone_url=''), mr=MergeRequest(id=2, sha=head, ref_name='feature'))
+
+        assert vcs.getChangesBetween(event, base) == [
+            MergeRequestDiff(old_path='charts/a/values.yaml', new_path='charts/a/values.yaml'),
+            MergeRequestDiff(old_path='charts/b/values.yaml', new_path='charts/b/values.yaml')
+        ]
+        assert vcs.getChangesBetween(event, '0' * 40) is None
+
+    def _objects(self, mirror_path) -> dict:
+        stats = git.Repo(mirror_path).git.count_objects('-v').splitlines()
+        return {key: int(value) for key, value in (line.split(': ') for line in stats if line.split(': ')[0] in ('count', 'packs'))}
+
+    def test_cloneRepoAtSha_fetches_incrementally(self, tmp_path):
+        """
+        Test that a later sha only transfers the objects the mirror does not have yet and is checked out as a worktree,
+        and that the ref of an evicted checkout is dropped.
+        """
+        work = git.Repo.init(tmp_path / 'work')
+        work.git.config('uploadpack.allowAnySHA1InWant', 'true')
+        first = self._commit(work, {f'charts/app/templates/{index}.yaml': f'{index}' for index in range(150)}, 'first')
+        second = self._commit(work, {'charts/app/templates/0.yaml': 'changed'}, 'second')
+
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock(), working_dir=str(tmp_path / 'repos'))
+        event = lambda sha: PullRequestEvent(user=None, type=PullRequestEventType.MR_MODIFIED, repo=Repo(id=1, http_clone_url=work.working_tree_dir), mr=MergeRequest(id=2, sha=sha, ref_name='feature'))
+        mirror_path = tmp_path / 'repos' / '1.git'
+
+        vcs.cloneRepoAtSha(event(first))
+        assert self._objects(mirror_path) == {'count': 0, 'packs': 1}
+
+        ## Only the new commit, its trees and the changed file (fewer than fetch.unpackLimit objects) arrive, loose
+        checkout = vcs.cloneRepoAtSha(event(second))
+        assert self._objects(mirror_path) == {'count': 6, 'packs': 1}
+        assert open(f"{checkout}/charts/app/templates/0.yaml").read() == 'changed'
+
+        vcs.forgetCheckout(str(tmp_path / 'repos' / f'1-{first}'))
+        assert git.Repo(mirror_path).git.for_each_ref('refs/sparrow').split() == [second, 'commit', f'refs/sparrow/heads/{second}']
+
+    def test_getMergeBase_tracks_the_target_branch(self, tmp_path):
+        """
+        Test that the target branch is fetched into a remote tracking ref and the merge base can be checked out.
+        """
+        work = git.Repo.init(tmp_path / 'work', initial_branch='main')
+        base = self._commit(work, {'charts/app/values.yaml': 'base'}, 'base')
+        work.git.checkout('-b', 'feature')
+        head = self._commit(work, {'charts/app/values.yaml': 'head'}, 'head')
+        work.git.checkout('main')
+        self._commit(work, {'charts/other/values.yaml': 'other'}, 'main moved on')
+
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock(), working_dir=str(tmp_path / 'repos'))
+        event = PullRequestEvent(user=None, type=PullRequestEventType.MR_MODIFIED, repo=Repo(id=1, http_clone_url=work.working_tree_dir), mr=MergeRequest(id=2, sha=head, ref_name='feature', target_branch='main'))
+        vcs.cloneRepoAtSha(event)
+
+        assert vcs.getMergeBase(event) == base
+        assert git.Repo(tmp_path / 'repos' / '1.git').git.rev_parse('refs/remotes/origin/main') == work.head.commit.hexsha
+        checkout = vcs.cloneRepoAtSha(event, base)
+        assert checkout == vcs.getRepoPath(event, base)
+        assert open(f"{checkout}/charts/app/values.yaml").read() == 'base'
+
+    def test_cachedGet_revalidates_with_etag(self, monkeypatch):
+        """
+        Test that a fresh entry is served without a request and a stale one is revalidated, reusing the cached body on a 304.
+        """
+        now = [1000.0]
+        monkeypatch.setattr('sparrow.vcs.gitlab.client.time.time', lambda: now[0])
+        monkeypatch.setattr('sparrow.vcs.gitlab.client.VCS_CACHE_MAX_AGE', 30)
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock())
+        vcs.http_client.get.side_effect = [
+            make_response(200, [{'id': 1}], {'ETag': 'W/"v1"'}),
+            make_response(304),
+            make_response(200, [{'id': 2}], {'ETag': 'W/"v2"'})
+        ]
+        load = MagicMock(side_effect=lambda resp: resp.json())
+
+        assert vcs._cachedGet(('pipeline', 1), '/pipelines', load) == [{'id': 1}]
+        now[0] += 29
+        assert vcs._cachedGet(('pipeline', 1), '/pipelines', load) == [{'id': 1}]
+        assert vcs.http_client.get.call_count == 1
+
+        now[0] += 1
+        assert vcs._cachedGet(('pipeline', 1), '/pipelines', load) == [{'id': 1}]
+        assert vcs.http_client.get.call_args.kwargs['headers'] == {'If-None-Match': 'W/"v1"'}
+        assert load.call_count == 1
+
+        ## The 304 made the entry fresh again
+        now[0] += 29
+        assert vcs._cachedGet(('pipeline', 1), '/pipelines', load) == [{'id': 1}]
+        assert vcs.http_client.get.call_count == 2
+
+        now[0] += 1
+        assert vcs._cachedGet(('pipeline', 1), '/pipelines', load) == [{'id': 2}]
+        assert vcs.http_client.get.call_args.kwargs['headers'] == {'If-None-Match': 'W/"v1"'}
+
+    def test_cachedGet_evicts_least_recently_used(self):
+        """
+        Test that the response cache drops the least recently used entry once it is full and fetches it again unconditionally.
+        """
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock())
+        vcs._cache = LRUCache(max_size=2)
+        vcs.http_client.get.side_effect = lambda endpoint, headers: make_response(200, endpoint, {'ETag': endpoint})
+        load = lambda resp: resp.json()
+
+        vcs._cachedGet('a', '/a', load)
+        vcs._cachedGet('b', '/b', load)
+        vcs._cachedGet('a', '/a', load)
+        vcs._cachedGet('c', '/c', load)
+        assert vcs.http_client.get.call_count == 3
+
+        assert vcs._cachedGet('a', '/a', load) == '/a'
+        assert vcs.http_client.get.call_count == 3
+        assert vcs._cachedGet('b', '/b', load) == '/b'
+        assert vcs.http_client.get.call_count == 4
+        assert vcs.http_client.get.call_args.kwargs['headers'] == {}
+
+    def _diffs(self, *paths) -> list:
+        return [{'old_path': path, 'new_path': path, 'diff': '@@ -1 +1 @@'} for path in paths]
+
+    def test_getChanges_follows_pages(self, monkeypatch):
+        """
+        Test that pages are fetched lazily while X-Next-Page names a next page, ending on an empty last page.
+        """
+        monkeypatch.setattr('sparrow.vcs.gitlab.client.VCS_DIFFS_PER_PAGE', 2)
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock())
+        vcs.http_client.get.side_effect = [
+            make_response(200, self._diffs('a', 'b'), {'X-Next-Page': '2'}),
+            make_response(200, self._diffs('c', 'd'), {'X-Next-Page': '3'}),
+            make_response(200, [], {'X-Next-Page': ''})
+        ]
+        event = PullRequestEvent(user=None, type=PullRequestEventType.MR_MODIFIED, repo=Repo(id=1, http_clone_url=''), mr=MergeRequest(id=2, sha='abc', ref_name='feature'))
+
+        changes = vcs.getChanges(event)
+        assert next(changes) == MergeRequestDiff(old_path='a', new_path='a')
+        assert vcs.http_client.get.call_count == 1
+
+        assert [change.new_path for change in changes] == ['b', 'c', 'd']
+        assert [call.args[0] for call in vcs.http_client.get.call_args_list] == [
+            f'/projects/1/merge_requests/2/diffs?page={page}&per_page=2' for page in (1, 2, 3)
+        ]
+
+    def test_getChanges_stops_without_next_page_header(self):
+        """
+        Test that a page without an X-Next-Page header is the last one.
+        """
+        vcs = GitlabVCS(GitlabConfig(token='token'), http_client=MagicMock())
+        vcs.http_client.get.side_effect = [
+            make_response(200, self._diffs('a'), {'X-Next-Page': '2'}),
+            make_response(200, self._diffs('b'))
+        ]
+        event = PullRequestEvent(user=None, type=PullRequestEventType.MR_MODIFIED, repo=Repo(id=1, http_clone_url=''), mr=MergeRequest(id=2, sha='abc', ref_name='feature'))
+
+        assert [change.new_path for change in vcs.getChanges(event)] == ['a', 'b']
+        assert vcs.http_client.get.call_count == 2
@@ -1,6 +1,6 @@
 from abc import abstractmethod
 from sparrow.vcs.models import MergeRequestDiff
-from typing import List
+from typing import Iterable, List, Optional
 from sparrow.receivers.events import PullRequestEvent
 
 class IVersionControlSystem:
@@ -11,20 +11,40 @@ class IVersionControlSystem:
         ...
 
     @abstractmethod
-    def getChanges(self, event: PullRequestEvent) -> List[MergeRequestDiff]:
-        '''Return a list of MergeRequestDiff objects which represent the old new paths of changed files'''
+    def getChanges(self, event: PullRequestEvent) -> Iterable[MergeRequestDiff]:
+        '''Return an iterable of MergeRequestDiff objects which represent the old new paths of changed files'''
         ...
 
     @abstractmethod
-    def cloneRepoAtSha(self, event: PullRequestEvent) -> str:
+    def getChangesBetween(self, event: PullRequestEvent, base_sha: str) -> Optional[List[MergeRequestDiff]]:
+        '''Return the files changed between base_sha and the event sha, or None if they cannot be compared locally'''
+        ...
+
+    @abstractmethod
+    def getRepoPath(self, event: PullRequestEvent, sha: Optional[str] = None) -> str:
+        '''Return the local path the repo is (or will be) checked out to at sha (the event sha by default) without cloning it'''
+        ...
+
+    @abstractmethod
+    def cloneRepoAtSha(self, event: PullRequestEvent, sha: Optional[str] = None) -> str:
         '''
-        Clone the repo for which this event is taking place at the sha. 
+        Clone the repo for which this event is taking place at sha (the event sha by default). 
         Return the path to the locally cloned repo
         '''
         ...
 
+    @abstractmethod
+    def getMergeBase(self, event: PullRequestEvent) -> Optional[str]:
+        '''Return the sha of the merge base of the event sha and the target branch of the merge request, or None if it cannot be found'''
+        ...
+
+    @abstractmethod
+    def forgetCheckout(self, path: str):
+        '''Release what the VCS keeps for a checkout (e.g. refs in a repo mirror) once the checkout at path was removed'''
+        ...
+
     @abstractmethod 
-    def postComment(self, event: PullRequestEvent, comment: str):
+    def postComment(self, event: PullRequestEvent, comment: str) -> Optional[int]:
             """
             Posts a comment on a pull request event.
 
@@ -33,11 +53,16 @@ class IVersionControlSystem:
                 comment (str): The comment to be posted.
 
             Returns:
-                None
+                The id of the new comment, or None if it could not be created
             """
             
             ...
 
+    @abstractmethod
+    def updateComment(self, event: PullRequestEvent, note_id: int, comment: str) -> bool:
+        '''Replace the body of a comment posted with postComment. Return whether it was updated'''
+        ...
+
     @abstractmethod
     def postDiffComment(self, diffs):
         ...
\ No newline at end of file
@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+import threading
+import fcntl
+import time
+import os
+
+from sparrow.machine import system
+from sparrow.logger import logger
+
+
+class WorkspaceManager:
+    '''
+        Keeps the checkouts under the clone dir within a byte and count budget by evicting the least recently used ones.
+
+        Every job holds a shared flock on the lease file of the checkout it works in, and the lease file's mtime records
+        the last access. Eviction takes the lease exclusively without blocking, so a checkout used by an in-flight job in
+        any worker process is never removed. Bare mirrors (`*.git`) are caches rather than checkouts and are not managed.
+    '''
+    LEASE_DIR = '.leases'
+
+    def __init__(self, root: str, max_bytes: int, max_checkouts: int, sweep_dirs: Optional[List[str]] = None, sweep_age: int = 3600,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_checkouts = max_checkouts
+        self.sweep_dirs = list(sweep_dirs or [])
+        self.sweep_age = sweep_age
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._sizes: Dict[str, int] = {}
+
+    def _leaseDir(self) -> str:
+        return system.join_paths(self.root, WorkspaceManager.LEASE_DIR)
+
+    def _leasePath(self, name: str) -> str:
+        return system.join_paths(self._leaseDir(), f"{name}.lock")
+
+    def _ownerPath(self, name: str) -> str:
+        return system.join_paths(self._leaseDir(), f"{name}.owners")
+
+    def _openLease(self, name: str, operation: int) -> Optional[int]:
+        '''
+        Open and flock the lease file for a checkout. Returns None if a non-blocking lock could not be taken.
+        Retries when the lease file was replaced while waiting so the lock is always held on the current file
+        '''
+        path = self._leasePath(name)
+        system.create_dir(self._leaseDir())
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, operation)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            try:
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    def _addOwner(self, name: str, owner: str):
+        owner_path = self._ownerPath(name)
+        owners = self._readOwners(name)
+        if owner not in owners:
+            with open(owner_path, 'a') as file:
+                file.write(f"{owner}\n")
+
+    def _readOwners(self, name: str) -> List[str]:
+        owner_path = self._ownerPath(name)
+        if not system.file_exists(owner_path):
+            return []
+        with open(owner_path, 'r') as file:
+            return file.read().split()
+
+    def _directorySize(self, path: str) -> int:
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, filename)).st_size
+                except FileNotFoundError:
+                    continue
+        return total
+
+    def _checkouts(self) -> List[str]:
+        '''Return the names of every checkout under the root'''
+        if not system.dir_exists(self.root):
+            return []
+        return [
+            name for name in os.listdir(self.root)
+            if not name.startswith('.') and not name.endswith('.git') and system.dir_exists(system.join_paths(self.root, name))
+        ]
+
+    def _lastAccess(self, name: str) -> float:
+        try:
+            return os.stat(self._leasePath(name)).st_mtime
+        except FileNotFoundError:
+            return os.stat(system.join_paths(self.root, name)).st_mtime
+
+    def _size(self, name: str) -> int:
+        with self._lock:
+            if name not in self._sizes:
+                self._sizes[name] = self._directorySize(system.join_paths(self.root, name))
+            return self._sizes[name]
+
+    def _evict(self, name: str) -> bool:
+        '''Remove a checkout unless a job is using it. Returns whether the checkout was removed'''
+        fd = self._openLease(name, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if fd is None:
+            logger.debug(f"Checkout {name} is in use. Not evicting")
+            return False
+        try:
+            checkout_path = system.join_paths(self.root, name)
+            if system.dir_exists(checkout_path):
+                logger.info(f"Evicting checkout {checkout_path}")
+                system.remove_dir(checkout_path)
+                if self.on_evict:
+                    self.on_evict(checkout_path)
+            for path in (self._ownerPath(name), self._leasePath(name)):
+                if system.file_exists(path):
+                    system.remove_file(path)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._sizes.pop(name, None)
+        return True
+
+    @contextmanager
+    def lease(self, path: str, owner: str = None):
+        '''Mark the checkout at path as in use for the duration of the context'''
+        name = os.path.basename(path)
+        fd = self._openLease(name, fcntl.LOCK_SH)
+        try:
+            os.utime(self._leasePath(name))
+            if owner:
+                self._addOwner(name, owner)
+            yield path
+        finally:
+            os.close(fd)
+
+        ## The job may have grown the checkout (e.g. chart dependencies) so measure it again
+        with self._lock:
+            self._sizes.pop(name, None)
+        self.enforceBudget()
+
+    def enforceBudget(self):
+        '''Evict least recently used checkouts until the workspace is within budget'''
+        self._sweep()
+
+        checkouts = sorted(self._checkouts(), key=self._lastAccess)
+        count = len(checkouts)
+        total = sum(self._size(name) for name in checkouts)
+
+        for name in checkouts:
+            if count <= self.max_checkouts and total <= self.max_bytes:
+                break
+            size = self._size(name)
+            if self._evict(name):
+                count -= 1
+                total -= size
+
+        if count > self.max_checkouts or total > self.max_bytes:
+            logger.warning(f"Workspace is over budget with {count} checkouts and {total} bytes but the rest are in use")
+
+    def purge(self, owner: str):
+        '''Remove every checkout that belongs to owner (e.g. a closed merge request) and is not in use'''
+        for name in self._checkouts():
+            if owner in self._readOwners(name):
+                self._evict(name)
+
+    def _removeUnlessInUse(self, path: str):
+        '''Remove a file unless its user holds a flock on it (e.g. the kubeconfig of a long running apply)'''
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.debug(f"Workspace file {path} is in use. Not removing")
+                return
+            logger.info(f"Removing stale workspace file {path}")
+            system.remove_file(path)
+        finally:
+            os.close(fd)
+
+    def _sweep(self):
+        '''Remove files left behind in scratch dirs (e.g. kubeconfigs of a crashed process)'''
+        cutoff = time.time() - self.sweep_age
+        for directory in self.sweep_dirs:
+            for dirpath, dirnames, filenames in os.walk(directory):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        if os.stat(path).st_mtime < cutoff:
+                            self._removeUnlessInUse(path)
+                    except FileNotFoundError:
+                        continue
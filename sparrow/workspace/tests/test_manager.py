@@ -0,0 +1,77 @@
+from sparrow.workspace.manager import WorkspaceManager
+import fcntl
+import pytest
+import os
+
+class TestWorkspaceManager():
+
+    @pytest.fixture
+    def root(self, tmp_path):
+        for index, name in enumerate(['1-aaa', '1-bbb', '1-ccc']):
+            os.makedirs(tmp_path / name)
+            (tmp_path / name / 'Chart.yaml').write_text('x' * 100)
+            os.utime(tmp_path / name, (index, index))
+        os.makedirs(tmp_path / '1.git')
+        return tmp_path
+
+    def test_enforceBudget_evicts_least_recently_used(self, root):
+        """
+        Test that checkouts are evicted oldest first until the count budget is met and mirrors are left alone.
+        """
+        workspace = WorkspaceManager(root=str(root), max_bytes=10 ** 9, max_checkouts=2)
+        workspace.enforceBudget()
+
+        assert sorted(os.listdir(root)) == ['.leases', '1-bbb', '1-ccc', '1.git']
+
+    def test_enforceBudget_skips_leased_checkouts(self, root):
+        """
+        Test that a checkout leased by an in-flight job is never evicted, even when it is the oldest.
+        """
+        workspace = WorkspaceManager(root=str(root), max_bytes=150, max_checkouts=10)
+        with workspace.lease(str(root / '1-aaa')):
+            os.utime(workspace._leasePath('1-aaa'), (0, 0))
+            workspace.enforceBudget()
+            assert (root / '1-aaa').exists()
+
+        assert (root / '1-aaa').exists()
+        assert not (root / '1-bbb').exists()
+        assert not (root / '1-ccc').exists()
+
+    def test_purge_removes_owned_checkouts(self, root):
+        """
+        Test that purging an owner removes only the checkouts leased on its behalf.
+        """
+        workspace = WorkspaceManager(root=str(root), max_bytes=10 ** 9, max_checkouts=10)
+        with workspace.lease(str(root / '1-aaa'), owner='1!5'):
+            pass
+        with workspace.lease(str(root / '1-bbb'), owner='1!6'):
+            pass
+
+        workspace.purge('1!5')
+
+        assert not (root / '1-aaa').exists()
+        assert (root / '1-bbb').exists()
+
+    def test_enforceBudget_reports_evicted_checkouts(self, root):
+        evicted = []
+        workspace = WorkspaceManager(root=str(root), max_bytes=10 ** 9, max_checkouts=1, on_evict=evicted.append)
+        workspace.enforceBudget()
+
+        assert evicted == [str(root / '1-aaa'), str(root / '1-bbb')]
+
+    def test_sweep_skips_files_in_use(self, root, tmp_path_factory):
+        """
+        Test that stale scratch files are swept unless a job still holds a flock on them.
+        """
+        scratch = tmp_path_factory.mktemp('kubeconfigs')
+        for name in ('in-use.yaml', 'stale.yaml', 'new.yaml'):
+            (scratch / name).write_text('kubeconfig')
+        for name in ('in-use.yaml', 'stale.yaml'):
+            os.utime(scratch / name, (0, 0))
+
+        workspace = WorkspaceManager(root=str(root), max_bytes=10 ** 9, max_checkouts=10, sweep_dirs=[str(scratch)])
+        with open(scratch / 'in-use.yaml') as file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_SH)
+            workspace.enforceBudget()
+
+        assert sorted(os.listdir(scratch)) == ['in-use.yaml', 'new.yaml']